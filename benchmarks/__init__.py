@@ -0,0 +1,4 @@
+"""
+Performance benchmarks. Run a suite as a module from the project root,
+e.g. ``python3 -m benchmarks.units_bench``.
+"""
@@ -0,0 +1,233 @@
+"""
+.. module:: benchmarks.units_bench
+   :platform: Unix, Windows
+   :synopsis: Measures the cost of phys_util.units arithmetic, the
+              QuantityArray path, parse_dimensions and Params setup.
+
+Every case reports operations per second and peak traced memory.
+Results are written as JSON so that two versions can be compared:
+
+    python3 -m benchmarks.units_bench --output new.json
+    python3 -m benchmarks.units_bench --compare old.json new.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import phys_util.units as u
+import fdtd.define_general_parameters as dgp
+
+ARRAY_SIZES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+""" Element counts for the Unit * ndarray cases """
+
+MIN_SECONDS = 0.2
+""" Each case repeats until it has run for at least this long """
+
+
+def measure(name, func, number=1, min_seconds=MIN_SECONDS):
+    """
+    Time func and record its peak memory use.
+
+    func is first called once under tracemalloc to find the peak memory
+    of a single call, then repeatedly (untraced) until min_seconds have
+    passed.
+
+    :param name:   Name of the benchmark case
+    :param func:   Callable that does the work being measured
+    :param number: How many operations one call of func performs
+    :return: A dict with the case's name, ops/sec and peak bytes
+    """
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_seconds:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start
+    return {'name': name,
+            'ops_per_sec': calls * number / elapsed,
+            'seconds_per_call': elapsed / calls,
+            'peak_bytes': peak}
+
+
+def scalar_cases():
+    """ Scalar Unit multiply, divide, power and dimension algebra """
+    length = 3 * u.meter
+    duration = 2 * u.second
+    reps = 1000
+
+    def mul():
+        """ Unit * Unit """
+        for _ in range(reps):
+            length * duration  # pylint: disable=pointless-statement
+
+    def div():
+        """ Unit / Unit """
+        for _ in range(reps):
+            length / duration  # pylint: disable=pointless-statement
+
+    def power():
+        """ Unit ** int """
+        for _ in range(reps):
+            length ** 3  # pylint: disable=pointless-statement
+
+    def dimension_mul():
+        """ Dimension * Dimension (the old _merge_categories) """
+        dim_a = u.farad.dimension
+        dim_b = u.henry.dimension
+        for _ in range(reps):
+            dim_a * dim_b  # pylint: disable=pointless-statement
+
+    results = [measure('scalar_mul', mul, reps),
+               measure('scalar_div', div, reps),
+               measure('scalar_pow', power, reps)]
+    # Production mode units are floats, with no Dimension to multiply
+    if not u.PRODUCTION_MODE:
+        results.append(measure('dimension_mul', dimension_mul, reps))
+    return results
+
+
+def array_cases(sizes):
+    """ Unit * ndarray and arithmetic on the result """
+    results = []
+    for size in sizes:
+        arr = np.ones(size)
+        results.append(measure('unit_times_array_{0}'.format(size),
+                               lambda arr=arr: u.farad * arr, size))
+        quantity = u.farad * arr
+        results.append(measure('array_divide_unit_{0}'.format(size),
+                               lambda q=quantity: q / u.farad, size))
+    return results
+
+
+def parse_cases():
+    """ parse_dimensions on new and on repeated strings """
+    texts = ['{0} um'.format(i) for i in range(1000)]
+
+    def parse_new():
+        """ Each string parsed for the first time """
+        # pylint: disable=protected-access
+        u._parse_dimensions_cached.cache_clear()
+        for text in texts:
+            u.parse_dimensions(text)
+
+    def parse_cached():
+        """ Each string already in the cache """
+        for text in texts:
+            u.parse_dimensions(text)
+
+    return [measure('parse_dimensions', parse_new, len(texts)),
+            measure('parse_dimensions_cached', parse_cached, len(texts))]
+
+
+def params_cases(grid_points):
+    """
+    Building Params and reading its eps and mu arrays, which are
+    gathered from the material map with units on first use
+    """
+
+    def build(answers):
+        """ A new Params with its eps and mu arrays built """
+        params = dgp.Params(answers)
+        return (params.ep_v, params.mu_v)
+
+    results = []
+    for max_gp in grid_points:
+        answers = {'max_gp': max_gp, 'eps': 2.25, 'mu': 1,
+                   'x_dim': 5e-6 * u.meter, 'y_dim': 5e-6 * u.meter,
+                   'timestep': 1000, 'layers': 10, 'axis': 0}
+        results.append(measure('params_{0}'.format(max_gp),
+                               lambda a=answers: build(a),
+                               max_gp * max_gp))
+    return results
+
+
+def version_info():
+    """ Describe the code and environment the benchmark ran on """
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'production_mode': u.PRODUCTION_MODE,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def run(max_size=ARRAY_SIZES[-1]):
+    """
+    Run every benchmark case.
+
+    :param max_size: Largest array size to try
+    :return: A dict with version info and the list of results
+    """
+    sizes = [size for size in ARRAY_SIZES if size <= max_size]
+    grid_points = [gp for gp in [100, 300, 1000] if gp * gp <= max_size]
+    results = (scalar_cases() + array_cases(sizes) + parse_cases() +
+               params_cases(grid_points))
+    return {'version': version_info(), 'results': results}
+
+
+def compare(old, new):
+    """
+    Print the speed ratio and memory ratio of each case in two result
+    files.
+
+    :param old: Results dict from the baseline run
+    :param new: Results dict from the run being checked
+    """
+    old_cases = {case['name']: case for case in old['results']}
+    print('{0:32} {1:>10} {2:>10}'.format('case', 'speedup', 'memory'))
+    for case in new['results']:
+        before = old_cases.get(case['name'])
+        if before is None:
+            continue
+        speedup = case['ops_per_sec'] / before['ops_per_sec']
+        memory = (case['peak_bytes'] / before['peak_bytes']
+                  if before['peak_bytes'] else float('nan'))
+        print('{0:32} {1:>9.2f}x {2:>9.2f}x'.format(case['name'], speedup,
+                                                    memory))
+
+
+def main(argv=None):
+    """ Command line entry point """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--max-size', type=int, default=ARRAY_SIZES[-1],
+                        help='largest array size to benchmark')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two JSON result files and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as old_file, \
+                open(args.compare[1]) as new_file:
+            compare(json.load(old_file), json.load(new_file))
+        return 0
+
+    report = run(args.max_size)
+    for case in report['results']:
+        print('{0:32} {1:>14.4g} ops/s {2:>12} bytes'.format(
+            case['name'], case['ops_per_sec'], case['peak_bytes']))
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+.. module:: fdtd.checkpoint
+   :platform: Unix, Windows
+   :synopsis: Saves the state of a run to disk as it goes and restarts
+              runs from the latest complete checkpoint.
+"""
+import os
+import queue
+import re
+import threading
+import time
+import zipfile
+
+import numpy as np
+
+STEP_KEY = '__step__'
+""" The entry of a checkpoint file holding the step counter """
+
+FILE_PATTERN = re.compile(r'^checkpoint-(\d+)\.npz$')
+
+
+def checkpoint_path(directory, step):
+    """
+    :return: Where the checkpoint for a step is kept
+    """
+    return os.path.join(directory, 'checkpoint-{:010d}.npz'.format(step))
+
+
+def list_checkpoints(directory):
+    """
+    :return: The complete checkpoints in directory, as (step, path),
+             newest first
+    """
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        match = FILE_PATTERN.match(name)
+        if match:
+            found.append((int(match.group(1)),
+                          os.path.join(directory, name)))
+    return sorted(found, reverse=True)
+
+
+def write_checkpoint(path, arrays, step):
+    """
+    Write arrays and the step counter to path atomically: the data goes
+    to a temporary file, is synced, and only then renamed into place,
+    so a crash leaves either the old file or the new one.
+
+    :param path:   The file to write
+    :param arrays: The state arrays by name
+    :param step:   The step counter
+    """
+    staging = path + '.tmp'
+    contents = dict(arrays)
+    contents[STEP_KEY] = np.array(step)
+    with open(staging, 'wb') as out:
+        np.savez(out, **contents)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(staging, path)
+
+
+def restore_latest(solver, directory):
+    """
+    Load the newest checkpoint that is complete and fits the solver,
+    copying it into the solver's state arrays in place.
+
+    :param solver:    The solver to restore, set up as for the original
+                      run, with the same layers and monitors attached
+    :type  solver:    fdtd.solver.YeeSolver2D
+    :param directory: Where the checkpoints were written
+    :return: The step restored to, or None if there was no usable
+             checkpoint
+    """
+    for (_, path) in list_checkpoints(directory):
+        try:
+            with np.load(path) as saved:
+                names = set(saved.files) - {STEP_KEY}
+                if names != set(solver.state):
+                    continue
+                loaded = {name: saved[name] for name in names}
+                step = int(saved[STEP_KEY])
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            continue
+        if any(loaded[name].shape != solver.state[name].shape
+               for name in names):
+            continue
+        for name in names:
+            solver.state[name][...] = loaded[name]
+        solver.n = step
+        return step
+    return None
+
+
+class Checkpointer:
+    """
+    Periodically saves the state registered on a solver.
+
+    Once interval seconds have passed, the post_step hook copies the
+    state into a buffer kept between checkpoints and hands it to a
+    background thread, which writes the file while the solver carries
+    on. The copy is the only cost in the time loop; if the writer is
+    still busy when the next checkpoint is due, that one is skipped
+    rather than stalling the run.
+    """
+
+    def __init__(self, solver, directory, interval=600.0, keep=2):
+        """
+        :param solver:    The solver whose state to save
+        :type  solver:    fdtd.solver.YeeSolver2D
+        :param directory: Where to write the checkpoints
+        :param interval:  Seconds between checkpoints
+        :param keep:      How many of the newest checkpoints to keep
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.solver = solver
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.written = 0
+        self.skipped = 0
+        self.error = None
+        self._buffer = {}
+        self._last = time.monotonic()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._write_loop,
+                                        name='fdtd-checkpoint', daemon=True)
+        self._thread.start()
+        solver.add_hook('post_step', self.hook)
+
+    def hook(self, solver):
+        """
+        Start a checkpoint if one is due; a post_step hook
+        """
+        if time.monotonic() - self._last < self.interval:
+            return
+        self._last = time.monotonic()
+        if not self._idle.is_set():
+            self.skipped += 1
+            return
+        self._start(solver.n)
+
+    def _start(self, step):
+        """ Copy the state and queue it for writing """
+        self._idle.clear()
+        for (name, array) in self.solver.state.items():
+            if name not in self._buffer:
+                self._buffer[name] = np.empty_like(array)
+            np.copyto(self._buffer[name], array)
+        self._queue.put(step)
+
+    def _write_loop(self):
+        """ The writer thread """
+        while True:
+            step = self._queue.get()
+            if step is None:
+                break
+            try:
+                write_checkpoint(checkpoint_path(self.directory, step),
+                                 self._buffer, step)
+                self.written += 1
+                for (_, path) in list_checkpoints(self.directory)[self.keep:]:
+                    os.remove(path)
+            except Exception as error:  # pylint: disable=broad-except
+                # Keep the thread alive, so save() and close() return
+                self.error = error
+            finally:
+                self._idle.set()
+
+    def save(self):
+        """
+        Write a checkpoint of the current state now and wait for it
+        """
+        self._idle.wait()
+        self._start(self.solver.n)
+        self._idle.wait()
+
+    def close(self):
+        """
+        Wait for any checkpoint being written and stop the writer
+        """
+        self._idle.wait()
+        self._queue.put(None)
+        self._thread.join()
+
+
+class MemmapAllocator:
+    """
+    A solver allocator that keeps every array in a .npy file memory
+    mapped from a directory, for grids larger than RAM or to have the
+    state on disk throughout a run. The files are only consistent
+    between steps; :meth:`flush` them, or use a :class:`Checkpointer`,
+    for something to restart from.
+    """
+
+    def __init__(self, directory, reuse=False):
+        """
+        :param directory: Where to keep the files
+        :param reuse:     Open existing files of the right shape and type
+                          instead of zeroing them
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.reuse = reuse
+        self.arrays = {}
+
+    def __call__(self, name, shape, dtype):
+        """
+        :param name:  The name of the array, e.g. 'ez'
+        :param shape: The shape of the array
+        :param dtype: The data type of the array
+        :return: A memory mapped array
+        """
+        path = os.path.join(self.directory, name + '.npy')
+        array = None
+        if self.reuse and os.path.exists(path):
+            array = np.lib.format.open_memmap(path, mode='r+')
+            if array.shape != tuple(shape) or array.dtype != dtype:
+                del array
+                array = None
+        if array is None:
+            array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                              shape=tuple(shape))
+        self.arrays[name] = array
+        return array
+
+    def flush(self):
+        """
+        Write every array's changes to its file
+        """
+        for array in self.arrays.values():
+            array.flush()
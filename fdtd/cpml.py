@@ -0,0 +1,197 @@
+"""
+.. module:: fdtd.cpml
+   :platform: Unix, Windows
+   :synopsis: Convolutional perfectly matched layers whose auxiliary
+              fields live only in the pmlwidth-thick edge strips.
+"""
+import numpy as np
+
+import phys_util.constants as c
+import phys_util.units as u
+
+EPS0 = c.epsilon0 / (u.farad / u.meter)
+ETA0 = np.sqrt((c.mu0 / (u.henry / u.meter)) / EPS0)
+
+# (field, derivative axis, stage, differenced field, sign, coefficient)
+# for every curl term that needs a convolution. Rows are y (axis 0) and
+# columns x (axis 1). H terms use forward differences at half cells, E
+# terms backward differences at whole cells, as in fdtd.solver.
+TERMS = {'TM': [('hx', 0, 'post_h', 'ez', -1, 'ch_y'),
+                ('hy', 1, 'post_h', 'ez', 1, 'ch_x'),
+                ('ez', 1, 'post_e', 'hy', 1, 'ce_x'),
+                ('ez', 0, 'post_e', 'hx', -1, 'ce_y')],
+         'TE': [('hz', 0, 'post_h', 'ex', 1, 'ch_y'),
+                ('hz', 1, 'post_h', 'ey', -1, 'ch_x'),
+                ('ex', 0, 'post_e', 'hz', 1, 'ce_y'),
+                ('ey', 1, 'post_e', 'hz', -1, 'ce_x')]}
+
+# The cells each field's update covers along (derivative axis, other
+# axis), as (first, last - size) pairs in fdtd.solver
+SPANS = {'TM': {'hx': ((0, -1), (0, 0)), 'hy': ((0, -1), (0, 0)),
+                'ez': ((1, -1), (1, -1))},
+         'TE': {'hz': ((0, -1), (0, -1)), 'ex': ((1, -1), (0, -1)),
+                'ey': ((1, -1), (1, -1))}}
+
+
+def depth(size, width, beg, end, half):
+    """
+    How far into the absorbing layer the cells [beg, end) of an axis
+    are, from 0 at the inner edge to 1 at the wall.
+
+    :param size:  The number of cells along the axis
+    :param width: The thickness of the layer, in cells
+    :param beg:   First cell
+    :param end:   One past the last cell
+    :param half:  Whether the field sits half a cell past its index
+    :rtype: np.ndarray
+    """
+    position = np.arange(beg, end) + (0.5 if half else 0.0)
+    inside = np.maximum(width - position, position - (size - 1 - width))
+    return np.clip(inside / width, 0, 1)
+
+
+class _Strip:
+    """
+    The auxiliary field of one curl term along one edge of the grid
+    """
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+
+    def __init__(self, solver, term, cells, other, coefs):
+        """
+        :param solver: The solver the layers belong to
+        :param term:   The entry of TERMS this strip implements
+        :param cells:  (beg, end) of the strip along the derivative axis
+        :param other:  (beg, end) of the update along the other axis
+        :param coefs:  (b, a) convolution coefficients of the cells
+        """
+        (name, axis, _, source, sign, coef) = term
+        half = name.startswith('h')
+        lead, lag = (1, 0) if half else (0, -1)
+
+        def window(shift):
+            """ The region of the strip, moved along axis """
+            region = [slice(*other), slice(*other)]
+            region[axis] = slice(cells[0] + shift, cells[1] + shift)
+            return tuple(region)
+
+        self.field = solver.fields[name][window(0)]
+        self.lead = solver.fields[source][window(lead)]
+        self.lag = solver.fields[source][window(lag)]
+        self.coef = solver.coefficients[coef][window(0)]
+        self.sign = sign
+
+        shape = [1, 1]
+        shape[axis] = cells[1] - cells[0]
+        self.b = coefs[0].reshape(shape).astype(self.coef.dtype)
+        self.a = coefs[1].reshape(shape).astype(self.coef.dtype)
+        self.psi = np.zeros(self.field.shape, self.field.dtype)
+        self._tmp = np.empty(self.field.shape, self.field.dtype)
+
+    def update(self):
+        """
+        psi = b psi + a dF, then field += sign coef psi
+        """
+        tmp = self._tmp
+        np.subtract(self.lead, self.lag, out=tmp)
+        np.multiply(tmp, self.a, out=tmp)
+        np.multiply(self.psi, self.b, out=self.psi)
+        np.add(self.psi, tmp, out=self.psi)
+        np.multiply(self.psi, self.coef, out=tmp)
+        if self.sign > 0:
+            np.add(self.field, tmp, out=self.field)
+        else:
+            np.subtract(self.field, tmp, out=self.field)
+
+
+class CPML:
+    """
+    Absorbing boundaries for a :class:`fdtd.solver.YeeSolver2D`.
+
+    Each curl term keeps a convolution variable psi, but only in the
+    cells of the pmlwidth-thick strips along the edges its derivative
+    crosses, so memory and work grow with the perimeter of the grid
+    rather than its area. The conductivity is graded polynomially into
+    the layer, with a complex frequency shift to absorb evanescent
+    waves. Creating the layers attaches them to the solver's hooks.
+    """
+
+    def __init__(self, solver, order=3, reflection=None, alpha_max=0.05):
+        """
+        :param solver:     The solver to absorb the waves of
+        :type  solver:     fdtd.solver.YeeSolver2D
+        :param order:      Order of the polynomial conductivity grading
+        :param reflection: Normal incidence reflection to aim for; by
+                           default the conductivity is the usual
+                           optimum 0.8 (order + 1) / (eta0 d)
+        :param alpha_max:  The frequency shift at the inner edge [S/m]
+        """
+        self.width = solver.setup.pmlwidth
+        self.strips = {'post_h': [], 'post_e': []}
+        if self.width < 1:
+            return
+        dt = solver.setup.dt
+        spacing = (solver.setup.dy, solver.setup.dx)
+
+        for term in TERMS[solver.mode]:
+            (name, axis, stage, _, _, _) = term
+            size = solver.shape[axis]
+            along, across = SPANS[solver.mode][name]
+            other = (across[0], solver.shape[1 - axis] + across[1])
+            if reflection is None:
+                sigma_max = 0.8 * (order + 1) / (ETA0 * spacing[axis])
+            else:
+                sigma_max = (-(order + 1) * np.log(reflection)
+                             / (2 * ETA0 * self.width * spacing[axis]))
+
+            for cells in self._edges(size, along, name.startswith('h')):
+                place = depth(size, self.width, cells[0], cells[1],
+                              name.startswith('h'))
+                sigma = sigma_max * place ** order
+                alpha = alpha_max * (1 - place)
+                b = np.exp(-(sigma + alpha) * dt / EPS0)
+                a = np.divide(sigma * (b - 1), sigma + alpha,
+                              out=np.zeros_like(sigma),
+                              where=(sigma + alpha) > 0)
+                self.strips[stage].append(
+                    _Strip(solver, term, cells, other, (b, a)))
+
+        for (stage, strips) in self.strips.items():
+            for (index, strip) in enumerate(strips):
+                solver.register_state('cpml/{}/{}'.format(stage, index),
+                                      strip.psi)
+        solver.add_hook('post_h', self.update_h)
+        solver.add_hook('post_e', self.update_e)
+
+    def _edges(self, size, along, half):
+        """
+        The two runs of cells at the ends of an update span that lie in
+        the layer
+        """
+        beg, end = along[0], size + along[1]
+        place = depth(size, self.width, beg, end, half)
+        inner = np.nonzero(place == 0)[0]
+        return [(beg, beg + inner[0]), (beg + inner[-1] + 1, end)]
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the auxiliary fields
+        """
+        return sum(strip.psi.nbytes
+                   for strips in self.strips.values() for strip in strips)
+
+    def update_h(self, solver):
+        # pylint: disable=unused-argument
+        """
+        Correct the H fields in the layers; a post_h hook
+        """
+        for strip in self.strips['post_h']:
+            strip.update()
+
+    def update_e(self, solver):
+        # pylint: disable=unused-argument
+        """
+        Correct the E fields in the layers; a post_e hook
+        """
+        for strip in self.strips['post_e']:
+            strip.update()
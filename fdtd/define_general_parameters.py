@@ -12,6 +12,8 @@ import numpy as np
 import phys_util.units as u
 import phys_util.constants as constants
 
+from fdtd.materials import MaterialMap
+
 # NOTE: as a translation guide:
 #       answer[1] -> self.answers['max_gp']
 #       answer[2] -> self.answers['eps']
@@ -22,6 +24,62 @@ import phys_util.constants as constants
 #       answer[7] -> self.answers['layers']
 #       answer[8] -> self.answers['axis']
 
+MICROMETER = 1e-6 * u.meter
+""" The unit that the x and y arrays are stored in """
+
+COURANT_FACTOR = 0.99
+""" The time step as a fraction of the 2D Courant stability limit """
+
+AXIS_TOLERANCE = 1e-9
+"""
+How far (as a fraction of a step) the last point of a colon-notation
+axis may overshoot the end value and still be included
+"""
+
+
+def build_axis(beg, end, num=None, step=None, tol=AXIS_TOLERANCE):
+    """
+    Builds an evenly spaced, read-only axis in one vectorized pass,
+    either as np.linspace(beg, end, num) or, when step is given instead,
+    as the matlab colon notation beg:step:end.
+
+    In colon notation the end point is included whenever it lies
+    within tol steps of the last step, so rounding error in
+    (end - beg) / step can't drop or add a point.
+
+    :param beg:  The start of the interval
+    :param end:  The end of the interval
+    :param num:  The number of points over the interval
+    :param step: The distance between points
+    :param tol:  Endpoint tolerance, as a fraction of step
+
+    :type beg:  float
+    :type end:  float
+    :type num:  int
+    :type step: float
+    :type tol:  float
+
+    :return: (axis, spacing)
+    """
+    if (num is None) == (step is None):
+        raise ValueError('build_axis needs exactly one of num and step')
+    if step is None:
+        if num < 2:
+            raise ValueError('An axis needs at least 2 points')
+        axis = np.linspace(beg, end, num=num)
+        spacing = (end - beg) / (num - 1)
+    else:
+        if step == 0:
+            raise ValueError('The step of an axis can not be 0')
+        num = int(np.floor((end - beg) / step + tol)) + 1
+        if num < 1:
+            raise ValueError('{0}:{1}:{2} is an empty axis'
+                             .format(beg, step, end))
+        axis = beg + step * np.arange(num)
+        spacing = step
+    axis.flags.writeable = False
+    return (axis, spacing)
+
 
 class Params:
     """
@@ -33,28 +91,132 @@ class Params:
         self._y_arr = None   # y
         self.del_x = 0       # dx
         self.del_y = 0       # dy
-        self._x_grid = None  # X
-        self._y_grid = None  # Y
-        self.ep_v = None
-        self.mu_v = None
+        self.shape = None    # size(X)
+        self._gathered_cache = {}
+        self._materials = None
+        self._ep_v = None
+        self._mu_v = None
+        self._alphadat = None
         self.z_s = None
-        self.alphadat = None
 
         self.axisimage = self.answers['axis']
         self.pmlwidth = self.answers['layers']
         self.set_from_user_input()
 
+    @property
+    def materials(self):
+        """
+        The :class:`fdtd.materials.MaterialMap` of the grid. Assigning a
+        new map drops the arrays gathered from the old one.
+        """
+        return self._materials
+
+    @materials.setter
+    def materials(self, value):
+        self._materials = value
+        self._gathered_cache.clear()
+
+    def _gathered(self, name, table, scale=1):
+        """
+        A per-cell array built from :attr:`materials`, cached until the
+        map changes. It is read-only, since writes into it would be
+        lost when it is rebuilt; assign a whole array to override it.
+        """
+        key = (name, self.materials.version)
+        cached = self._gathered_cache.get(name)
+        if cached is None or cached[0] != key:
+            values = scale * self.materials.gather(table)
+            # QuantityArrays keep their numbers in .value
+            getattr(values, 'value', values).flags.writeable = False
+            cached = (key, values)
+            self._gathered_cache[name] = cached
+        return cached[1]
+
+    @property
+    def ep_v(self):
+        """
+        The permittivity of every cell, built from :attr:`materials`
+        when it changes. The array is read-only; assigning an array
+        replaces it.
+        """
+        if self._ep_v is not None:
+            return self._ep_v
+        return self._gathered('eps', self.materials.eps_table,
+                              constants.epsilon0)
+
+    @ep_v.setter
+    def ep_v(self, value):
+        self._ep_v = value
+
+    @property
+    def mu_v(self):
+        """
+        The permeability of every cell, built from :attr:`materials`
+        when it changes. The array is read-only; assigning an array
+        replaces it.
+        """
+        if self._mu_v is not None:
+            return self._mu_v
+        return self._gathered('mu', self.materials.mu_table, constants.mu0)
+
+    @mu_v.setter
+    def mu_v(self, value):
+        self._mu_v = value
+
+    @property
+    def alphadat(self):
+        """
+        The alpha value of every cell, built from :attr:`materials`
+        when it changes. The array is read-only; assigning an array
+        replaces it.
+        """
+        if self._alphadat is not None:
+            return self._alphadat
+        return self._gathered('alpha', self.materials.alpha_table)
+
+    @alphadat.setter
+    def alphadat(self, value):
+        self._alphadat = value
+
     def set_grid(self):
         """
-        Set the grid?
+        Set the grid shape from the x and y arrays. The grid itself is
+        not stored; see :meth:`get_grid`.
+        """
+        self.shape = (len(self._y_arr), len(self._x_arr))
+
+    def get_grid(self, sparse=True):
+        """
+        Returns the x and y coordinates of every grid point, as
+        np.meshgrid(x, y) would.
+
+        By default the coordinates are broadcastable views of the x and
+        y arrays, with shapes (1, nx) and (ny, 1), so no memory is
+        used. Pass sparse=False to build the full (ny, nx) arrays.
+
+        :param sparse: Whether to return broadcastable views
+        :type  sparse: bool
+        :return: (X, Y)
         """
-        self._x_grid, self._y_grid = np.meshgrid(self._x_arr, self._y_arr)
+        return tuple(np.meshgrid(self._x_arr, self._y_arr, sparse=sparse,
+                                 copy=not sparse))
 
-    def get_grid(self):
+    def iter_grid_tiles(self, tile_rows):
         """
-        Returns the grid?
+        Yields the full grid coordinates a band of rows at a time, so
+        that functions of (X, Y) can be evaluated over large grids with
+        bounded memory.
+
+        :param tile_rows: The number of grid rows in each tile
+        :type  tile_rows: int
+        :return: A generator of (rows, X, Y), where rows is the slice of
+                 the grid covered and X, Y have shape
+                 (rows.stop - rows.start, nx)
         """
-        return (self._x_grid, self._y_grid)
+        for start in range(0, self.shape[0], tile_rows):
+            rows = slice(start, min(start + tile_rows, self.shape[0]))
+            x_tile, y_tile = np.meshgrid(self._x_arr, self._y_arr[rows])
+            yield (rows, x_tile, y_tile)
 
     def set_x_arr(self, beg, end, num):
         """
@@ -69,12 +231,11 @@ class Params:
         :type end: float
         :type num: int
         """
-        self._x_arr = np.linspace(beg, end, num=num)
-        self.del_x = self._x_arr[1] - self._x_arr[0]
+        self._x_arr, self.del_x = build_axis(beg, end, num=num)
 
     def set_y_arr(self, beg, end, num):
         """
-        Set the value of the x array as an evenly spaced array
+        Set the value of the y array as an evenly spaced array
         over the specified interval
 
         :param beg: The start of the interval
@@ -85,24 +246,19 @@ class Params:
         :type end: float
         :type num: int
         """
-        self._y_arr = np.linspace(beg, end, num=num)
-        self.del_y = self._y_arr[1] - self._y_arr[0]
+        self._y_arr, self.del_y = build_axis(beg, end, num=num)
 
     def set_y_col_notation(self, j, i, k):
         """
-        Set the y array using matlab colon notation
+        Set the y array using matlab colon notation, j:i:k
         """
-        step = int((k - j) / i)
-        y_lst = [j + (mul) * i for mul in range(step + 1)]
-        self._y_arr = np.array(y_lst)
+        self._y_arr, self.del_y = build_axis(j, k, step=i)
 
     def set_x_col_notation(self, j, i, k):
         """
-        Set the x array using matlab colon notation
+        Set the x array using matlab colon notation, j:i:k
         """
-        step = int((k - j) / i)
-        x_lst = [j + (mul) * i for mul in range(step + 1)]
-        self._x_arr = np.array(x_lst)
+        self._x_arr, self.del_x = build_axis(j, k, step=i)
 
     def get_x_arr(self):
         """
@@ -118,13 +274,56 @@ class Params:
         """
         return self._y_arr
 
+    def nearest_index(self, x_pos, y_pos):
+        """
+        The grid point closest to a position
+
+        :param x_pos: x coordinate, on the scale of get_x_arr
+        :param y_pos: y coordinate, on the scale of get_y_arr
+        :return: (row, column) of the point in the grid
+        """
+        col = int(np.rint((x_pos - self._x_arr[0]) / self.del_x))
+        row = int(np.rint((y_pos - self._y_arr[0]) / self.del_y))
+        if not (0 <= row < len(self._y_arr) and 0 <= col < len(self._x_arr)):
+            raise ValueError("Position ({}, {}) is outside the grid"
+                             .format(x_pos, y_pos))
+        return (row, col)
+
+    def get_step_x(self):
+        """
+        getter for the grid spacing in x, with units
+        :return: del_x as a length
+        """
+        return self.del_x * MICROMETER
+
+    def get_step_y(self):
+        """
+        getter for the grid spacing in y, with units
+        :return: del_y as a length
+        """
+        return self.del_y * MICROMETER
+
+    @u.check_dimensions(None, 1, returns=u.second)
+    def get_time_step(self, courant=COURANT_FACTOR):
+        """
+        The largest stable time step for the grid spacing, scaled by
+        the courant factor:
+
+            dt = courant / (c * sqrt(1 / dx^2 + 1 / dy^2))
+
+        :param courant: Fraction of the Courant limit to use
+        :type  courant: float
+        :return: The time step, with units
+        """
+        inv_sq = 1 / self.get_step_x() ** 2 + 1 / self.get_step_y() ** 2
+        return courant / (constants.c * np.sqrt(inv_sq))
+
     def set_from_user_input(self):
         """
         The meat of define_general_parameters
         """
-        micrometer = 1e-6 * u.meter
-        x_dim = self.answers['x_dim'] / micrometer
-        y_dim = self.answers['y_dim'] / micrometer
+        x_dim = self.answers['x_dim'] / MICROMETER
+        y_dim = self.answers['y_dim'] / MICROMETER
         max_gp = self.answers['max_gp']
         # if ANSWER[4] > ANSWER[5]:
         if x_dim > y_dim:
@@ -142,10 +341,6 @@ class Params:
 
         self.set_grid()
 
-        background_eps = constants.epsilon0 * self.answers['eps']
-        background_mu = constants.mu0 * self.answers['mu']
-        self.ep_v = background_eps * np.ones(self.get_grid()[0].shape)
-        self.mu_v = background_mu * np.ones(self.get_grid()[0].shape)
+        self.materials = MaterialMap(self.shape, eps=self.answers['eps'],
+                                     mu=self.answers['mu'])
         self.z_s = self.answers['timestep']
-
-        self.alphadat = np.ones(self.get_grid()[0].shape)
@@ -0,0 +1,104 @@
+"""
+.. module:: fdtd.dft
+   :platform: Unix, Windows
+   :synopsis: Frequency-domain monitors that accumulate the discrete
+              Fourier transform of a field region while the solver runs.
+"""
+import numpy as np
+
+
+class DFTMonitor:
+    """
+    Accumulates sum f(t) exp(-i w t) dt over a run for a list of
+    frequencies and every cell of a rectangle, so spectra need memory
+    for frequencies x cells instead of the whole time history.
+
+    Each recorded step is one outer product of the phase factors with
+    the field into preallocated scratch, and one in-place add. The
+    phase factors advance by multiplying with exp(-i w dt) and are
+    recomputed from the time outright every reseed samples, so rounding
+    in the recurrence never builds up. Accumulators use the solver's
+    precision policy, which may be double even for single precision
+    fields.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, solver, frequencies, field='ez', corner=None,
+                 opposite=None, every=1, reseed=1024):
+        """
+        :param solver:      The solver to monitor
+        :type  solver:      fdtd.solver.YeeSolver2D
+        :param frequencies: The frequencies to transform at [Hz]
+        :param field:       The field to transform
+        :param corner:      (x, y) of one corner of the region, in Params
+                            coordinates; the whole grid by default
+        :param opposite:    (x, y) of the opposite corner
+        :param every:       Sample every so many steps
+        :param reseed:      Samples between exact phase evaluations
+        """
+        if field not in solver.fields:
+            raise ValueError("Unknown field '{}'".format(field))
+        self.solver = solver
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.field = field
+        self.every = every
+        self.reseed = reseed
+
+        if corner is None:
+            region = (slice(None), slice(None))
+        else:
+            (row0, col0) = solver.cell(*corner)
+            (row1, col1) = solver.cell(*opposite)
+            (row0, row1) = sorted((row0, row1))
+            (col0, col1) = sorted((col0, col1))
+            region = (slice(row0, row1 + 1), slice(col0, col1 + 1))
+        self._sample = solver.fields[field][region]
+
+        # H is half a step behind E in the leapfrog
+        self._offset = 0.5 if field.startswith('h') else 0.0
+        omega = 2 * np.pi * self.frequencies
+        self._omega = omega
+        self._rotor = np.exp(-1j * omega * solver.setup.dt * every)
+        self._phase = np.empty(len(omega), np.complex128)
+        self._expected = None
+        self._samples = 0
+
+        shape = (len(omega),) + self._sample.shape
+        dtype = solver.precision.accumulator
+        self.accumulator = np.zeros(shape, dtype)
+        self._scratch = np.empty(shape, dtype)
+        index = len([name for name in solver.state
+                     if name.startswith('dft/')])
+        solver.register_state('dft/{}'.format(index), self.accumulator)
+        solver.add_hook('post_step', self.hook)
+
+    def _seed(self, step):
+        """ Evaluate the phase factors at a step exactly """
+        time = (step - self._offset) * self.solver.setup.dt
+        np.exp(-1j * self._omega * time, out=self._phase)
+
+    def hook(self, solver):
+        """
+        Add this step's field to the sums; a post_step hook
+        """
+        step = solver.n
+        if step % self.every:
+            return
+        if step != self._expected or self._samples % self.reseed == 0:
+            self._seed(step)
+        else:
+            np.multiply(self._phase, self._rotor, out=self._phase)
+        self._expected = step + self.every
+        self._samples += 1
+
+        np.multiply.outer(self._phase.astype(self.accumulator.dtype,
+                                             copy=False),
+                          self._sample, out=self._scratch)
+        np.add(self.accumulator, self._scratch, out=self.accumulator)
+
+    def spectrum(self):
+        """
+        :return: The transform, of shape (frequencies,) + region, in
+                 field units times seconds
+        """
+        return self.accumulator * (self.solver.setup.dt * self.every)
@@ -0,0 +1,133 @@
+"""
+.. module:: fdtd.materials
+   :platform: Unix, Windows
+   :synopsis: Describes the materials of the simulation grid as a small
+              integer index per cell plus one table entry per material,
+              instead of full per-cell eps, mu and alpha arrays.
+"""
+import numpy as np
+
+MAX_MATERIALS = 2 ** 16
+""" The largest number of distinct materials a MaterialMap can hold """
+
+
+class MaterialMap:
+    """
+    A grid of material ids with a table of properties per material.
+
+    Every cell stores only the id of its material (uint8, or uint16
+    once there are more than 256 materials). Per-cell arrays are built
+    on demand with :meth:`gather`, so changing the permittivity of a
+    material touches one table entry rather than every cell:
+
+    >>> materials = MaterialMap((100, 100))
+    >>> glass = materials.add_material(eps=2.25)
+    >>> materials.paint(np.s_[40:60, 40:60], glass)
+    >>> print(materials.gather(materials.eps_table).max())
+    2.25
+
+    Material 0 is the background and fills the grid initially. All
+    properties are relative (unitless) values.
+    """
+
+    def __init__(self, shape, eps=1, mu=1, alpha=1):
+        """
+        Creates a grid filled with the background material.
+
+        :param shape: The shape of the grid
+        :type  shape: (int, int)
+        :param eps:   Relative permittivity of the background
+        :param mu:    Relative permeability of the background
+        :param alpha: The alphadat value of the background
+        """
+        self.index = np.zeros(shape, dtype=np.uint8)
+        self._tables = {'eps': [float(eps)],
+                        'mu': [float(mu)],
+                        'alpha': [float(alpha)]}
+        self.version = 0
+        """ Incremented every time the map or a table changes """
+
+    @property
+    def shape(self):
+        """ The shape of the grid """
+        return self.index.shape
+
+    def __len__(self):
+        """ The number of materials """
+        return len(self._tables['eps'])
+
+    @property
+    def eps_table(self):
+        """ Relative permittivity of each material, indexed by id """
+        return np.array(self._tables['eps'])
+
+    @property
+    def mu_table(self):
+        """ Relative permeability of each material, indexed by id """
+        return np.array(self._tables['mu'])
+
+    @property
+    def alpha_table(self):
+        """ The alphadat value of each material, indexed by id """
+        return np.array(self._tables['alpha'])
+
+    def add_material(self, eps=1, mu=1, alpha=1):
+        """
+        Adds a material to the tables. It is not placed on the grid
+        until :meth:`paint` is called.
+
+        :return: The id of the new material
+        :rtype:  int
+        """
+        material = len(self)
+        if material >= MAX_MATERIALS:
+            raise ValueError('A MaterialMap can hold at most {0} materials'
+                             .format(MAX_MATERIALS))
+        if material > np.iinfo(self.index.dtype).max:
+            self.index = self.index.astype(np.uint16)
+        self._tables['eps'].append(float(eps))
+        self._tables['mu'].append(float(mu))
+        self._tables['alpha'].append(float(alpha))
+        self.version += 1
+        return material
+
+    def set_material(self, material, eps=None, mu=None, alpha=None):
+        """
+        Changes the properties of an existing material, everywhere it
+        is used on the grid at once. Properties left as None keep their
+        current value.
+
+        :param material: The id returned by :meth:`add_material` (0 for
+                         the background)
+        :type  material: int
+        """
+        for (name, value) in [('eps', eps), ('mu', mu), ('alpha', alpha)]:
+            if value is not None:
+                self._tables[name][material] = float(value)
+        self.version += 1
+
+    def paint(self, where, material):
+        """
+        Places a material on part of the grid.
+
+        :param where:    A boolean mask of the grid's shape, or any
+                         index or slice into the grid
+        :param material: The id of the material to place
+        :type  material: int
+        """
+        if not 0 <= material < len(self):
+            raise ValueError('Unknown material {0}'.format(material))
+        self.index[where] = material
+        self.version += 1
+
+    def gather(self, table, out=None):
+        """
+        Builds a per-cell array by looking up each cell's material in
+        table.
+
+        :param table: One value per material, indexed by id
+        :type  table: np.ndarray
+        :param out:   Optional array of the grid's shape to fill
+        :return: An array of the grid's shape
+        """
+        return np.take(np.asarray(table), self.index, out=out)
@@ -0,0 +1,201 @@
+"""
+.. module:: fdtd.parallel
+   :platform: Unix, Windows
+   :synopsis: Runs the solver's half-steps in worker processes, each
+              owning a slab of rows of fields kept in shared memory.
+"""
+import multiprocessing as mp
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from fdtd.solver import (COEFFICIENTS, MODES, SerialBackend, YeeKernels,
+                         row_bands)
+
+# Commands the parent posts to the workers before each barrier
+STOP, UPDATE_H, UPDATE_E = 0, 1, 2
+STAGES = {'h': UPDATE_H, 'e': UPDATE_E}
+
+
+def _attach(name):
+    """
+    Open an existing shared memory block. Workers share the parent's
+    resource tracker, so where Python allows it the block is not
+    tracked a second time; the parent alone unlinks it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedAllocator:
+    """
+    A solver allocator that puts every array in its own
+    multiprocessing.shared_memory block, so worker processes can map
+    the same fields and coefficients.
+    """
+
+    def __init__(self):
+        self.blocks = {}
+        self.layout = {}
+
+    def __call__(self, name, shape, dtype):
+        """
+        :param name:  The name of the array, e.g. 'ez'
+        :param shape: The shape of the array
+        :param dtype: The data type of the array
+        :return: A zeroed array backed by shared memory
+        """
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        self.blocks[name] = block
+        self.layout[name] = (block.name, tuple(shape), dtype.str)
+        array = np.ndarray(shape, dtype, buffer=block.buf)
+        array[...] = 0
+        return array
+
+    def close(self):
+        """
+        Release and remove every block. Arrays made by the allocator
+        must not be used afterwards.
+        """
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+        self.layout = {}
+
+
+def _worker(mode, layout, rows, barrier, command):
+    """
+    The loop of one worker process: wait for a command, update its
+    rows, wait for the others.
+    """
+    blocks = []
+    arrays = {}
+    for (name, (block_name, shape, dtype)) in layout.items():
+        block = _attach(block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype, buffer=block.buf)
+    fields = {name: arrays[name] for name in MODES[mode]}
+    coefficients = {name: arrays[name] for name in COEFFICIENTS}
+    kernels = YeeKernels(mode, fields, coefficients, rows=rows)
+    try:
+        while True:
+            barrier.wait()
+            if command.value == STOP:
+                break
+            if command.value == UPDATE_H:
+                kernels.update_h(*rows)
+            else:
+                kernels.update_e(*rows)
+            barrier.wait()
+    except Exception:
+        barrier.abort()
+        raise
+    finally:
+        del kernels, fields, coefficients, arrays
+        for block in blocks:
+            block.close()
+
+
+class ProcessBackend:
+    """
+    Splits every half-step of a solver between worker processes.
+
+    Each worker owns a slab of rows. The parent posts the half-step to
+    run and meets the workers at a barrier before and after it, so all
+    of H is updated before any of E reads it and vice versa. The one
+    row of the neighbouring slab a kernel reads is the halo; since the
+    fields live in shared memory, exchanging it needs no copies, only
+    the barrier. Hooks still run in the parent between half-steps.
+
+    The workers run the same kernels on the same numbers in the same
+    order as the serial solver, so the results are identical to the
+    last bit.
+
+    The solver must have been created with a :class:`SharedAllocator`.
+    Use it as a context manager, or call :meth:`close`, to stop the
+    workers.
+    """
+
+    def __init__(self, solver, allocator, tiles=None, context=None):
+        """
+        :param solver:    The solver to run
+        :type  solver:    fdtd.solver.YeeSolver2D
+        :param allocator: The allocator the solver was created with
+        :type  allocator: SharedAllocator
+        :param tiles:     The number of worker processes; one per CPU
+                          by default
+        :param context:   The multiprocessing context to start them in
+        """
+        missing = [name for name in list(solver.fields) +
+                   list(solver.coefficients)
+                   if name not in allocator.layout]
+        if missing:
+            raise ValueError("Arrays {} are not in shared memory"
+                             .format(missing))
+        context = context or mp.get_context()
+        tiles = tiles or context.cpu_count()
+        self.bands = row_bands(solver.shape[0], tiles)
+        self._barrier = context.Barrier(len(self.bands) + 1)
+        self._command = context.Value('i', STOP, lock=False)
+        self._workers = [
+            context.Process(target=_worker,
+                            args=(solver.mode, allocator.layout, rows,
+                                  self._barrier, self._command),
+                            daemon=True)
+            for rows in self.bands]
+        for worker in self._workers:
+            worker.start()
+        self.solver = solver
+        solver.backend = self
+
+    def dispatch(self, solver, stage):
+        # pylint: disable=unused-argument
+        """
+        Run a half-step in the workers and wait for all of them
+
+        :param solver: The solver to advance
+        :param stage:  'h' or 'e'
+        """
+        self._command.value = STAGES[stage]
+        self._barrier.wait()
+        self._barrier.wait()
+
+    def reset_timing(self):
+        """
+        The workers are not timed
+        """
+
+    def efficiency(self):
+        # pylint: disable=no-self-use
+        """
+        :return: None, as the workers are not timed
+        """
+        return None
+
+    def close(self):
+        """
+        Stop the workers and put the solver back to serial updates
+        """
+        if not self._workers:
+            return
+        self._command.value = STOP
+        try:
+            self._barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        self.solver.backend = SerialBackend()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,96 @@
+"""
+.. module:: fdtd.precision
+   :platform: Unix, Windows
+   :synopsis: Chooses the floating point types of the solver's fields,
+              coefficients, monitors and accumulators, and checks how
+              far a lower precision drifts from double.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+PrecisionPolicy = namedtuple('PrecisionPolicy',
+                             ['field', 'coefficient', 'monitor',
+                              'accumulator'])
+PrecisionPolicy.__doc__ = """
+The data types used for each kind of array
+
+:ivar field:       The E and H fields, scratch space and CPML psi
+:ivar coefficient: The update coefficients
+:ivar monitor:     Time series recorded by probes and snapshots
+:ivar accumulator: Complex running sums such as DFT monitors
+"""
+
+DOUBLE = PrecisionPolicy(np.dtype(np.float64), np.dtype(np.float64),
+                         np.dtype(np.float64), np.dtype(np.complex128))
+SINGLE = PrecisionPolicy(np.dtype(np.float32), np.dtype(np.float32),
+                         np.dtype(np.float32), np.dtype(np.complex64))
+MIXED = PrecisionPolicy(np.dtype(np.float32), np.dtype(np.float32),
+                        np.dtype(np.float32), np.dtype(np.complex128))
+"""
+Single precision fields, which halve the memory and bandwidth of a
+step, with double precision sums so long runs do not lose the small
+contributions of late steps
+"""
+
+POLICIES = {'double': DOUBLE, 'single': SINGLE, 'mixed': MIXED}
+
+
+def get_policy(policy):
+    """
+    Look up a precision policy
+
+    :param policy: A PrecisionPolicy, or one of the names in POLICIES
+    :rtype: PrecisionPolicy
+    """
+    if isinstance(policy, PrecisionPolicy):
+        return policy
+    try:
+        return POLICIES[policy]
+    except KeyError:
+        raise ValueError("Unknown precision '{}', expected one of {}"
+                         .format(policy, sorted(POLICIES)))
+
+
+def compare_precisions(params, steps, precisions=('double', 'mixed'),
+                       configure=None, **solver_args):
+    """
+    Run the same simulation at several precisions and measure how far
+    each drifts from the first.
+
+    :param params:      The simulation parameters
+    :type  params:      fdtd.define_general_parameters.Params
+    :param steps:       The number of steps to run
+    :param precisions:  Policies or policy names; the first is the
+                        reference
+    :param configure:   Called as configure(solver) on every solver
+                        before it runs, to add layers, sources and so on
+    :param solver_args: Passed on to fdtd.solver.YeeSolver2D
+    :return: For each precision after the first, a dict of the largest
+             difference in each field relative to the reference's
+             largest value
+    """
+    # Imported here since the solver takes its policies from this module
+    from fdtd.prepare import prepare_setup
+    from fdtd.solver import YeeSolver2D
+
+    if 'setup' not in solver_args:
+        solver_args['setup'] = prepare_setup(params)
+    results = []
+    for precision in precisions:
+        solver = YeeSolver2D(params, precision=precision, **solver_args)
+        if configure is not None:
+            configure(solver)
+        solver.run(steps)
+        results.append(solver.fields)
+
+    reference = results[0]
+    divergence = []
+    for fields in results[1:]:
+        drift = {}
+        for (name, field) in fields.items():
+            scale = np.abs(reference[name]).max()
+            error = np.abs(field - reference[name]).max()
+            drift[name] = error / scale if scale > 0 else error
+        divergence.append(drift)
+    return divergence
@@ -0,0 +1,114 @@
+"""
+.. module:: fdtd.prepare
+   :platform: Unix, Windows
+   :synopsis: Turns a Params object into the arrays the solver runs on:
+              the grid extended by the perfectly matched layers, and
+              the per-cell update coefficients.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from fdtd.define_general_parameters import build_axis
+from fdtd.raw_params import lower_grid, lower_materials, lower_params
+
+PreparedSetup = namedtuple('PreparedSetup',
+                           ['x_axis', 'y_axis', 'ce', 'ch', 'alpha',
+                            'dx', 'dy', 'dt', 'steps', 'pmlwidth'])
+PreparedSetup.__doc__ = """
+Everything the solver needs, in SI base units. The arrays cover the
+grid of the Params object plus pmlwidth cells of perfectly matched
+layer on every side, and may be read-only memory maps.
+
+:ivar x_axis:   x coordinates of the extended grid [m]
+:ivar y_axis:   y coordinates of the extended grid [m]
+:ivar ce:       dt / eps of every cell, the E field update coefficient
+:ivar ch:       dt / mu of every cell, the H field update coefficient
+:ivar alpha:    The Params.alphadat value of every cell
+:ivar dx:       Grid spacing in x [m]
+:ivar dy:       Grid spacing in y [m]
+:ivar dt:       Time step [s]
+:ivar steps:    Number of time steps to run
+:ivar pmlwidth: Number of perfectly matched layers on each side
+"""
+
+ARRAY_FIELDS = ('x_axis', 'y_axis', 'ce', 'ch', 'alpha')
+""" The PreparedSetup fields that hold arrays """
+
+
+def extend_axis(axis, spacing, width):
+    """
+    Adds width points of the same spacing to both ends of an axis, as
+    the PML set-up in startsimulation.m does.
+
+    :param axis:    The original axis
+    :type  axis:    np.ndarray
+    :param spacing: The distance between points
+    :type  spacing: float
+    :param width:   The number of points to add on each side
+    :type  width:   int
+    :return: The extended, read-only axis
+    """
+    num = len(axis) + 2 * width
+    extended, _ = build_axis(axis[0] - width * spacing,
+                             axis[0] + (num - 1) * spacing - width * spacing,
+                             num=num)
+    return extended
+
+
+def _pad(array, width):
+    """
+    Extends a per-cell array into the PML, continuing the material at
+    the edge of the grid outwards.
+    """
+    padded = np.pad(array, width, mode='edge')
+    padded.flags.writeable = False
+    return padded
+
+
+def _gather_padded(table, index):
+    """
+    Looks up each cell of an already padded material index in a table
+    of per-material values.
+    """
+    gathered = np.take(table, index)
+    gathered.flags.writeable = False
+    return gathered
+
+
+def prepare_setup(params):
+    """
+    Check the units of params and build the extended grid and the
+    update coefficients.
+
+    The coefficients are worked out once per material and gathered by
+    material id into the extended grid. Only when per-cell arrays have
+    been assigned to Params are they computed cell by cell.
+
+    :param params: The simulation parameters
+    :type  params: fdtd.define_general_parameters.Params
+    :rtype: PreparedSetup
+    """
+    tables = lower_materials(params)
+    if tables is not None:
+        grid = lower_grid(params)
+        width = int(params.pmlwidth)
+        index = np.pad(params.materials.index, width, mode='edge')
+        return PreparedSetup(
+            x_axis=extend_axis(grid['x_arr'], grid['dx'], width),
+            y_axis=extend_axis(grid['y_arr'], grid['dy'], width),
+            ce=_gather_padded(grid['dt'] / tables.eps, index),
+            ch=_gather_padded(grid['dt'] / tables.mu, index),
+            alpha=_gather_padded(tables.alpha, index),
+            dx=grid['dx'], dy=grid['dy'], dt=grid['dt'],
+            steps=int(params.z_s), pmlwidth=width)
+
+    raw = lower_params(params)
+    width = raw.pmlwidth
+    return PreparedSetup(x_axis=extend_axis(raw.x_arr, raw.dx, width),
+                         y_axis=extend_axis(raw.y_arr, raw.dy, width),
+                         ce=_pad(raw.dt / raw.eps, width),
+                         ch=_pad(raw.dt / raw.mu, width),
+                         alpha=_pad(raw.alpha, width),
+                         dx=raw.dx, dy=raw.dy, dt=raw.dt,
+                         steps=raw.steps, pmlwidth=width)
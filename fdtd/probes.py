@@ -0,0 +1,197 @@
+"""
+.. module:: fdtd.probes
+   :platform: Unix, Windows
+   :synopsis: Records field time series at points, along lines and over
+              boxes, with one gather per field and step for every probe.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+Probe = namedtuple('Probe', ['name', 'field', 'columns', 'shape'])
+Probe.__doc__ = """
+Where a probe's values are kept
+
+:ivar name:    The probe's name
+:ivar field:   The field it records
+:ivar columns: The slice of the record's columns holding its cells
+:ivar shape:   The shape of one sample: () for a point, (cells,) for a
+               line and (rows, cols) for a box
+"""
+
+
+class ProbeSet:
+    """
+    A group of probes on one solver.
+
+    Probes are placed in Params coordinates, the scale of
+    Params.get_x_arr and get_y_arr, and snap to the nearest cell. Once
+    they are all added, :meth:`attach` sorts their cells by field into
+    one flat index array per field and allocates the record: a row per
+    recorded step and a column per cell, sized from the solver's step
+    count. Each recorded step is then one np.take per field straight
+    into the record.
+
+    With a path the record is a .npy file memory mapped from disk,
+    which is flushed every flush_every rows, so it is written as the
+    run goes and can be read while it runs.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, solver, steps=None, every=1, path=None,
+                 flush_every=1024):
+        """
+        :param solver:      The solver to record from
+        :type  solver:      fdtd.solver.YeeSolver2D
+        :param steps:       Steps to make room for; by default the
+                            solver's step count
+        :param every:       Record every so many steps
+        :param path:        A .npy file to keep the record in
+        :param flush_every: Rows between flushes of the file
+        """
+        self.solver = solver
+        self.rows = -(-(steps or solver.steps) // every)
+        self.every = every
+        self.path = path
+        self.flush_every = flush_every
+        self.probes = {}
+        self.data = None
+        self._cells = {}
+        self._gathers = []
+        self._count = np.zeros((), np.int64)
+
+    def _add(self, name, field, rows, cols, shape):
+        """ Add a probe over the given cells """
+        if self.data is not None:
+            raise RuntimeError("Probes cannot be added after attach()")
+        if name in self.probes:
+            raise ValueError("Probe '{}' already exists".format(name))
+        if field not in self.solver.fields:
+            raise ValueError("Unknown field '{}'".format(field))
+        flat = np.ravel_multi_index((np.ravel(rows), np.ravel(cols)),
+                                    self.solver.shape)
+        self._cells.setdefault(field, []).append((name, flat))
+        self.probes[name] = Probe(name, field, None, shape)
+
+    def add_point(self, name, x_pos, y_pos, field='ez'):
+        """
+        Record one cell
+
+        :param name:  What to call the probe
+        :param x_pos: x coordinate
+        :param y_pos: y coordinate
+        :param field: The field to record
+        """
+        (row, col) = self.solver.cell(x_pos, y_pos)
+        self._add(name, field, [row], [col], ())
+
+    def add_line(self, name, start, end, field='ez'):
+        """
+        Record the cells along a straight line, one per grid step along
+        its longer direction
+
+        :param name:  What to call the probe
+        :param start: (x, y) of one end
+        :param end:   (x, y) of the other end
+        :param field: The field to record
+        """
+        (row0, col0) = self.solver.cell(*start)
+        (row1, col1) = self.solver.cell(*end)
+        num = max(abs(row1 - row0), abs(col1 - col0)) + 1
+        rows = np.rint(np.linspace(row0, row1, num)).astype(int)
+        cols = np.rint(np.linspace(col0, col1, num)).astype(int)
+        self._add(name, field, rows, cols, (num,))
+
+    def add_box(self, name, corner, opposite, field='ez'):
+        """
+        Record every cell in a rectangle
+
+        :param name:     What to call the probe
+        :param corner:   (x, y) of one corner
+        :param opposite: (x, y) of the opposite corner
+        :param field:    The field to record
+        """
+        (row0, col0) = self.solver.cell(*corner)
+        (row1, col1) = self.solver.cell(*opposite)
+        (row0, row1) = sorted((row0, row1))
+        (col0, col1) = sorted((col0, col1))
+        (rows, cols) = np.mgrid[row0:row1 + 1, col0:col1 + 1]
+        self._add(name, field, rows, cols, rows.shape)
+
+    def attach(self):
+        """
+        Allocate the record and start recording. The record and the
+        count of recorded rows join the solver's checkpointed state.
+        """
+        columns = 0
+        for (field, cells) in self._cells.items():
+            first = columns
+            for (name, flat) in cells:
+                probe = self.probes[name]
+                self.probes[name] = probe._replace(
+                    columns=slice(columns, columns + len(flat)))
+                columns += len(flat)
+            indices = np.concatenate([flat for (_, flat) in cells])
+            self._gathers.append((self.solver.fields[field].reshape(-1),
+                                  indices, slice(first, columns)))
+
+        shape = (self.rows, columns)
+        dtype = self.solver.precision.monitor
+        if self.path is None:
+            self.data = np.zeros(shape, dtype)
+        else:
+            self.data = np.lib.format.open_memmap(self.path, mode='w+',
+                                                  dtype=dtype, shape=shape)
+        index = len([name for name in self.solver.state
+                     if name.startswith('probes/')]) // 2
+        self.solver.register_state('probes/{}/data'.format(index), self.data)
+        self.solver.register_state('probes/{}/count'.format(index),
+                                   self._count)
+        self.solver.add_hook('post_step', self.hook)
+        return self
+
+    def hook(self, solver):
+        """
+        Gather every probe's cells; a post_step hook
+        """
+        row = int(self._count)
+        if solver.n % self.every or row >= self.rows:
+            return
+        for (flat, indices, columns) in self._gathers:
+            np.take(flat, indices, out=self.data[row, columns],
+                    mode='clip')
+        self._count += 1
+        if self.path is not None and (row + 1) % self.flush_every == 0:
+            self.data.flush()
+
+    @property
+    def count(self):
+        """
+        The number of steps recorded so far
+        """
+        return int(self._count)
+
+    def times(self):
+        """
+        :return: The time of each recorded step [s]
+        """
+        steps = (np.arange(self.count) + 1) * self.every
+        return steps * self.solver.setup.dt
+
+    def trace(self, name):
+        """
+        The recorded values of one probe
+
+        :param name: The probe's name
+        :return: An array of (recorded steps,) + the probe's shape
+        """
+        probe = self.probes[name]
+        values = self.data[:self.count, probe.columns]
+        return values.reshape((self.count,) + probe.shape)
+
+    def flush(self):
+        """
+        Write the record to its file, if it has one
+        """
+        if self.path is not None:
+            self.data.flush()
@@ -0,0 +1,152 @@
+"""
+.. module:: fdtd.raw_params
+   :platform: Unix, Windows
+   :synopsis: Checks the units of a Params object once, then lowers it
+              to plain float64 arrays and scalars for the solver, so
+              the time loop never touches phys_util.units.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+import phys_util.constants as constants
+import phys_util.units as u
+
+from fdtd.define_general_parameters import MICROMETER
+
+RawParams = namedtuple('RawParams', ['eps', 'mu', 'alpha', 'dx', 'dy', 'dt',
+                                     'x_arr', 'y_arr', 'steps', 'pmlwidth'])
+RawParams.__doc__ = """
+Unitless simulation inputs, all in SI base units. Arrays are read-only
+float64.
+
+:ivar eps:      Permittivity of each cell [F/m]
+:ivar mu:       Permeability of each cell [H/m]
+:ivar alpha:    The Params.alphadat array
+:ivar dx:       Grid spacing in x [m]
+:ivar dy:       Grid spacing in y [m]
+:ivar dt:       Time step [s]
+:ivar x_arr:    x coordinates of the grid [m]
+:ivar y_arr:    y coordinates of the grid [m]
+:ivar steps:    Number of time steps to run
+:ivar pmlwidth: Number of perfectly matched layers
+"""
+
+SCHEMA = (('eps', lambda params: params.ep_v, u.farad / u.meter),
+          ('mu', lambda params: params.mu_v, u.henry / u.meter),
+          ('dx', lambda params: params.get_step_x(), u.meter),
+          ('dy', lambda params: params.get_step_y(), u.meter),
+          ('dt', lambda params: params.get_time_step(), u.second),
+          ('x_arr', lambda params: params.get_x_arr() * MICROMETER, u.meter),
+          ('y_arr', lambda params: params.get_y_arr() * MICROMETER, u.meter))
+"""
+The (field, getter, unit) triples checked by :func:`lower_params`. The
+value returned by getter must have the same dimension as unit, and is
+stored in the RawParams field as a multiple of unit.
+"""
+
+CELL_FIELDS = ('eps', 'mu')
+""" The SCHEMA fields with a value per cell """
+
+MaterialTables = namedtuple('MaterialTables', ['eps', 'mu', 'alpha'])
+MaterialTables.__doc__ = """
+Unitless properties of each material of a Params material map, indexed
+by material id, in SI base units.
+
+:ivar eps:   Permittivity of each material [F/m]
+:ivar mu:    Permeability of each material [H/m]
+:ivar alpha: The alphadat value of each material
+"""
+
+
+def strip_units(name, quantity, unit):
+    """
+    Check that quantity has the dimension of unit and return its
+    magnitude in multiples of unit.
+
+    :param name:     The name of the field, used in the error message
+    :type  name:     string
+    :param quantity: The value to convert
+    :type  quantity: Unit | QuantityArray
+    :param unit:     The unit the value should be expressed in
+    :type  unit:     Unit
+
+    :return: A float, or a read-only float64 array
+    """
+    if not u.PRODUCTION_MODE:
+        dimension = getattr(quantity, 'dimension', u.DIMENSIONLESS)
+        if dimension is not unit.dimension:
+            raise ArithmeticError('{0} should be in units of {1}, not {2}'
+                                  .format(name, unit.dimension.symbol,
+                                          dimension.symbol or
+                                          'a plain number'))
+    raw = quantity / unit
+    if np.ndim(raw) == 0:
+        return float(raw)
+    raw = np.array(raw, dtype=np.float64, order='C')
+    raw.flags.writeable = False
+    return raw
+
+
+def lower_grid(params):
+    """
+    Check the fields of :data:`SCHEMA` that are not per cell, the
+    spacings, time step and axes, and return them unitless.
+
+    :param params: The simulation parameters
+    :type  params: fdtd.define_general_parameters.Params
+    :return: The RawParams fields, by name
+    :rtype:  dict
+    """
+    return {name: strip_units(name, getter(params), unit)
+            for (name, getter, unit) in SCHEMA if name not in CELL_FIELDS}
+
+
+def lower_materials(params):
+    """
+    Check and return the properties of each material of params, so
+    per-cell values can be gathered from them by material id.
+
+    :param params: The simulation parameters
+    :type  params: fdtd.define_general_parameters.Params
+    :return: The material tables, or None if arrays assigned to
+             Params.ep_v, mu_v or alphadat replace the material map
+    :rtype:  MaterialTables
+    """
+    # pylint: disable=protected-access
+    if any(override is not None for override
+           in [params._ep_v, params._mu_v, params._alphadat]):
+        return None
+    materials = params.materials
+    return MaterialTables(
+        eps=strip_units('eps', constants.epsilon0 * materials.eps_table,
+                        u.farad / u.meter),
+        mu=strip_units('mu', constants.mu0 * materials.mu_table,
+                       u.henry / u.meter),
+        alpha=materials.alpha_table)
+
+
+def lower_params(params):
+    """
+    Check every field of params against :data:`SCHEMA` and return the
+    unitless values the solver needs.
+
+    A dimension mistake raises an ArithmeticError here, before any time
+    stepping starts.
+
+    :param params: The simulation parameters
+    :type  params: fdtd.define_general_parameters.Params
+
+    :return: The parameters in SI base units
+    :rtype:  RawParams
+    """
+    fields = lower_grid(params)
+    for (name, getter, unit) in SCHEMA:
+        if name in CELL_FIELDS:
+            fields[name] = strip_units(name, getter(params), unit)
+
+    alpha = np.array(params.alphadat, dtype=np.float64, order='C')
+    alpha.flags.writeable = False
+
+    return RawParams(alpha=alpha, steps=int(params.z_s),
+                     pmlwidth=int(params.pmlwidth), **fields)
@@ -0,0 +1,247 @@
+"""
+.. module:: fdtd.setup_cache
+   :platform: Unix, Windows
+   :synopsis: An on-disk cache of prepared simulation set-ups, keyed by
+              a hash of the parameters and geometry, so that repeated
+              runs of the same geometry skip fdtd.prepare.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import fdtd.define_general_parameters as dgp
+from fdtd.prepare import ARRAY_FIELDS, PreparedSetup, prepare_setup
+
+CACHE_VERSION = 1
+"""
+Stamped on every cache entry. Bump it whenever prepare_setup changes
+what it computes, so that old entries are rebuilt.
+"""
+
+DEFAULT_MAX_BYTES = 4 * 2 ** 30
+""" Default size limit of a SetupCache, in bytes """
+
+KEY_ANSWERS = ('max_gp', 'eps', 'mu', 'x_dim', 'y_dim', 'layers')
+"""
+The Params.answers entries that affect the prepared arrays. The step
+count and display settings are left out, so runs that differ only in
+those share an entry.
+"""
+
+META_FILE = 'meta.json'
+
+
+def _normalize(value):
+    """
+    Converts an answer into something JSON can encode identically in
+    both unit modes: Units become their SI value.
+    """
+    value = getattr(value, 'value', value)
+    if isinstance(value, (np.integer, np.floating)):
+        value = value.item()
+    return value
+
+
+def setup_key(params):
+    """
+    A stable hash of everything that determines prepare_setup(params).
+
+    :param params: The simulation parameters
+    :type  params: fdtd.define_general_parameters.Params
+    :return: A hex digest
+    """
+    digest = hashlib.sha256()
+    answers = {name: _normalize(params.answers[name])
+               for name in KEY_ANSWERS}
+    header = {'version': CACHE_VERSION,
+              'answers': answers,
+              'courant': dgp.COURANT_FACTOR}
+    digest.update(json.dumps(header, sort_keys=True).encode())
+
+    materials = params.materials
+    digest.update(np.ascontiguousarray(materials.index).tobytes())
+    for table in [materials.eps_table, materials.mu_table,
+                  materials.alpha_table]:
+        digest.update(table.tobytes())
+
+    # Arrays assigned directly to Params replace the material map
+    # pylint: disable=protected-access
+    for override in [params._ep_v, params._mu_v, params._alphadat]:
+        if override is not None:
+            override = getattr(override, 'value', override)
+            digest.update(np.ascontiguousarray(override).tobytes())
+    return digest.hexdigest()
+
+
+class SetupCache:
+    """
+    Stores prepared set-ups as directories of .npy files under a root
+    directory, one per :func:`setup_key`. Cached arrays are memory
+    mapped read-only when reused, so loading costs almost nothing
+    until they are touched.
+
+    The least recently used entries are removed once the cache grows
+    past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param directory: Where to keep the cache; created if missing
+        :type  directory: string
+        :param max_bytes: Size limit for the whole cache
+        :type  max_bytes: int
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry(self, key):
+        """ The directory of one cache entry """
+        return os.path.join(self.directory, key)
+
+    def load(self, key, steps=None):
+        """
+        Look up a prepared set-up.
+
+        :param key:   The entry's setup_key
+        :param steps: Step count to put in the result, since it is not
+                      part of the key
+        :return: The memory mapped PreparedSetup, or None on a miss,
+                 including an entry removed while it was being read
+        """
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, META_FILE)) as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+        if meta.get('version') != CACHE_VERSION:
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+
+        fields = dict(meta['scalars'])
+        try:
+            for name in ARRAY_FIELDS:
+                fields[name] = np.load(os.path.join(entry, name + '.npy'),
+                                       mmap_mode='r')
+            # Mark as recently used for LRU eviction
+            os.utime(os.path.join(entry, META_FILE))
+        except (OSError, ValueError):
+            # Evicted by another process since the meta file was read
+            return None
+        if steps is not None:
+            fields['steps'] = steps
+        return PreparedSetup(**fields)
+
+    def store(self, key, setup):
+        """
+        Write a prepared set-up to the cache. The entry is written to a
+        temporary directory and renamed into place, so readers never
+        see half an entry.
+
+        :param key:   The entry's setup_key
+        :param setup: The set-up to store
+        :type  setup: PreparedSetup
+        """
+        staging = tempfile.mkdtemp(prefix='.' + key, dir=self.directory)
+        size = 0
+        for name in ARRAY_FIELDS:
+            path = os.path.join(staging, name + '.npy')
+            np.save(path, getattr(setup, name))
+            size += os.path.getsize(path)
+        scalars = {name: getattr(setup, name)
+                   for name in PreparedSetup._fields
+                   if name not in ARRAY_FIELDS}
+        meta = {'version': CACHE_VERSION, 'bytes': size,
+                'created': time.time(), 'scalars': scalars}
+        with open(os.path.join(staging, META_FILE), 'w') as meta_file:
+            json.dump(meta, meta_file)
+        entry = self._entry(key)
+        names = [META_FILE] + [name + '.npy' for name in ARRAY_FIELDS]
+        if not all(os.path.exists(os.path.join(entry, name))
+                   for name in names):
+            # Complete entries are only made by the rename below, so an
+            # entry missing files is left over from a damaged one
+            shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict(keep=key)
+
+    def get(self, params):
+        """
+        Return the prepared set-up for params, from the cache if it is
+        there, otherwise by running prepare_setup and storing the
+        result. If the stored entry can't be read back, the freshly
+        prepared set-up is returned as it is.
+
+        :param params: The simulation parameters
+        :type  params: fdtd.define_general_parameters.Params
+        :rtype: PreparedSetup
+        """
+        key = setup_key(params)
+        setup = self.load(key, steps=int(params.z_s))
+        if setup is not None:
+            self.hits += 1
+            return setup
+        self.misses += 1
+        setup = prepare_setup(params)
+        self.store(key, setup)
+        return self.load(key, steps=int(params.z_s)) or setup
+
+    def entries(self):
+        """
+        :return: A list of (last used time, bytes, key) for every entry
+        """
+        found = []
+        for key in os.listdir(self.directory):
+            meta_path = os.path.join(self._entry(key), META_FILE)
+            if key.startswith('.') or not os.path.exists(meta_path):
+                continue
+            try:
+                with open(meta_path) as meta_file:
+                    size = json.load(meta_file)['bytes']
+                used = os.path.getmtime(meta_path)
+            except (OSError, ValueError, KeyError):
+                continue
+            found.append((used, size, key))
+        return found
+
+    def size(self):
+        """
+        :return: The total size of the cached arrays, in bytes
+        """
+        return sum(size for (_, size, _) in self.entries())
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache fits in
+        max_bytes.
+
+        :param keep: A key that must not be removed
+        """
+        entries = sorted(self.entries())
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, key) in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """
+        Remove every entry
+        """
+        for (_, _, key) in self.entries():
+            shutil.rmtree(self._entry(key), ignore_errors=True)
@@ -0,0 +1,196 @@
+"""
+.. module:: fdtd.snapshots
+   :platform: Unix, Windows
+   :synopsis: Records field movies from a running solver through a ring
+              of preallocated buffers drained by a background writer.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+INDEX_FILE = 'index.jsonl'
+POLICIES = ('block', 'drop')
+
+
+def load_index(directory):
+    """
+    :return: The chunk entries of a snapshot directory, in order. Each
+             has the chunk's file name, the field names and the steps
+             of its frames.
+    """
+    with open(os.path.join(directory, INDEX_FILE)) as index:
+        return [json.loads(line) for line in index if line.strip()]
+
+
+def read_frames(directory, field, mmap=True):
+    """
+    Read back every frame of one field
+
+    :param directory: Where the snapshots were written
+    :param field:     The field name, e.g. 'ez'
+    :param mmap:      Memory map uncompressed chunks instead of reading
+                      them
+    :return: (steps, frames) with frames of shape (frames, rows, cols)
+    """
+    steps = []
+    frames = []
+    for entry in load_index(directory):
+        path = os.path.join(directory, entry['file'])
+        if path.endswith('.npz'):
+            with np.load(path) as chunk:
+                frames.append(chunk[field])
+        else:
+            chunk = np.load(path, mmap_mode='r' if mmap else None)
+            frames.append(chunk[:, entry['fields'].index(field)])
+        steps.extend(entry['steps'])
+    if not frames:
+        return np.array(steps, dtype=int), None
+    return np.array(steps, dtype=int), np.concatenate(frames)
+
+
+class SnapshotWriter:
+    """
+    Copies field components into a small ring of preallocated buffers
+    every few steps, and lets a background thread gather them into
+    chunks of frames written to disk. The time loop only ever pays for
+    the copy of the (optionally decimated) fields.
+
+    Chunks are .npy files holding (frames, fields, rows, cols), or .npz
+    files with one array per field when compressed. Each finished chunk
+    is listed in index.jsonl with the steps it holds.
+
+    If the writer falls behind and the ring is full, the 'block' policy
+    waits for a free buffer and the 'drop' policy skips the frame; both
+    are counted.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, solver, directory, fields=None, every=1, stride=1,
+                 ring=4, chunk=16, policy='block', compress=False):
+        """
+        :param solver:    The solver to record
+        :type  solver:    fdtd.solver.YeeSolver2D
+        :param directory: Where to write the chunks
+        :param fields:    Names of the fields to record; all by default
+        :param every:     Record every so many steps
+        :param stride:    Keep every so many cells along each axis
+        :param ring:      How many frames can wait for the writer
+        :param chunk:     Frames per file
+        :param policy:    'block' or 'drop' when the ring is full
+        :param compress:  Write compressed .npz chunks
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown policy '{}', expected one of {}"
+                             .format(policy, POLICIES))
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fields = list(fields or solver.fields)
+        self.every = every
+        self.policy = policy
+        self.compress = compress
+        self.written = 0
+        self.dropped = 0
+        self.blocked = 0.0
+        self.error = None
+
+        self._views = [solver.fields[name][::stride, ::stride]
+                       for name in self.fields]
+        frame = (len(self.fields),) + self._views[0].shape
+        dtype = solver.precision.monitor
+        self._ring = np.empty((ring,) + frame, dtype)
+        self._chunk = np.empty((chunk,) + frame, dtype)
+        self._steps = []
+        self._chunks = 0
+
+        self._free = queue.Queue()
+        for slot in range(ring):
+            self._free.put(slot)
+        self._filled = queue.Queue()
+        self._thread = threading.Thread(target=self._write_loop,
+                                        name='fdtd-snapshots', daemon=True)
+        self._thread.start()
+        solver.add_hook('post_step', self.hook)
+
+    @property
+    def frame_shape(self):
+        """
+        The shape of one recorded field
+        """
+        return self._ring.shape[2:]
+
+    def hook(self, solver):
+        """
+        Copy the fields if this step is recorded; a post_step hook
+        """
+        if solver.n % self.every:
+            return
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            if self.policy == 'drop':
+                self.dropped += 1
+                return
+            start = time.perf_counter()
+            slot = self._free.get()
+            self.blocked += time.perf_counter() - start
+        for (index, view) in enumerate(self._views):
+            np.copyto(self._ring[slot, index], view, casting='same_kind')
+        self._filled.put((slot, solver.n))
+
+    def _write_loop(self):
+        """ The writer thread: move frames into chunks and write them """
+        while True:
+            item = self._filled.get()
+            if item is None:
+                break
+            (slot, step) = item
+            try:
+                np.copyto(self._chunk[len(self._steps)], self._ring[slot])
+                self._steps.append(step)
+            except Exception as error:  # pylint: disable=broad-except
+                self.error = error
+            finally:
+                # Always hand the slot back, or a blocking hook waits
+                # forever
+                self._free.put(slot)
+            if len(self._steps) == len(self._chunk):
+                self._write_chunk()
+        if self._steps:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        """ Write the frames gathered so far and list them in the index """
+        count = len(self._steps)
+        name = 'snapshots-{:06d}.{}'.format(self._chunks,
+                                            'npz' if self.compress
+                                            else 'npy')
+        path = os.path.join(self.directory, name)
+        try:
+            if self.compress:
+                np.savez_compressed(
+                    path, **{field: self._chunk[:count, index]
+                             for (index, field) in enumerate(self.fields)})
+            else:
+                np.save(path, self._chunk[:count])
+            entry = {'file': name, 'fields': self.fields,
+                     'steps': self._steps}
+            with open(os.path.join(self.directory, INDEX_FILE),
+                      'a') as index:
+                index.write(json.dumps(entry) + '\n')
+            self.written += count
+        except Exception as error:  # pylint: disable=broad-except
+            # Keep the thread alive, so the ring keeps draining
+            self.error = error
+        self._chunks += 1
+        self._steps = []
+
+    def close(self):
+        """
+        Write out every frame still waiting and stop the writer
+        """
+        self._filled.put(None)
+        self._thread.join()
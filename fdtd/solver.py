@@ -0,0 +1,378 @@
+"""
+.. module:: fdtd.solver
+   :platform: Unix, Windows
+   :synopsis: A 2D Yee-grid time-stepping engine that updates the fields
+              in place with NumPy slice arithmetic.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from fdtd.precision import get_policy
+from fdtd.prepare import prepare_setup
+
+MODES = {'TM': ('ez', 'hx', 'hy'),
+         'TE': ('hz', 'ex', 'ey')}
+"""
+The field components of each polarization. TM has E along z and H in
+the plane; TE the other way round.
+"""
+
+COEFFICIENTS = ('ce_x', 'ce_y', 'ch_x', 'ch_y')
+"""
+The update coefficients: dt / eps and dt / mu over each grid spacing
+"""
+
+RunStats = namedtuple('RunStats', ['steps', 'seconds', 'cells_per_second',
+                                   'efficiency'])
+RunStats.__doc__ = """
+Timing of a call to :meth:`YeeSolver2D.run`
+
+:ivar steps:            The number of steps taken
+:ivar seconds:          Wall clock time of the run
+:ivar cells_per_second: Grid cells updated per second
+:ivar efficiency:       Fraction of the backend's workers' time spent
+                        updating fields, or None if it is not measured
+"""
+
+
+def row_bands(rows, count):
+    """
+    Split rows into count contiguous bands of nearly equal size
+
+    :param rows:  The number of rows
+    :param count: The number of bands
+    :return: A list of (first row, one past the last row)
+    """
+    count = max(1, min(count, rows))
+    edges = [rows * band // count for band in range(count + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def zeros(name, shape, dtype):
+    # pylint: disable=unused-argument
+    """
+    The default field allocator: an ordinary zeroed array
+
+    :param name:  The name of the array, e.g. 'ez'
+    :param shape: The shape of the array
+    :param dtype: The data type of the array
+    """
+    return np.zeros(shape, dtype)
+
+
+class YeeKernels:
+    """
+    The field update arithmetic of :class:`YeeSolver2D`, on arrays
+    given to it. Kept apart so worker processes can run the same
+    kernels on shared memory.
+    """
+
+    def __init__(self, mode, fields, coefficients, rows=None):
+        """
+        :param mode:         'TM' or 'TE'
+        :param fields:       Field arrays by name, see MODES
+        :param coefficients: Coefficient arrays by name, see COEFFICIENTS
+        :param rows:         (first, end) of the only rows that will be
+                             updated, to size the scratch space; by
+                             default all of them
+        """
+        if mode not in MODES:
+            raise ValueError("Unknown mode '{}', expected one of {}"
+                             .format(mode, sorted(MODES)))
+        self.mode = mode
+        self.fields = fields
+        self.coefficients = coefficients
+        self.shape = fields[MODES[mode][0]].shape
+        if rows is None:
+            rows = (0, self.shape[0])
+        self._offset = rows[0]
+        scratch_shape = (rows[1] - rows[0], self.shape[1])
+        dtype = fields[MODES[mode][0]].dtype
+        self._scratch = (np.empty(scratch_shape, dtype),
+                         np.empty(scratch_shape, dtype))
+
+    def _tmp(self, which, beg, end):
+        """ Rows [beg, end) of a scratch array """
+        return self._scratch[which][beg - self._offset:end - self._offset]
+
+    def update_h(self, row_beg, row_end):
+        """
+        Advance H by one step on rows [row_beg, row_end). Reads E one row
+        past the band.
+        """
+        if self.mode == 'TM':
+            self._update_h_tm(row_beg, row_end)
+        else:
+            self._update_h_te(row_beg, row_end)
+
+    def update_e(self, row_beg, row_end):
+        """
+        Advance E by one step on rows [row_beg, row_end). Reads H one row
+        before the band.
+        """
+        if self.mode == 'TM':
+            self._update_e_tm(row_beg, row_end)
+        else:
+            self._update_e_te(row_beg, row_end)
+
+    def _update_h_tm(self, row_beg, row_end):
+        """ hx -= ch/dy d(ez)/dy ; hy += ch/dx d(ez)/dx """
+        ez, hx, hy = (self.fields[name] for name in MODES['TM'])
+        coef = self.coefficients
+        beg, end = row_beg, min(row_end, self.shape[0] - 1)
+        if end > beg:
+            tmp = self._tmp(0, beg, end)
+            np.subtract(ez[beg + 1:end + 1], ez[beg:end], out=tmp)
+            np.multiply(tmp, coef['ch_y'][beg:end], out=tmp)
+            np.subtract(hx[beg:end], tmp, out=hx[beg:end])
+
+        tmp = self._tmp(1, row_beg, row_end)[:, :-1]
+        np.subtract(ez[row_beg:row_end, 1:], ez[row_beg:row_end, :-1],
+                    out=tmp)
+        np.multiply(tmp, coef['ch_x'][row_beg:row_end, :-1], out=tmp)
+        np.add(hy[row_beg:row_end, :-1], tmp, out=hy[row_beg:row_end, :-1])
+
+    def _update_e_tm(self, row_beg, row_end):
+        """ ez += ce/dx d(hy)/dx - ce/dy d(hx)/dy """
+        ez, hx, hy = (self.fields[name] for name in MODES['TM'])
+        coef = self.coefficients
+        beg, end = max(row_beg, 1), min(row_end, self.shape[0] - 1)
+        if end <= beg:
+            return
+        curl = self._tmp(0, beg, end)[:, 1:-1]
+        tmp = self._tmp(1, beg, end)[:, 1:-1]
+        np.subtract(hy[beg:end, 1:-1], hy[beg:end, :-2], out=curl)
+        np.multiply(curl, coef['ce_x'][beg:end, 1:-1], out=curl)
+        np.subtract(hx[beg:end, 1:-1], hx[beg - 1:end - 1, 1:-1], out=tmp)
+        np.multiply(tmp, coef['ce_y'][beg:end, 1:-1], out=tmp)
+        np.subtract(curl, tmp, out=curl)
+        np.add(ez[beg:end, 1:-1], curl, out=ez[beg:end, 1:-1])
+
+    def _update_h_te(self, row_beg, row_end):
+        """ hz += ch/dy d(ex)/dy - ch/dx d(ey)/dx """
+        hz, ex, ey = (self.fields[name] for name in MODES['TE'])
+        coef = self.coefficients
+        beg, end = row_beg, min(row_end, self.shape[0] - 1)
+        if end <= beg:
+            return
+        curl = self._tmp(0, beg, end)[:, :-1]
+        tmp = self._tmp(1, beg, end)[:, :-1]
+        np.subtract(ex[beg + 1:end + 1, :-1], ex[beg:end, :-1], out=curl)
+        np.multiply(curl, coef['ch_y'][beg:end, :-1], out=curl)
+        np.subtract(ey[beg:end, 1:], ey[beg:end, :-1], out=tmp)
+        np.multiply(tmp, coef['ch_x'][beg:end, :-1], out=tmp)
+        np.subtract(curl, tmp, out=curl)
+        np.add(hz[beg:end, :-1], curl, out=hz[beg:end, :-1])
+
+    def _update_e_te(self, row_beg, row_end):
+        """ ex += ce/dy d(hz)/dy ; ey -= ce/dx d(hz)/dx """
+        hz, ex, ey = (self.fields[name] for name in MODES['TE'])
+        coef = self.coefficients
+        beg, end = max(row_beg, 1), min(row_end, self.shape[0] - 1)
+        if end > beg:
+            tmp = self._tmp(0, beg, end)[:, :-1]
+            np.subtract(hz[beg:end, :-1], hz[beg - 1:end - 1, :-1], out=tmp)
+            np.multiply(tmp, coef['ce_y'][beg:end, :-1], out=tmp)
+            np.add(ex[beg:end, :-1], tmp, out=ex[beg:end, :-1])
+
+            tmp = self._tmp(1, beg, end)[:, 1:-1]
+            np.subtract(hz[beg:end, 1:-1], hz[beg:end, :-2], out=tmp)
+            np.multiply(tmp, coef['ce_x'][beg:end, 1:-1], out=tmp)
+            np.subtract(ey[beg:end, 1:-1], tmp, out=ey[beg:end, 1:-1])
+
+
+class YeeSolver2D(YeeKernels):
+    """
+    Advances the fields of a 2D Yee grid in time.
+
+    Every array has the shape of the PML-extended grid, with rows along
+    y and columns along x. Component [j, i] sits at
+
+    ===========  =======================  =======================
+    Mode         E                        H
+    ===========  =======================  =======================
+    TM           ez at (i, j)             hx at (i, j + 1/2),
+                                          hy at (i + 1/2, j)
+    TE           ex at (i + 1/2, j),      hz at (i + 1/2, j + 1/2)
+                 ey at (i, j + 1/2)
+    ===========  =======================  =======================
+
+    and the outermost cells are perfect electric conductors.
+
+    All field, coefficient and scratch arrays are allocated up front; a
+    step makes no new arrays, only views. The updates work on bands of
+    rows, :meth:`update_h` and :meth:`update_e`, so that the same
+    kernels can be split up between workers.
+
+    Functions added with :meth:`add_hook` run after every H or E
+    half-step or at the end of a step, and are how absorbing layers,
+    sources and monitors attach to the solver. The arrays they change
+    over a run are registered with :meth:`register_state`.
+
+    How the bands are run is up to the backend; the default
+    :class:`SerialBackend` runs the whole grid as one band.
+    """
+
+    def __init__(self, params, mode='TM', setup=None, cache=None,
+                 allocator=zeros, precision='double'):
+        """
+        :param params:    The simulation parameters
+        :type  params:    fdtd.define_general_parameters.Params
+        :param mode:      'TM' or 'TE'
+        :param setup:     An already prepared set-up to use
+        :type  setup:     fdtd.prepare.PreparedSetup
+        :param cache:     Where to look up the set-up when none is given
+        :type  cache:     fdtd.setup_cache.SetupCache
+        :param allocator: Called as allocator(name, shape, dtype) to
+                          create each field and coefficient array
+        :param precision: The data types to use
+        :type  precision: fdtd.precision.PrecisionPolicy or string
+        """
+        if mode not in MODES:
+            raise ValueError("Unknown mode '{}', expected one of {}"
+                             .format(mode, sorted(MODES)))
+        if setup is None:
+            setup = (cache.get(params) if cache is not None
+                     else prepare_setup(params))
+        self.params = params
+        self.setup = setup
+        self.precision = get_policy(precision)
+        self.steps = setup.steps
+        self.n = 0
+        self.hooks = {'post_h': [], 'post_e': [], 'post_step': []}
+        self.backend = SerialBackend()
+
+        shape = setup.ce.shape
+        fields = {name: allocator(name, shape, self.precision.field)
+                  for name in MODES[mode]}
+
+        # Per-axis update coefficients, so a step multiplies once
+        coefficients = {}
+        for (name, coef, spacing) in [('ce_x', setup.ce, setup.dx),
+                                      ('ce_y', setup.ce, setup.dy),
+                                      ('ch_x', setup.ch, setup.dx),
+                                      ('ch_y', setup.ch, setup.dy)]:
+            coefficients[name] = allocator(name, shape,
+                                           self.precision.coefficient)
+            np.divide(coef, spacing, out=coefficients[name])
+        super().__init__(mode, fields, coefficients)
+
+        # Arrays that together with n make up the state of a run
+        self.state = {}
+        for (name, field) in fields.items():
+            self.register_state('fields/' + name, field)
+
+    @property
+    def cells(self):
+        """
+        The number of cells in the grid
+        """
+        return self.shape[0] * self.shape[1]
+
+    def cell(self, x_pos, y_pos):
+        """
+        The solver cell at a position given in Params coordinates
+
+        :param x_pos: x coordinate, on the scale of Params.get_x_arr
+        :param y_pos: y coordinate, on the scale of Params.get_y_arr
+        :return: (row, column) in the PML-extended grid
+        """
+        (row, col) = self.params.nearest_index(x_pos, y_pos)
+        width = self.setup.pmlwidth
+        return (row + width, col + width)
+
+    def register_state(self, name, array):
+        """
+        Add an array to the state of the run, which checkpoints save
+        and restore in place. Anything that changes over a run, such as
+        absorbing layers and monitors, registers its arrays here.
+
+        :param name:  A name unique to the array, e.g. 'fields/ez'
+        :param array: The live array
+        """
+        if name in self.state:
+            raise ValueError("State '{}' is already registered".format(name))
+        self.state[name] = array
+
+    def add_hook(self, stage, hook):
+        """
+        Call hook(solver) after every half-step, or after the step
+        counter has advanced
+
+        :param stage: 'post_h', 'post_e' or 'post_step'
+        :param hook:  The function to call
+        """
+        self.hooks[stage].append(hook)
+
+    def _run_hooks(self, stage):
+        """ Call every hook registered for stage """
+        for hook in self.hooks[stage]:
+            hook(self)
+
+    def step(self):
+        """
+        Advance the fields by one time step
+        """
+        self.backend.dispatch(self, 'h')
+        self._run_hooks('post_h')
+        self.backend.dispatch(self, 'e')
+        self._run_hooks('post_e')
+        self.n += 1
+        self._run_hooks('post_step')
+
+    def run(self, steps=None):
+        """
+        Take a number of time steps
+
+        :param steps: How many; defaults to what is left of the step
+                      count from Params.z_s
+        :type  steps: int
+        :rtype: RunStats
+        """
+        if steps is None:
+            steps = max(self.steps - self.n, 0)
+        self.backend.reset_timing()
+        start = time.perf_counter()
+        for _ in range(steps):
+            self.step()
+        seconds = time.perf_counter() - start
+        rate = self.cells * steps / seconds if seconds > 0 else float('inf')
+        return RunStats(steps, seconds, rate, self.backend.efficiency())
+
+
+class SerialBackend:
+    """
+    Runs each half-step as a single band in the calling thread
+    """
+
+    def dispatch(self, solver, stage):
+        # pylint: disable=no-self-use
+        """
+        Run a half-step on every row
+
+        :param solver: The solver to advance
+        :param stage:  'h' or 'e'
+        """
+        if stage == 'h':
+            solver.update_h(0, solver.shape[0])
+        else:
+            solver.update_e(0, solver.shape[0])
+
+    def reset_timing(self):
+        """
+        Nothing is timed
+        """
+
+    def efficiency(self):
+        # pylint: disable=no-self-use
+        """
+        One thread does all the work
+        """
+        return 1.0
+
+    def close(self):
+        """
+        Nothing to release
+        """
@@ -0,0 +1,228 @@
+"""
+.. module:: fdtd.sources
+   :platform: Unix, Windows
+   :synopsis: Point, line and region sources whose waveforms are
+              tabulated before the run and injected with one scaled add
+              per field and step.
+"""
+import numpy as np
+
+
+def gaussian(width, delay=None):
+    """
+    A Gaussian pulse exp(-((t - delay) / width)^2)
+
+    :param width: The 1/e half width [s]
+    :param delay: Time of the peak [s]; four widths by default, so the
+                  pulse starts from almost nothing
+    :return: The waveform, a function of an array of times
+    """
+    delay = 4 * width if delay is None else delay
+
+    def waveform(times):
+        """ The Gaussian pulse at times """
+        return np.exp(-((times - delay) / width) ** 2)
+    return waveform
+
+
+def ricker(frequency, delay=None):
+    """
+    A Ricker wavelet, the second derivative of a Gaussian, with no DC
+    content
+
+    :param frequency: The peak frequency [Hz]
+    :param delay:     Time of the peak [s]; 1.5 periods by default
+    :return: The waveform, a function of an array of times
+    """
+    delay = 1.5 / frequency if delay is None else delay
+
+    def waveform(times):
+        """ The Ricker wavelet at times """
+        arg = (np.pi * frequency * (times - delay)) ** 2
+        return (1 - 2 * arg) * np.exp(-arg)
+    return waveform
+
+
+def continuous(frequency, ramp=None, phase=0.0):
+    """
+    A sine wave switched on smoothly, to keep the start from exciting
+    all frequencies
+
+    :param frequency: The frequency [Hz]
+    :param ramp:      How long the switch-on takes [s]; three periods by
+                      default
+    :param phase:     Phase at t = 0 [rad], e.g. for phased arrays
+    :return: The waveform, a function of an array of times
+    """
+    ramp = 3 / frequency if ramp is None else ramp
+
+    def waveform(times):
+        """ The ramped sine wave at times """
+        envelope = 0.5 * (1 - np.cos(np.pi * np.clip(times / ramp, 0, 1)))
+        return envelope * np.sin(2 * np.pi * frequency * times + phase)
+    return waveform
+
+
+class SourceSet:
+    """
+    Every source on one solver.
+
+    Each source has a waveform and a set of cells with weights. When
+    :meth:`attach` is called, the waveforms are evaluated once into a
+    table per field with a row per step and a column per source on that
+    field, and the cells of all sources on a field are concatenated with
+    the column that drives each one. A step then takes that step's row
+    by the cells' columns, scales it by the weights, and adds it to the
+    field with one np.add.at, however many sources there are.
+
+    Sources are soft: the table value times the weight is added to the
+    field each step. Sources on E fields are added after the E update,
+    on H fields after the H update, at the time that field has reached.
+    """
+
+    def __init__(self, solver, steps=None):
+        """
+        :param solver: The solver to drive
+        :type  solver: fdtd.solver.YeeSolver2D
+        :param steps:  Steps to tabulate; by default the solver's step
+                       count. No source is added after that.
+        """
+        self.solver = solver
+        self.steps = steps or solver.steps
+        self.waveforms = []
+        self.table = None
+        self._cells = {}
+        self._injections = {}
+
+    def default_field(self):
+        """
+        The field out of the plane of the grid, ez in TM and hz in TE
+        """
+        return 'ez' if self.solver.mode == 'TM' else 'hz'
+
+    def _add(self, field, rows, cols, weights, waveform):
+        """ Add a source over the given cells """
+        if self.table is not None:
+            raise RuntimeError("Sources cannot be added after attach()")
+        field = field or self.default_field()
+        if field not in self.solver.fields:
+            raise ValueError("Unknown field '{}'".format(field))
+        flat = np.ravel_multi_index((np.ravel(rows), np.ravel(cols)),
+                                    self.solver.shape)
+        weights = np.broadcast_to(np.ravel(weights), flat.shape)
+        self._cells.setdefault(field, []).append(
+            (flat, weights, len(self.waveforms)))
+        self.waveforms.append(waveform)
+        return len(self.waveforms) - 1
+
+    def add_point(self, x_pos, y_pos, waveform, amplitude=1.0, field=None):
+        """
+        A source at one cell
+
+        :param x_pos:     x coordinate, in Params coordinates
+        :param y_pos:     y coordinate
+        :param waveform:  A function of an array of times, e.g. from
+                          :func:`gaussian`
+        :param amplitude: Scale of the waveform
+        :param field:     The field to drive; out of plane by default
+        :return: The source's number
+        """
+        (row, col) = self.solver.cell(x_pos, y_pos)
+        return self._add(field, [row], [col], amplitude, waveform)
+
+    def add_line(self, start, end, waveform, amplitude=1.0, field=None):
+        """
+        A source along a straight line of cells, all in phase
+
+        :param start:     (x, y) of one end
+        :param end:       (x, y) of the other end
+        :param waveform:  A function of an array of times
+        :param amplitude: Scale of the waveform
+        :param field:     The field to drive; out of plane by default
+        :return: The source's number
+        """
+        (row0, col0) = self.solver.cell(*start)
+        (row1, col1) = self.solver.cell(*end)
+        num = max(abs(row1 - row0), abs(col1 - col0)) + 1
+        rows = np.rint(np.linspace(row0, row1, num)).astype(int)
+        cols = np.rint(np.linspace(col0, col1, num)).astype(int)
+        return self._add(field, rows, cols, amplitude, waveform)
+
+    def add_region(self, corner, opposite, waveform, amplitude=1.0,
+                   profile=None, field=None):
+        """
+        A source over a rectangle of cells
+
+        :param corner:    (x, y) of one corner
+        :param opposite:  (x, y) of the opposite corner
+        :param waveform:  A function of an array of times
+        :param amplitude: Scale of the waveform
+        :param profile:   A function of arrays of x and y, in Params
+                          coordinates, giving each cell's weight; uniform
+                          by default
+        :param field:     The field to drive; out of plane by default
+        :return: The source's number
+        """
+        (row0, col0) = self.solver.cell(*corner)
+        (row1, col1) = self.solver.cell(*opposite)
+        (row0, row1) = sorted((row0, row1))
+        (col0, col1) = sorted((col0, col1))
+        (rows, cols) = np.mgrid[row0:row1 + 1, col0:col1 + 1]
+        weights = np.full(rows.shape, float(amplitude))
+        if profile is not None:
+            params = self.solver.params
+            width = self.solver.setup.pmlwidth
+            x_pos = params.get_x_arr()[cols - width]
+            y_pos = params.get_y_arr()[rows - width]
+            weights *= profile(x_pos, y_pos)
+        return self._add(field, rows, cols, weights, waveform)
+
+    def times(self, field):
+        """
+        The time a field has reached when each step's source is added
+
+        :param field: The field name
+        :return: The times of steps 0 to steps - 1 [s]
+        """
+        # H is half a step behind E in the leapfrog
+        offset = 0.5 if field.startswith('h') else 1.0
+        return (np.arange(self.steps) + offset) * self.solver.setup.dt
+
+    def attach(self):
+        """
+        Tabulate the waveforms, rasterize the sources and start
+        injecting them
+        """
+        dtype = self.solver.precision.field
+        self.table = {}
+        for (field, cells) in self._cells.items():
+            table = np.empty((self.steps, len(cells)), dtype)
+            times = self.times(field)
+            for (local, (_, _, column)) in enumerate(cells):
+                table[:, local] = self.waveforms[column](times)
+            flat = np.concatenate([flat for (flat, _, _) in cells])
+            weights = np.concatenate([weights for (_, weights, _) in cells])
+            owner = np.concatenate([np.full(len(flat), local)
+                                    for (local, (flat, _, _))
+                                    in enumerate(cells)])
+            self.table[field] = table
+            self._injections[field] = (
+                self.solver.fields[field].reshape(-1), flat,
+                weights.astype(dtype), owner, np.empty(len(flat), dtype))
+            stage = 'post_h' if field.startswith('h') else 'post_e'
+            self.solver.add_hook(stage, self._hook(field))
+        return self
+
+    def _hook(self, field):
+        """ The hook that drives one field """
+        (target, flat, weights, owner, amplitude) = self._injections[field]
+        table = self.table[field]
+
+        def inject(solver):
+            """ Add this step's sources to the field """
+            if solver.n >= len(table):
+                return
+            np.take(table[solver.n], owner, out=amplitude, mode='clip')
+            np.multiply(amplitude, weights, out=amplitude)
+            np.add.at(target, flat, amplitude)
+        return inject
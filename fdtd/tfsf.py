@@ -0,0 +1,241 @@
+"""
+.. module:: fdtd.tfsf
+   :platform: Unix, Windows
+   :synopsis: Total-field/scattered-field plane wave injection, driven by
+              a one dimensional FDTD line run alongside the solver.
+"""
+import numpy as np
+
+ABSORBER_CELLS = 40
+""" Length of the lossy layer that ends the auxiliary line """
+
+ABSORBER_ORDER = 3
+
+
+class TFSF:
+    """
+    Illuminates a rectangle of a TM solver with a plane wave.
+
+    Inside the rectangle the solver holds the total field, outside only
+    the field scattered by whatever is in it. The incident wave comes
+    from a 1D FDTD line along the direction of travel, stepped together
+    with the solver, with a hard source at its start and a lossy layer
+    at its end. Every E and H node next to the edge of the rectangle
+    has its distance along the line, and the interpolation weights
+    between the two nearest line nodes, computed up front. Each step
+    then corrects those nodes with one gather from the line and one
+    np.add.at per field, so the cost grows with the perimeter only.
+
+    The line's material is that of the grid at the first corner of the
+    rectangle the wave reaches, so the rectangle's edges must lie in a
+    uniform background. Its cells are as long as the grid spacing along
+    the axis nearest the direction of travel, which makes the incident
+    wave exact along the axes. At other angles the 1D and 2D grids'
+    dispersion differs slightly and a little of the wave leaks into
+    the scattered field.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, solver, corner, opposite, waveform, angle=0.0,
+                 amplitude=1.0, steps=None):
+        """
+        :param solver:    The solver to illuminate; TM mode only
+        :type  solver:    fdtd.solver.YeeSolver2D
+        :param corner:    (x, y) of one corner of the total field region,
+                          in Params coordinates
+        :param opposite:  (x, y) of the opposite corner
+        :param waveform:  The incident E field at the start of the line,
+                          a function of an array of times such as
+                          fdtd.sources.gaussian
+        :param angle:     Direction of travel, counter-clockwise from +x
+                          [rad]
+        :param amplitude: Scale of the waveform
+        :param steps:     Steps to tabulate the waveform for; by default
+                          the solver's step count. The line's source is
+                          zero after that.
+        """
+        if solver.mode != 'TM':
+            raise ValueError("TF/SF injection needs a TM solver, not {}"
+                             .format(solver.mode))
+        (row0, col0) = solver.cell(*corner)
+        (row1, col1) = solver.cell(*opposite)
+        (self.rows, self.cols) = (tuple(sorted((row0, row1))),
+                                  tuple(sorted((col0, col1))))
+        width = solver.setup.pmlwidth
+        if (min(self.rows[0], self.cols[0]) <= width or
+                self.rows[1] >= solver.shape[0] - width - 1 or
+                self.cols[1] >= solver.shape[1] - width - 1):
+            raise ValueError("The total field region must be inside the "
+                             "absorbing layers")
+        self.solver = solver
+        (cos, sin) = (np.cos(angle), np.sin(angle))
+        (dx, dy) = (solver.setup.dx, solver.setup.dy)
+        self.spacing = dx if abs(cos) >= abs(sin) else dy
+
+        nodes = self._boundary_nodes(cos, sin)
+        # Distances along the line, in line cells, from the corner the
+        # wave reaches first, which sits a few cells past the source
+        for node in nodes:
+            node['distance'] = (cos * node['x'] * dx +
+                                sin * node['y'] * dy) / self.spacing
+        start = min(node['distance'].min() for node in nodes)
+        length = int(np.ceil(max(node['distance'].max()
+                                 for node in nodes) - start))
+        size = length + ABSORBER_CELLS + 8
+
+        # The background at the first corner the wave reaches
+        first = (self.rows[0] if sin >= 0 else self.rows[1],
+                 self.cols[0] if cos >= 0 else self.cols[1])
+        (ce_b, ch_b) = (solver.setup.ce[first], solver.setup.ch[first])
+        self.line_e = np.zeros(size)
+        self.line_h = np.zeros(size)
+        self._line_coefficients(size, ce_b, ch_b)
+        self._tmp = np.empty(size - 1)
+
+        times = (np.arange(steps or solver.steps) + 1) * solver.setup.dt
+        self.table = amplitude * waveform(times)
+
+        self._groups = {'post_h': [], 'post_e': []}
+        for node in nodes:
+            # H nodes sit half a line cell after the E node of the same
+            # index
+            place = node['distance'] - start + 3 - (
+                0.5 if node['stage'] == 'post_e' else 0.0)
+            index = np.floor(place).astype(int)
+            self._groups[node['stage']].append(
+                (node['field'], node['flat'], index, place - index,
+                 node['factor']))
+        self._merge_groups()
+
+        solver.register_state('tfsf/line_e', self.line_e)
+        solver.register_state('tfsf/line_h', self.line_h)
+        solver.add_hook('post_h', self.update_h)
+        solver.add_hook('post_e', self.update_e)
+
+    def _boundary_nodes(self, cos, sin):
+        """
+        Every node whose update reads across the edge of the total
+        field region, with its position in cells, the field it is in and
+        the factor its correction is scaled by
+        """
+        solver = self.solver
+        coef = solver.coefficients
+        (row0, row1) = self.rows
+        (col0, col1) = self.cols
+        rows = np.arange(row0, row1 + 1)
+        cols = np.arange(col0, col1 + 1)
+        nodes = []
+
+        def node(field, stage, node_rows, node_cols, x_pos, y_pos, factor):
+            """ One edge's worth of nodes """
+            (node_rows, node_cols) = np.broadcast_arrays(node_rows,
+                                                         node_cols)
+            nodes.append({'field': field, 'stage': stage,
+                          'flat': np.ravel_multi_index(
+                              (node_rows, node_cols), solver.shape),
+                          'x': np.broadcast_to(x_pos, node_rows.shape),
+                          'y': np.broadcast_to(y_pos, node_rows.shape),
+                          'factor': factor[node_rows, node_cols]})
+
+        # H just outside the edges read E inside: remove the incident E
+        node('hy', 'post_h', rows, col0 - 1, col0, rows, -coef['ch_x'])
+        node('hy', 'post_h', rows, col1, col1, rows, coef['ch_x'])
+        node('hx', 'post_h', row0 - 1, cols, cols, row0, coef['ch_y'])
+        node('hx', 'post_h', row1, cols, cols, row1, -coef['ch_y'])
+        # E just inside the edges read H outside: add the incident H,
+        # which is (sin, -cos) / eta times the line's H
+        node('ez', 'post_e', rows, col0, col0 - 0.5, rows,
+             cos * coef['ce_x'])
+        node('ez', 'post_e', rows, col1, col1 + 0.5, rows,
+             -cos * coef['ce_x'])
+        node('ez', 'post_e', row0, cols, cols, row0 - 0.5,
+             sin * coef['ce_y'])
+        node('ez', 'post_e', row1, cols, cols, row1 + 0.5,
+             -sin * coef['ce_y'])
+        return nodes
+
+    def _line_coefficients(self, size, ce_b, ch_b):
+        """
+        Update coefficients of the line, lossy over its last cells so
+        the wave leaves without reflecting
+        """
+        place = np.clip((np.arange(size) - (size - ABSORBER_CELLS))
+                        / ABSORBER_CELLS, 0, 1)
+        # Loss per half step, sigma dt / 2 eps, graded and matched
+        # between E and H; H nodes sit between E nodes
+        loss = 0.5 * place ** ABSORBER_ORDER
+        h_loss = 0.5 * ((place[:-1] + place[1:]) / 2) ** ABSORBER_ORDER
+        self._e_keep = (1 - loss) / (1 + loss)
+        self._e_curl = ce_b / self.spacing / (1 + loss)
+        self._h_keep = (1 - h_loss) / (1 + h_loss)
+        self._h_curl = ch_b / self.spacing / (1 + h_loss)
+
+    def _merge_groups(self):
+        """
+        Concatenate the nodes of each stage and field, so each is
+        corrected with one gather and one scatter
+        """
+        merged = {}
+        for (stage, groups) in self._groups.items():
+            fields = {}
+            for (field, flat, index, frac, factor) in groups:
+                fields.setdefault(field, []).append(
+                    (flat, index, frac, factor))
+            merged[stage] = []
+            for (field, parts) in fields.items():
+                (flat, index, frac, factor) = (
+                    np.concatenate([part[k] for part in parts])
+                    for k in range(4))
+                merged[stage].append(
+                    (self.solver.fields[field].reshape(-1), flat, index,
+                     index + 1, (1 - frac) * factor, frac * factor,
+                     np.empty(len(flat)), np.empty(len(flat))))
+        self._groups = merged
+
+    @property
+    def perimeter(self):
+        """
+        The number of node corrections made each step
+        """
+        return sum(len(group[1]) for groups in self._groups.values()
+                   for group in groups)
+
+    @staticmethod
+    def _correct(groups, line):
+        """ Add the interpolated, scaled incident field at each node """
+        for (target, flat, lower, upper, w_lower, w_upper, value,
+             tmp) in groups:
+            np.take(line, lower, out=value, mode='clip')
+            np.multiply(value, w_lower, out=value)
+            np.take(line, upper, out=tmp, mode='clip')
+            np.multiply(tmp, w_upper, out=tmp)
+            np.add(value, tmp, out=value)
+            np.add.at(target, flat, value)
+
+    def update_h(self, solver):
+        # pylint: disable=unused-argument
+        """
+        Correct H next to the edges, then advance the line's H; a
+        post_h hook
+        """
+        self._correct(self._groups['post_h'], self.line_e)
+        tmp = self._tmp
+        np.subtract(self.line_e[1:], self.line_e[:-1], out=tmp)
+        np.multiply(tmp, self._h_curl, out=tmp)
+        np.multiply(self.line_h[:-1], self._h_keep, out=self.line_h[:-1])
+        np.subtract(self.line_h[:-1], tmp, out=self.line_h[:-1])
+
+    def update_e(self, solver):
+        """
+        Correct E next to the edges, then advance the line's E and
+        drive its start; a post_e hook
+        """
+        self._correct(self._groups['post_e'], self.line_h)
+        tmp = self._tmp
+        np.subtract(self.line_h[1:], self.line_h[:-1], out=tmp)
+        np.multiply(tmp, self._e_curl[1:], out=tmp)
+        np.multiply(self.line_e[1:], self._e_keep[1:],
+                    out=self.line_e[1:])
+        np.subtract(self.line_e[1:], tmp, out=self.line_e[1:])
+        self.line_e[0] = (self.table[solver.n] if solver.n < len(self.table)
+                          else 0.0)
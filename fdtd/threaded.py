@@ -0,0 +1,151 @@
+"""
+.. module:: fdtd.threaded
+   :platform: Unix, Windows
+   :synopsis: Runs the solver's half-steps as bands of rows on a pool of
+              threads, relying on NumPy releasing the GIL in its ufuncs.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fdtd.solver import SerialBackend, row_bands
+
+DEFAULT_CACHE_BYTES = 2 ** 20
+""" The cache size assumed when it cannot be read from the system """
+
+ARRAYS_PER_BAND = 7
+"""
+How many arrays a band's update streams through: three fields, two
+coefficients and two scratch arrays
+"""
+
+
+def cache_bytes(level=2):
+    """
+    The size of a CPU data cache, read from sysfs on Linux
+
+    :param level: Which cache level
+    :return: The size in bytes, or DEFAULT_CACHE_BYTES if unknown
+    """
+    base = '/sys/devices/system/cpu/cpu0/cache'
+    units = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30}
+    try:
+        for index in sorted(os.listdir(base)):
+            path = os.path.join(base, index)
+            if not index.startswith('index'):
+                continue
+            with open(os.path.join(path, 'level')) as level_file:
+                if int(level_file.read()) != level:
+                    continue
+            with open(os.path.join(path, 'type')) as type_file:
+                if type_file.read().strip() == 'Instruction':
+                    continue
+            with open(os.path.join(path, 'size')) as size_file:
+                size = size_file.read().strip()
+            if size[-1] in units:
+                return int(size[:-1]) * units[size[-1]]
+            return int(size)
+    except (OSError, ValueError):
+        pass
+    return DEFAULT_CACHE_BYTES
+
+
+def tune_band_rows(solver, cache=None):
+    """
+    The number of rows whose working set fits in the cache
+
+    :param solver: The solver whose rows will be banded
+    :param cache:  The cache size in bytes; read from the system by
+                   default
+    """
+    cache = cache or cache_bytes()
+    row_bytes = solver.shape[1] * max(solver.precision.field.itemsize,
+                                      solver.precision.coefficient.itemsize)
+    return max(1, cache // (ARRAYS_PER_BAND * row_bytes))
+
+
+class ThreadBackend:
+    """
+    Splits every half-step of a solver into bands of rows and runs them
+    on a persistent thread pool, all on the solver's own arrays.
+
+    NumPy drops the GIL inside ufunc loops over large arrays, so the
+    bands run in parallel without copying or inter-process traffic.
+    Bands are sized so each one's arrays fit in the L2 cache, and there
+    are at least as many bands as threads.
+
+    Every band records how long it ran, so that :meth:`efficiency` can
+    report how busy the threads were over a run.
+    """
+
+    def __init__(self, solver, threads=None, band_rows=None):
+        """
+        :param solver:    The solver to run
+        :type  solver:    fdtd.solver.YeeSolver2D
+        :param threads:   Size of the pool; one per CPU by default
+        :param band_rows: Rows per band; tuned to the cache by default
+        """
+        self.threads = threads or os.cpu_count() or 1
+        rows = solver.shape[0]
+        band_rows = band_rows or tune_band_rows(solver)
+        count = max(self.threads, -(-rows // band_rows))
+        self.bands = row_bands(rows, count)
+        self._pool = ThreadPoolExecutor(self.threads,
+                                        thread_name_prefix='fdtd-band')
+        self._lock = threading.Lock()
+        self._busy = 0.0
+        self._wall = 0.0
+        self.solver = solver
+        solver.backend = self
+
+    def _run_band(self, kernel, rows):
+        """ Update one band and time it """
+        start = time.perf_counter()
+        kernel(*rows)
+        busy = time.perf_counter() - start
+        with self._lock:
+            self._busy += busy
+
+    def dispatch(self, solver, stage):
+        """
+        Run a half-step on the pool and wait for every band
+
+        :param solver: The solver to advance
+        :param stage:  'h' or 'e'
+        """
+        kernel = solver.update_h if stage == 'h' else solver.update_e
+        start = time.perf_counter()
+        for future in [self._pool.submit(self._run_band, kernel, rows)
+                       for rows in self.bands]:
+            future.result()
+        self._wall += time.perf_counter() - start
+
+    def reset_timing(self):
+        """
+        Start measuring efficiency afresh
+        """
+        self._busy = 0.0
+        self._wall = 0.0
+
+    def efficiency(self):
+        """
+        :return: The time threads spent in kernels over the time they
+                 were available, since the last reset; 1 is perfect
+        """
+        if self._wall <= 0:
+            return None
+        return self._busy / (self._wall * self.threads)
+
+    def close(self):
+        """
+        Shut the pool down and put the solver back to serial updates
+        """
+        self._pool.shutdown()
+        self.solver.backend = SerialBackend()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,70 @@
+"""
+.. module:: phys_util
+   :platform: Unix, Windows
+   :synopsis: Physical units and constants.
+
+By default :mod:`phys_util.units` checks dimensions on every operation.
+For production runs the unit constants can instead be plain floats in
+SI base units, which skips all Unit arithmetic. Choose the mode either
+by setting the environment variable named by :data:`PRODUCTION_ENV_VAR`
+to 1 (or true, yes, on), or by calling :func:`set_production_mode` before
+:mod:`phys_util.units` is first imported.
+"""
+import os
+import sys
+import warnings
+
+PRODUCTION_ENV_VAR = 'FDTD_UNITS_PRODUCTION'
+""" Environment variable that turns on production mode when set to 1 """
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('', '0', 'false', 'no', 'off')
+""" The settings of :data:`PRODUCTION_ENV_VAR` understood, in lower case """
+
+
+def parse_production_mode(value):
+    """
+    Read a setting of :data:`PRODUCTION_ENV_VAR`. Anything not in
+    :data:`TRUE_VALUES` or :data:`FALSE_VALUES` keeps units checked,
+    with a warning, so a typo never turns the checks off.
+
+    :param value: The variable's value, or None if it is not set
+    :type  value: string
+    :return: True for production mode
+    """
+    value = (value or '').strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value not in FALSE_VALUES:
+        warnings.warn('{0}={1!r} is not one of {2} or {3}; keeping units '
+                      'checked'.format(PRODUCTION_ENV_VAR, value,
+                                       TRUE_VALUES, FALSE_VALUES))
+    return False
+
+
+_PRODUCTION_MODE = parse_production_mode(os.environ.get(PRODUCTION_ENV_VAR))
+
+
+def set_production_mode(enabled=True):
+    """
+    Turn production mode on or off. This has to happen before
+    phys_util.units is imported, since that is when the unit constants
+    are created.
+
+    :param enabled: True for plain float units, False for checked units
+    :type  enabled: bool
+    """
+    # pylint: disable=global-statement
+    global _PRODUCTION_MODE
+    enabled = bool(enabled)
+    if 'phys_util.units' in sys.modules and enabled != _PRODUCTION_MODE:
+        raise RuntimeError('phys_util.units has already been imported; '
+                           'set the production mode before importing it')
+    _PRODUCTION_MODE = enabled
+
+
+def is_production_mode():
+    """
+    :return: True if phys_util.units uses plain float units
+    """
+    return _PRODUCTION_MODE
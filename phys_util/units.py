@@ -10,10 +10,22 @@
 """
 # Defines units which we can use as types
 from enum import Enum
+from fractions import Fraction
+import functools
+import inspect
+import numbers
+import re
+import time
 
 import numpy as np
 
-from tags.tags import deprecated
+import phys_util
+
+PRODUCTION_MODE = phys_util.is_production_mode()
+"""
+True if the unit constants at the bottom of this module are plain SI
+floats rather than Units (see :mod:`phys_util`)
+"""
 
 # pylint: disable=no-member
 NUM_TYPES = [int, float, np.int8, np.int16, np.int32, np.int64,
@@ -21,6 +33,9 @@ NUM_TYPES = [int, float, np.int8, np.int16, np.int32, np.int64,
              np.float32, np.float64, np.complex64, np.complex128]
 # pylint: enable=no-member
 
+_NUMBER_TYPE_CACHE = dict.fromkeys(NUM_TYPES, True)
+""" Maps each type seen by Unit._is_number to whether it is numeric """
+
 
 class UnitType(Enum):
     """ Base SI Unit Categories """
@@ -55,6 +70,217 @@ class UnitType(Enum):
             return self.value < other.value
 
 
+class Dimension:
+    """
+    The dimension of a unit, as a fixed-width vector of exponents over
+    the base units in :data:`Dimension.BASES`.
+
+    Dimensions are interned: constructing the same exponent vector twice
+    gives back the same object, so two dimensions are equal exactly when
+    they are identical:
+
+    >>> Dimension((0, 1, 0, -1)) is Dimension((0, 1, 0, -1))
+    True
+
+    Products, quotients and powers are memoized in class-level tables,
+    so after the first time a combination is seen, dimension algebra is
+    a single dict lookup.
+    """
+    __slots__ = ('exponents', '_name', '_symbol', '__weakref__')
+
+    BASES = (UnitType.CHARGE, UnitType.LENGTH, UnitType.MASS, UnitType.TIME)
+    """ The base unit for each position of the exponent vector """
+
+    BASE_NAMES = {UnitType.CHARGE: ('coulomb', 'C'),
+                  UnitType.LENGTH: ('meter', 'm'),
+                  UnitType.MASS: ('kilogram', 'kg'),
+                  UnitType.TIME: ('second', 's')}
+    """ The (name, symbol) pair used to display each base unit """
+
+    _interned = {}
+    _mul_table = {}
+    _div_table = {}
+    _pow_table = {}
+
+    def __new__(cls, exponents):
+        """
+        Look up (or create) the dimension with the given exponents.
+
+        :param exponents: One exponent per entry of :data:`BASES`
+        :type  exponents: (int | Fraction, ...)
+        """
+        exponents = tuple(exponents)
+        try:
+            return cls._interned[exponents]
+        except KeyError:
+            pass
+        if len(exponents) != len(cls.BASES):
+            raise ValueError('Expected {0} exponents, got {1}'
+                             .format(len(cls.BASES), len(exponents)))
+        normalized = tuple(cls._normalize_power(power)
+                           for power in exponents)
+        dim = cls._interned.get(normalized)
+        if dim is None:
+            dim = object.__new__(cls)
+            dim.exponents = normalized
+            dim._name = None
+            dim._symbol = None
+            cls._interned[normalized] = dim
+        cls._interned[exponents] = dim
+        return dim
+
+    def __reduce__(self):
+        return (Dimension, (self.exponents,))
+
+    @staticmethod
+    def _normalize_power(power):
+        """
+        Store integral exponents as ints and the rest as Fractions.
+        """
+        power = Fraction(power)
+        if power.denominator == 1:
+            return int(power)
+        return power
+
+    @classmethod
+    def from_category(cls, category):
+        """
+        Convert a set of (power, UnitType) tuples into a Dimension.
+
+        :param category: A set of tuples of the form (int, UnitType)
+        :type  category: {(int,UnitType)}
+        """
+        if isinstance(category, Dimension):
+            return category
+        exponents = [0] * len(cls.BASES)
+        for (power, unit_type) in category:
+            exponents[cls.BASES.index(unit_type)] += power
+        return cls(exponents)
+
+    @property
+    def category(self):
+        """
+        The dimension as a set of (power, UnitType) tuples, leaving out
+        base units with a power of 0
+        """
+        return {(power, unit_type)
+                for (power, unit_type) in zip(self.exponents, self.BASES)
+                if power != 0}
+
+    @property
+    def name(self):
+        """
+        The dimension written out with base unit names, e.g.
+        'kilogram * meter * second^-2'. Computed on first use.
+        """
+        if self._name is None:
+            self._name = self._join_names(0)
+        return self._name
+
+    @property
+    def symbol(self):
+        """
+        The dimension written out with SI symbols, e.g. 'kg * m * s^-2'.
+        Computed on first use.
+        """
+        if self._symbol is None:
+            self._symbol = self._join_names(1)
+        return self._symbol
+
+    def _join_names(self, which):
+        """
+        Formats the nonzero exponents as a sorted, human readable string.
+
+        :param which: 0 to use base unit names, 1 to use symbols
+        :type  which: int
+        """
+        parts = []
+        for (power, unit_type) in zip(self.exponents, self.BASES):
+            if power == 0:
+                continue
+            base = self.BASE_NAMES[unit_type][which]
+            if power == 1:
+                parts.append(base)
+            else:
+                parts.append('{0}^{1}'.format(base, power))
+        return ' * '.join(sorted(parts))
+
+    def __mul__(self, other):
+        key = (self, other)
+        try:
+            return Dimension._mul_table[key]
+        except KeyError:
+            pass
+        result = Dimension(a + b for (a, b) in zip(self.exponents,
+                                                    other.exponents))
+        Dimension._mul_table[key] = result
+        return result
+
+    def __truediv__(self, other):
+        key = (self, other)
+        try:
+            return Dimension._div_table[key]
+        except KeyError:
+            pass
+        result = Dimension(a - b for (a, b) in zip(self.exponents,
+                                                    other.exponents))
+        Dimension._div_table[key] = result
+        return result
+
+    def __pow__(self, power):
+        key = (self, power)
+        try:
+            return Dimension._pow_table[key]
+        except KeyError:
+            pass
+        power = as_exponent(power)
+        result = Dimension(a * power for a in self.exponents)
+        Dimension._pow_table[key] = result
+        return result
+
+    def __repr__(self):
+        return 'Dimension({0!r})'.format(self.exponents)
+
+
+DIMENSIONLESS = Dimension((0, 0, 0, 0))
+""" The dimension of a pure number """
+
+MAX_EXPONENT_DENOMINATOR = 16
+""" Largest denominator accepted for a float exponent such as 0.5 """
+
+
+def as_exponent(power):
+    """
+    Checks that power can be used as the exponent of a unit.
+
+    Integers and Fractions are accepted as they are. A float is accepted
+    if it is exactly a fraction with a small denominator (0.5, -1.5,
+    0.25); other floats such as 2.2 or 1/3 are ambiguous, so use
+    Fraction(1, 3) for those.
+
+    :param power: The exponent
+    :type  power: int | Fraction | float
+    :return: The exponent as an int, or as a Fraction if not integral
+    :raises ArithmeticError: If power is not an acceptable exponent
+    """
+    if isinstance(power, numbers.Integral):
+        return int(power)
+    if isinstance(power, numbers.Rational):
+        exponent = Fraction(power)
+    elif isinstance(power, numbers.Real) and np.isfinite(power):
+        exponent = Fraction(float(power))
+        if exponent.denominator > MAX_EXPONENT_DENOMINATOR:
+            exponent = None
+    else:
+        exponent = None
+    if exponent is not None:
+        if exponent.denominator == 1:
+            return int(exponent)
+        return exponent
+    raise ArithmeticError('Can only raise units to integral or rational '
+                          'powers, not {0!r}'.format(power))
+
+
 class Unit:
     # pylint: disable=too-few-public-methods
     """
@@ -98,6 +324,16 @@ class Unit:
     444.822 * kg * m * s^-2
     """
 
+    __slots__ = ('_name', '_symbol', '_dimension', '_value')
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        """
+        Lets numpy ufuncs (``np.sqrt``, ``np.abs``, ``ndarray * Unit``,
+        ...) act on the unit's value while keeping track of its
+        dimension. See :func:`_apply_ufunc`.
+        """
+        return _apply_ufunc(ufunc, method, inputs, kwargs)
+
     def __eq__(self, other):
         """
         Defines equality of units by the category and value.
@@ -110,7 +346,7 @@ class Unit:
         """
         if not isinstance(other, Unit):
             return False
-        return self.category == other.category and \
+        return self.dimension is other.dimension and \
             self.value == other.value
 
     def __init__(self, name, symbol, category, value=1):
@@ -126,40 +362,99 @@ class Unit:
         :param category: A set of tuples of the form (int, UnitType),
                          where int is the power of the base unit, and
                          UnitType is a base unit. For example, a meter
-                         would have a category of (1, UnitType.LENGTH)
-        :type category: {(int,UnitType)}
+                         would have a category of (1, UnitType.LENGTH).
+                         A :class:`Dimension` may be passed instead.
+        :type category: {(int,UnitType)} | Dimension
 
         :param value:    This is how the unit is internally stored as a
                          number.
         :type  value:    Number
         """
-        self.name = name
-        self.symbol = symbol
-        self.category = category
-        self.value = value
+        if not isinstance(category, Dimension):
+            category = Dimension.from_category(category)
+        setattr_ = object.__setattr__
+        setattr_(self, '_name', name)
+        setattr_(self, '_symbol', symbol)
+        setattr_(self, '_dimension', category)
+        setattr_(self, '_value', value)
+
+    def __setattr__(self, name, value):
+        """
+        Units are immutable; arithmetic always builds a new Unit.
+        """
+        raise AttributeError("Unit objects are immutable")
+
+    def __hash__(self):
+        return hash((self._dimension, self._value))
+
+    def __reduce__(self):
+        return (Unit, (self._name, self._symbol, self._dimension,
+                       self._value))
+
+    @property
+    def value(self):
+        """ The unit's magnitude, in SI base units """
+        return self._value
+
+    @property
+    def dimension(self):
+        """ The unit's :class:`Dimension` """
+        return self._dimension
+
+    @property
+    def name(self):
+        """
+        The name given at construction, or else the name of the
+        unit's dimension written out in base units
+        """
+        if self._name is None:
+            return self._dimension.name
+        return self._name
+
+    @property
+    def symbol(self):
+        """
+        The symbol given at construction, or else the symbol of the
+        unit's dimension written out in base units
+        """
+        if self._symbol is None:
+            return self._dimension.symbol
+        return self._symbol
+
+    @property
+    def category(self):
+        """
+        The unit's dimension as a set of (power, UnitType) tuples
+        """
+        return self._dimension.category
 
     @staticmethod
     def _is_number(obj):
         """
-        Checks whether a given object is a number as defined in the
-        NUM_TYPES array
+        Checks whether a given object is a number: a Python or numpy
+        numeric scalar. The answer is cached per type, so repeated
+        checks cost one dict lookup.
+
         :param obj: a generic object
         :type obj: object
 
         :returns: True if the object is a number
         """
-        is_number = False
-        for tpe in NUM_TYPES:
-            if isinstance(obj, tpe):
-                is_number = True
-                break
+        tpe = type(obj)
+        try:
+            return _NUMBER_TYPE_CACHE[tpe]
+        except KeyError:
+            pass
+        is_number = issubclass(tpe, (numbers.Number, np.number))
+        _NUMBER_TYPE_CACHE[tpe] = is_number
         return is_number
 
     def __lt__(self, other):
         """
         < operator for units
         """
-        if not isinstance(other, Unit) or not other.category == self.category:
+        if not isinstance(other, Unit) or \
+                other.dimension is not self.dimension:
             error_msg = '{} and {} are not Units of the same type'
             error_msg = '{}, so they can not be compared'.format(error_msg)
             raise ArithmeticError(error_msg.format(type(self), type(other)))
@@ -181,32 +476,28 @@ class Unit:
         if is_number:
             if other == 0:
                 return 0
-            return Unit(self.name, self.symbol, self.category,
-                        self.value * other)
+            return Unit(self._name, self._symbol, self._dimension,
+                        self._value * other)
         elif isinstance(other, np.ndarray):
-            new_arr = np.empty(other.shape, dtype=object)
-            if other.dtype.kind in ['i', 'f', 'c']:
-                for i, item in enumerate(other.flat):
-                    new_arr.flat[i] = Unit(self.name, self.symbol,
-                                           self.category,
-                                           self.value * item)
-            else:
-                for i, item in enumerate(other.flat):
-                    new_arr.flat[i] = self * item
+            if other.dtype.kind in ['b', 'i', 'u', 'f', 'c']:
+                return QuantityArray(self.value * other, self.dimension)
 
+            new_arr = np.empty(other.shape, dtype=object)
+            for i, item in enumerate(other.flat):
+                new_arr.flat[i] = self * item
             return new_arr
+        elif isinstance(other, QuantityArray):
+            return other * self
         elif isinstance(other, Unit):
-            new_cat = Unit._merge_categories(self.category, other.category)
-
+            new_dim = self.dimension * other.dimension
             new_val = self.value * other.value
-            new_unit = Unit(None, None, new_cat, new_val)
 
             # If everything cancels, return a scalar
-            if new_unit.category == set():
-                return new_unit.value
+            if new_dim is DIMENSIONLESS:
+                return new_val
 
             # Otherwise, return a new unit
-            return new_unit
+            return Unit(None, None, new_dim, new_val)
         else:
             raise ArithmeticError("({0}) and ({1}) cannot be multiplied"
                                   .format(type(self), type(other)))
@@ -214,18 +505,30 @@ class Unit:
 
     def __pow__(self, other):
         """
-        Defines raising a unit to an integral power.
+        Defines raising a unit to a power, by scaling the exponents of
+        its dimension and raising its value.
 
-        :param other: The exponent
-        :type other: integer
+        Negative and rational powers work as expected, so for example
+        ``(epsilon * mu) ** Fraction(-1, 2)`` is a speed:
+
+        >>> print((4 * meter * meter) ** 0.5)
+        2.0 * m
+
+        :param other: The exponent. Floats are only accepted if they
+                      are exactly a simple fraction (see
+                      :func:`as_exponent`).
+        :type other: int | Fraction | float
+        :return: A scalar if the power is 0, otherwise a new unit
         """
-        if isinstance(other, int):
-            new_unit = self
-            for _ in range(0, other - 1):
-                new_unit = new_unit * self
-            return new_unit
+        exponent = as_exponent(other)
+        new_dim = self._dimension ** exponent
+        if isinstance(exponent, Fraction):
+            new_val = self._value ** float(exponent)
         else:
-            raise ArithmeticError('Can only raise units to integral powers')
+            new_val = self._value ** exponent
+        if new_dim is DIMENSIONLESS:
+            return new_val
+        return Unit(None, None, new_dim, new_val)
 
     def __rmul__(self, other):
         """
@@ -242,12 +545,16 @@ class Unit:
 
     def __str__(self):
         """
-        Gives a string representation of the unit as 'value * symbol'.
+        Gives a string representation of the unit as 'value * symbol',
+        where the symbol is written out in SI base units.
 
-        :return: the string 'self.value * self.symbol'
+        :return: the string 'self.value * self.dimension.symbol'
         """
-        self._set_name_and_symbol()
-        return "{0} * {1}".format(self.value, self.symbol)
+        return "{0} * {1}".format(self._value, self._dimension.symbol)
+
+    def __repr__(self):
+        return "Unit({0!r}, {1!r}, {2!r}, {3!r})".format(
+            self._name, self._symbol, self._dimension, self._value)
 
     def __truediv__(self, other):
         """
@@ -260,143 +567,31 @@ class Unit:
         :return: A scalar if all the units cancel, otherwise a new unit
                  type
         """
-        if isinstance(other, int) or isinstance(other, float):
+        if self._is_number(other):
+            return self * (1 / other)
+        elif isinstance(other, np.ndarray):
             return self * (1 / other)
+        elif isinstance(other, QuantityArray):
+            return other.__rtruediv__(self)
         elif isinstance(other, Unit):
-            new_cat = set()
-            new_val = 1 / other.value
-            for (power, unit_type) in other.category:
-                new_cat = new_cat.union({(-power, unit_type)})
-            div_unit = Unit(other.name, other.symbol, new_cat, new_val)
-            return self * div_unit
+            new_dim = self.dimension / other.dimension
+            new_val = self.value / other.value
+            if new_dim is DIMENSIONLESS:
+                return new_val
+            return Unit(None, None, new_dim, new_val)
 
-    @staticmethod
-    def _format_name(unit, power):
+    def __rtruediv__(self, other):
         """
-        Quick formatting of a unit,power pair into a string.
+        Defines division of scalars or arrays by a unit.
 
-        Mainly used to get rid of (^1) in name and symbol strings
+        :param other: The dividend
+        :type  other: number | np.ndarray
 
-        :param unit:  Either the name or symbol of a unit
-        :type  unit:  String
-        :param power: A power of a unit
-        :type  power: Integer
-        :return: The unit name if the power is 1, otherwise 'unit^power'
+        :return: A new unit (or array of units) with the inverse category
         """
-        if power == 1:
-            return unit
-        else:
-            return '{0}^{1}'.format(unit, power)
-
-    @staticmethod
-    def _name_list_to_string(elems):
-        """
-        Formats a list of units into a human readable string, separated
-        by spaces.
-
-        :param elems: The list of units
-        :type  elems: [Unit]
-        :return: A human readable string of units raised to powers
-        """
-        elem_string = ""
-        for (i, elem) in enumerate(elems):
-            if i == 0:
-                elem_string = elem
-                continue
-            elem_string += " * {0}".format(elem)
-        return elem_string
-
-    @staticmethod
-    def _merge_categories(category1, category2):
-        """
-        Merge two unit categories.
-
-        :param category1: A set of tuples of the form (int, UnitType),
-                          where int is the power of the base unit,
-                          and UnitType is a base unit.
-        :type  category1: {(int,UnitType)}
-        :param category2: A set of tuples to merge with category1
-        :type  category2: {(int,UnitType)}
-        :return: If all unittypes are distinct, this is just the union of
-                the two categories. If a tuple in each shares a unittype,
-                then the merged category contains (pow1 + pow2, UnitType),
-                where powI is the exponent of the i'th tuple
-        """
-        category_list = []
-        for tpl in category1:
-            category_list.append(tpl)
-        for tpl in category2:
-            category_list.append(tpl)
-
-        category_list = sorted(category_list, key=lambda tpl: tpl[1])
-
-        prv_powr = 0
-        prv_unit = None
-        new_cat = set()
-        for (i, cur_cat) in enumerate(category_list):
-            cur_powr = cur_cat[0]
-            cur_unit = cur_cat[1]
-            new_powr = cur_powr
-            if i == 0:
-                prv_powr = cur_powr
-                prv_unit = cur_unit
-                new_cat.add((new_powr, cur_unit))
-                continue
-
-            if cur_unit == prv_unit:
-                new_powr = prv_powr + cur_powr
-                new_cat.remove((prv_powr, prv_unit))
-
-            if new_powr != 0:
-                new_cat.add((new_powr, cur_unit))
-
-            prv_powr = cur_powr
-            prv_unit = cur_unit
-
-        return new_cat
-
-    def _set_name_and_symbol(self):
-        """
-        Constructs the name and symbol based on the tuples in category.
-        """
-        names = []
-        symbs = []
-        for (power, unit_type) in self.category:
-            # if power == 0:
-            #     # remove items with a power of 0
-            #     self.category.remove((power,unit_type))
-            #     continue
-            # Construct the name and symbol strings
-            if unit_type == UnitType.CHARGE:
-                names.append(Unit._format_name('coulomb', power))
-                symbs.append(Unit._format_name('C', power))
-            if unit_type == UnitType.LENGTH:
-                names.append(Unit._format_name('meter', power))
-                symbs.append(Unit._format_name('m', power))
-            if unit_type == UnitType.MASS:
-                names.append(Unit._format_name('kilogram', power))
-                symbs.append(Unit._format_name('kg', power))
-            if unit_type == UnitType.TIME:
-                names.append(Unit._format_name('second', power))
-                symbs.append(Unit._format_name('s', power))
-        names = sorted(names)
-        symbs = sorted(symbs)
-        self.name = Unit._name_list_to_string(names)
-        self.symbol = Unit._name_list_to_string(symbs)
-
-    @deprecated
-    def _remove_cancellations(self):
-        """
-        Removes entries from self.category that have a power of 0.
-        """
-        categories = set()
-        for cat in self.category:
-            categories.add(cat)
-        for (power, unit_type) in categories:
-            if power == 0:
-                # remove items with a power of 0
-                self.category.remove((power, unit_type))
-                continue
+        inverse = Unit(None, None, DIMENSIONLESS / self.dimension,
+                       1 / self.value)
+        return other * inverse
 
     def __add__(self, other):
         """
@@ -406,11 +601,11 @@ class Unit:
         :type  other: Unit
         :return: A unit of the same type, or 0 if both sum to 0
         """
-        if isinstance(other, Unit) and other.category == self.category:
+        if isinstance(other, Unit) and other.dimension is self.dimension:
             if self.value + other.value == 0:
                 return 0
-            return Unit(self.name, self.symbol, self.category,
-                        self.value + other.value)
+            return Unit(self._name, self._symbol, self._dimension,
+                        self._value + other.value)
         else:
             raise ArithmeticError("({0}) and ({1}) don't match units"
                                   .format(self, other))
@@ -419,7 +614,7 @@ class Unit:
         """
         Defines negation of a unit
         """
-        return Unit(self.name, self.symbol, self.category, -self.value)
+        return Unit(self._name, self._symbol, self._dimension, -self._value)
 
     def __sub__(self, other):
         """
@@ -431,98 +626,838 @@ class Unit:
         :type  other: Unit
         :return: A unit of the same type, or 0 if both sum to 0
         """
-        if isinstance(other, Unit) and other.category == self.category:
+        if isinstance(other, Unit) and other.dimension is self.dimension:
             return self + (-other)
         else:
             raise ArithmeticError("({0}) and ({1}) don't match units"
                                   .format(self, other))
 
 
-def parse_dimensions(string):
+class QuantityArray:
+    """
+    An array of values that all share a single unit.
+
+    Multiplying a :class:`Unit` by a numeric ``np.ndarray`` gives a
+    QuantityArray. The values are kept in one contiguous float64 (or
+    complex) buffer with a single dimension, rather than one Unit object
+    per element, so arithmetic, slicing and broadcasting all run at
+    numpy speed:
+
+    >>> lengths = np.array([1., 2., 3.]) * meter
+    >>> print(lengths[1:] / meter)
+    [2. 3.]
+
+    As with Units, the result is a plain ndarray once all of the units
+    cancel. Indexing a single element gives back a :class:`Unit`.
+    """
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        """
+        Runs numpy ufuncs on the raw buffer, propagating the dimension.
+        See :func:`_apply_ufunc`.
+        """
+        return _apply_ufunc(ufunc, method, inputs, kwargs)
+
+    def __array_function__(self, func, types, args, kwargs):
+        """
+        Runs the numpy functions registered in ``_HANDLED_FUNCTIONS``
+        (reductions, ``ones_like``, ``concatenate``, ...) on the raw
+        buffer, keeping the unit.
+        """
+        if func not in _HANDLED_FUNCTIONS:
+            return NotImplemented
+        return _HANDLED_FUNCTIONS[func](*args, **kwargs)
+
+    def __init__(self, value, dimension):
+        """
+        Wraps an existing array buffer with a unit dimension.
+
+        :param value:     The numeric values, in SI base units
+        :type  value:     np.ndarray
+
+        :param dimension: The dimension shared by every element of the
+                          array, or an equivalent set of (int, UnitType)
+                          tuples
+        :type  dimension: Dimension | {(int,UnitType)}
+        """
+        value = np.asarray(value)
+        if value.dtype.kind not in ['f', 'c']:
+            value = value.astype(np.float64)
+        self.value = value
+        self.dimension = Dimension.from_category(dimension)
+
+    @property
+    def category(self):
+        """
+        The array's dimension as a set of (power, UnitType) tuples
+        """
+        return self.dimension.category
+
+    @staticmethod
+    def _wrap(value, dimension):
+        """
+        Builds a QuantityArray, or returns the bare array if the
+        dimension cancelled out completely.
+        """
+        if dimension is DIMENSIONLESS:
+            return value
+        return QuantityArray(value, dimension)
+
+    @property
+    def shape(self):
+        """ The shape of the underlying buffer """
+        return self.value.shape
+
+    @property
+    def ndim(self):
+        """ The number of dimensions of the underlying buffer """
+        return self.value.ndim
+
+    @property
+    def size(self):
+        """ The number of elements in the underlying buffer """
+        return self.value.size
+
+    @property
+    def dtype(self):
+        """ The dtype of the underlying buffer """
+        return self.value.dtype
+
+    def __len__(self):
+        return len(self.value)
+
+    def __getitem__(self, key):
+        """
+        Index or slice the array.
+
+        :return: A Unit for a single element, otherwise a QuantityArray
+                 viewing the same buffer
+        """
+        item = self.value[key]
+        if np.ndim(item) == 0:
+            return Unit(None, None, self.dimension, item)
+        return QuantityArray(item, self.dimension)
+
+    def __setitem__(self, key, other):
+        """
+        Assign into the array. The assigned values must carry the same
+        units as the array.
+        """
+        if not isinstance(other, (Unit, QuantityArray)) or \
+                other.dimension is not self.dimension:
+            raise ArithmeticError("({0}) and ({1}) don't match units"
+                                  .format(self, other))
+        self.value[key] = other.value
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __mul__(self, other):
+        """
+        Elementwise multiplication by scalars, arrays, units or other
+        QuantityArrays.
+
+        :param other: The object to multiply by
+        :type  other: Unit | QuantityArray | Number | np.ndarray
+        :returns: A QuantityArray, or an ndarray if the units cancel
+        """
+        if isinstance(other, (Unit, QuantityArray)):
+            return self._wrap(self.value * other.value,
+                              self.dimension * other.dimension)
+        elif Unit._is_number(other) or isinstance(other, np.ndarray):
+            return QuantityArray(self.value * other, self.dimension)
+        raise ArithmeticError("({0}) and ({1}) cannot be multiplied"
+                              .format(type(self), type(other)))
+
+    def __rmul__(self, other):
+        return self * other
+
+    def __truediv__(self, other):
+        """
+        Elementwise division by scalars, arrays, units or other
+        QuantityArrays.
+
+        :param other: The divisor
+        :type  other: Unit | QuantityArray | Number | np.ndarray
+        :returns: A QuantityArray, or an ndarray if the units cancel
+        """
+        if isinstance(other, (Unit, QuantityArray)):
+            return self._wrap(self.value / other.value,
+                              self.dimension / other.dimension)
+        elif Unit._is_number(other) or isinstance(other, np.ndarray):
+            return QuantityArray(self.value / other, self.dimension)
+        raise ArithmeticError("({0}) and ({1}) cannot be divided"
+                              .format(type(self), type(other)))
+
+    def __rtruediv__(self, other):
+        """
+        Elementwise division of scalars, arrays or units by self.
+        """
+        if isinstance(other, Unit):
+            return self._wrap(other.value / self.value,
+                              other.dimension / self.dimension)
+        elif Unit._is_number(other) or isinstance(other, np.ndarray):
+            return QuantityArray(other / self.value,
+                                 DIMENSIONLESS / self.dimension)
+        raise ArithmeticError("({0}) and ({1}) cannot be divided"
+                              .format(type(other), type(self)))
+
+    def _check_same_units(self, other):
+        """
+        Raise an ArithmeticError unless other has the same units as self.
+        """
+        if not isinstance(other, (Unit, QuantityArray)) or \
+                other.dimension is not self.dimension:
+            raise ArithmeticError("({0}) and ({1}) don't match units"
+                                  .format(self, other))
+
+    def __add__(self, other):
+        self._check_same_units(other)
+        return QuantityArray(self.value + other.value, self.dimension)
+
+    def __radd__(self, other):
+        return self + other
+
+    def __sub__(self, other):
+        self._check_same_units(other)
+        return QuantityArray(self.value - other.value, self.dimension)
+
+    def __rsub__(self, other):
+        return -(self - other)
+
+    def __neg__(self):
+        return QuantityArray(-self.value, self.dimension)
+
+    def __abs__(self):
+        return QuantityArray(np.abs(self.value), self.dimension)
+
+    def __eq__(self, other):
+        return np.equal(self, other)
+
+    def __ne__(self, other):
+        return np.not_equal(self, other)
+
+    __hash__ = None
+
+    def __lt__(self, other):
+        return np.less(self, other)
+
+    def __le__(self, other):
+        return np.less_equal(self, other)
+
+    def __gt__(self, other):
+        return np.greater(self, other)
+
+    def __ge__(self, other):
+        return np.greater_equal(self, other)
+
+    def __pow__(self, other):
+        """
+        Raise every element to an integral or rational power, in one
+        pass over the buffer.
+
+        :param other: The exponent (see :func:`as_exponent`)
+        :type other: int | Fraction | float
+        """
+        exponent = as_exponent(other)
+        if isinstance(exponent, Fraction):
+            new_val = self.value ** float(exponent)
+        else:
+            new_val = self.value ** exponent
+        return self._wrap(new_val, self.dimension ** exponent)
+
+    def __str__(self):
+        """
+        Gives a string representation of the array as 'value * symbol'.
+        """
+        return "{0} * {1}".format(self.value, self.dimension.symbol)
+
+    def __repr__(self):
+        return "QuantityArray({0!r}, {1!r})".format(self.value,
+                                                    self.dimension)
+
+
+# Ufuncs whose operands must all share one dimension, which the result
+# keeps
+_SAME_DIMENSION_UFUNCS = {np.add, np.subtract, np.maximum, np.minimum,
+                          np.fmax, np.fmin, np.hypot, np.remainder,
+                          np.fmod}
+
+# Ufuncs whose operands must share one dimension, giving a plain result
+_COMPARISON_UFUNCS = {np.equal, np.not_equal, np.less, np.less_equal,
+                      np.greater, np.greater_equal, np.arctan2}
+
+# Single-operand ufuncs that keep the dimension of their input
+_PRESERVING_UFUNCS = {np.negative, np.positive, np.absolute, np.fabs,
+                      np.conjugate, np.rint, np.floor, np.ceil, np.trunc}
+
+# Ufuncs that accept any dimension and give a plain result
+_PREDICATE_UFUNCS = {np.isfinite, np.isinf, np.isnan, np.signbit,
+                     np.sign}
+
+# Single-operand ufuncs that raise the dimension to a fixed power
+_POWER_UFUNCS = {np.sqrt: Fraction(1, 2), np.cbrt: Fraction(1, 3),
+                 np.square: 2, np.reciprocal: -1}
+
+
+def _split_quantity(obj):
+    """
+    Separates a unit-carrying object into its raw value and dimension.
+    Anything else is treated as dimensionless.
+
+    :return: (value, Dimension)
+    """
+    if isinstance(obj, (Unit, QuantityArray)):
+        return obj.value, obj.dimension
+    return obj, DIMENSIONLESS
+
+
+def _wrap_result(value, dimension):
+    """
+    Attaches a dimension to a raw numpy result: a :class:`Unit` for
+    scalars, a :class:`QuantityArray` for arrays, and the bare value if
+    the result is dimensionless.
+    """
+    if dimension is DIMENSIONLESS:
+        return value
+    if isinstance(value, np.ndarray) and value.ndim > 0:
+        return QuantityArray(value, dimension)
+    return Unit(None, None, dimension, value)
+
+
+def _require_same_dimension(name, dims):
+    """
+    Raise an ArithmeticError unless every dimension in dims is the same.
+
+    :return: The shared dimension
+    """
+    for dim in dims[1:]:
+        if dim is not dims[0]:
+            raise ArithmeticError("{0} needs operands with matching units, "
+                                  "got {1}".format(name, dims))
+    return dims[0]
+
+
+def _ufunc_dimension(ufunc, method, values, dims):
+    """
+    Works out the dimension of a ufunc's result from the dimensions of
+    its operands, raising an ArithmeticError if they are incompatible.
+    """
+    name = 'np.{0}'.format(ufunc.__name__)
+    if method in ['reduce', 'accumulate', 'reduceat']:
+        if ufunc not in _SAME_DIMENSION_UFUNCS:
+            raise ArithmeticError("{0}.{1} is not defined for values with "
+                                  "units".format(name, method))
+        return dims[0]
+
+    if ufunc in _SAME_DIMENSION_UFUNCS:
+        return _require_same_dimension(name, dims)
+    elif ufunc in _COMPARISON_UFUNCS:
+        _require_same_dimension(name, dims)
+        return DIMENSIONLESS
+    elif ufunc in _PRESERVING_UFUNCS:
+        return dims[0]
+    elif ufunc in _PREDICATE_UFUNCS:
+        return DIMENSIONLESS
+    elif ufunc in _POWER_UFUNCS:
+        return dims[0] ** _POWER_UFUNCS[ufunc]
+    elif ufunc in [np.multiply, np.matmul]:
+        return dims[0] * dims[1]
+    elif ufunc in [np.true_divide, np.floor_divide]:
+        return dims[0] / dims[1]
+    elif ufunc is np.power:
+        if dims[1] is not DIMENSIONLESS or np.ndim(values[1]) != 0:
+            raise ArithmeticError("{0} needs a single dimensionless "
+                                  "exponent".format(name))
+        if dims[0] is DIMENSIONLESS:
+            return DIMENSIONLESS
+        return dims[0] ** as_exponent(values[1])
+
+    # Everything else (exp, log, sin, ...) only makes sense for pure
+    # numbers
+    if any(dim is not DIMENSIONLESS for dim in dims):
+        raise ArithmeticError("{0} needs dimensionless operands, got {1}"
+                              .format(name, dims))
+    return DIMENSIONLESS
+
+
+def _apply_ufunc(ufunc, method, inputs, kwargs):
+    """
+    Implements ``__array_ufunc__`` for Units and QuantityArrays.
+
+    The operands are stripped to their raw values, the ufunc runs on
+    those at full numpy speed, and the result is given the dimension
+    the operation implies: ``np.sqrt`` halves the exponents, ``np.add``
+    requires matching dimensions, ``np.add.reduce`` (``np.sum``) keeps
+    the unit, and so on. ``out=`` arrays must already carry the
+    dimension of the result.
+    """
+    if ufunc.nout != 1:
+        return NotImplemented
+
+    values = []
+    dims = []
+    for (i, operand) in enumerate(inputs):
+        value, dim = _split_quantity(operand)
+        values.append(value)
+        # The index array of ufunc.at carries no units
+        if not (method == 'at' and i == 1):
+            dims.append(dim)
+    dimension = _ufunc_dimension(ufunc, method, values, dims)
+
+    out = kwargs.get('out')
+    if out is not None:
+        target = out[0]
+        _, out_dim = _split_quantity(target)
+        if out_dim is not dimension:
+            raise ArithmeticError("np.{0} output needs units of {1}, not {2}"
+                                  .format(ufunc.__name__, dimension, out_dim))
+        kwargs['out'] = tuple(_split_quantity(arr)[0] for arr in out)
+
+    result = getattr(ufunc, method)(*values, **kwargs)
+    if method == 'at':
+        return None
+    if out is not None:
+        return out[0]
+    return _wrap_result(result, dimension)
+
+
+_HANDLED_FUNCTIONS = {}
+""" Maps numpy functions to their QuantityArray implementations """
+
+
+def _unwrap_all(obj, dims):
+    """
+    Recursively replaces Units and QuantityArrays inside (nested) lists
+    and tuples with their raw values, appending each dimension found to
+    dims.
+    """
+    if isinstance(obj, (Unit, QuantityArray)):
+        dims.append(obj.dimension)
+        return obj.value
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_unwrap_all(item, dims) for item in obj)
+    return obj
+
+
+def _operand(args, kwargs, position, name):
+    """
+    The argument passed at a position or by keyword, or None. Keyword
+    only arguments have no position.
+    """
+    if position is not None and position < len(args):
+        return args[position]
+    return kwargs.get(name)
+
+
+def _implements(*funcs, result='match', strict=False, operands=()):
+    """
+    Registers a generic ``__array_function__`` implementation for funcs.
+
+    Every unit-carrying argument must share one dimension. The function
+    then runs on the raw values and its result is given that dimension
+    ('match'), its square ('square'), or left bare ('raw'). With
+    strict=True, plain arrays may not be mixed in with the quantities.
+    The arguments named in operands, as (position, keyword) pairs, count
+    as dimensionless when they are plain numbers or arrays, so comparing
+    a quantity with a bare array is a unit error. A bare scalar 0 fits
+    any dimension, since zero quantities collapse to it.
+    """
+    def implementation(func):
+        """ Builds the wrapper for one numpy function """
+        def wrapper(*args, **kwargs):
+            """ Strip units, call func, restore units """
+            dims = []
+            raw_args = _unwrap_all(args, dims)
+            raw_kwargs = {key: _unwrap_all(val, dims)
+                          for (key, val) in kwargs.items()}
+            for (position, keyword) in operands:
+                operand = _operand(args, kwargs, position, keyword)
+                if operand is None or \
+                        isinstance(operand, (Unit, QuantityArray)):
+                    continue
+                if not (np.ndim(operand) == 0 and operand == 0):
+                    dims.append(DIMENSIONLESS)
+            name = 'np.{0}'.format(func.__name__)
+            dimension = _require_same_dimension(name, dims)
+            if strict:
+                plain = []
+                _unwrap_all(args[0], plain)
+                if len(plain) != len(args[0]):
+                    raise ArithmeticError("{0} can't mix values with and "
+                                          "without units".format(name))
+            value = func(*raw_args, **raw_kwargs)
+            if result == 'raw':
+                return value
+            if result == 'square':
+                dimension = dimension ** 2
+            return _wrap_result(value, dimension)
+        return wrapper
+
+    for func in funcs:
+        _HANDLED_FUNCTIONS[func] = implementation(func)
+
+
+def _gradient(values, *varargs, **kwargs):
+    """
+    ``np.gradient`` of a QuantityArray: each derivative has the array's
+    dimension divided by that of the spacing along its axis
+    """
+    (raw, dimension) = _split_quantity(values)
+    spacings = [_split_quantity(spacing) for spacing in varargs]
+    result = np.gradient(raw, *[value for (value, _) in spacings], **kwargs)
+    dims = [dim for (_, dim) in spacings] or [DIMENSIONLESS]
+    if isinstance(result, np.ndarray):
+        return _wrap_result(result, dimension / dims[0])
+    if len(dims) == 1:
+        dims = dims * len(result)
+    return type(result)(_wrap_result(derivative, dimension / dim)
+                        for (derivative, dim) in zip(result, dims))
+
+
+_HANDLED_FUNCTIONS[np.gradient] = _gradient
+
+_implements(np.sum, np.mean, np.std, np.median, np.amax, np.amin, np.max,
+            np.min, np.ptp, np.cumsum, np.nansum, np.nanmean, np.nanmax,
+            np.nanmin, np.linalg.norm, np.diff)
+_implements(np.var, np.nanvar, result='square')
+_implements(np.ones_like, np.zeros_like, np.empty_like, np.full_like,
+            np.copy, np.reshape, np.ravel, np.transpose, np.squeeze,
+            np.broadcast_to, np.flip, np.roll, np.moveaxis, np.pad,
+            np.real, np.imag, np.conj, np.sort)
+_implements(np.clip, operands=((0, 'a'), (1, 'a_min'), (2, 'a_max'),
+                               (None, 'min'), (None, 'max')))
+_implements(np.where, operands=((1, 'x'), (2, 'y')))
+_implements(np.concatenate, np.stack, np.hstack, np.vstack,
+            strict=True)
+_implements(np.shape, np.ndim, np.size, np.argmax, np.argmin, np.argsort,
+            np.nonzero, result='raw')
+_implements(np.isclose, np.allclose, result='raw',
+            operands=((0, 'a'), (1, 'b')))
+_implements(np.array_equal, result='raw', operands=((0, 'a1'), (1, 'a2')))
+
+
+class DimensionCheckCounter:
+    """
+    Collects statistics from functions wrapped by
+    :func:`check_dimensions`, to see what the checks cost.
+
+    :ivar calls:    Number of calls made through the wrapper
+    :ivar misses:   Number of calls with a new combination of argument
+                    dimensions, which had to be checked in full
+    :ivar overhead: Total seconds spent checking, over all calls
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.misses = 0
+        self.overhead = 0.0
+
+    def mean_overhead(self):
+        """
+        :return: The average checking time per call, in seconds
+        """
+        if self.calls == 0:
+            return 0.0
+        return self.overhead / self.calls
+
+    def __str__(self):
+        return '{0} calls, {1} checked in full, {2:.3g} s per call'.format(
+            self.calls, self.misses, self.mean_overhead())
+
+
+def _dimension_of(obj):
+    """
+    :return: The dimension of a Unit or QuantityArray, or DIMENSIONLESS
+             for anything else
+    """
+    if isinstance(obj, (Unit, QuantityArray)):
+        return obj.dimension
+    return DIMENSIONLESS
+
+
+def _expected_dimension(spec):
+    """
+    Converts a dimension spec given to check_dimensions into a Dimension,
+    or None if the value should not be checked.
+    """
+    if spec is None or isinstance(spec, Dimension):
+        return spec
+    return _dimension_of(spec)
+
+
+def check_dimensions(*arg_units, **kwarg_units):
+    """
+    Decorator that declares the units of a function's arguments and
+    return value:
+
+    >>> @check_dimensions(meter, second, returns=meter / second)
+    ... def speed(distance, duration):
+    ...     return distance / duration
+
+    Each Unit (or Dimension) given positionally belongs to the
+    function's parameter in the same position, and each given by
+    keyword to the parameter of that name. Calls are bound to the
+    function's signature before checking, so a parameter is checked
+    however it is passed. Use None to skip an argument and a plain
+    number for dimensionless ones. A mismatch raises an ArithmeticError.
+
+    The first call with a given combination of argument dimensions is
+    checked in full, return value included. The verdict is then cached,
+    so later calls with the same dimensions cost one dict lookup. Pass
+    ``counter=DimensionCheckCounter()`` to measure that overhead.
+
+    In production mode (see :mod:`phys_util`) the function is returned
+    unwrapped.
+
+    :param returns: The expected units of the return value
+    :param counter: Optional DimensionCheckCounter to update on every call
+    """
+    returns = kwarg_units.pop('returns', None)
+    counter = kwarg_units.pop('counter', None)
+    expected_args = tuple(_expected_dimension(spec) for spec in arg_units)
+    expected_kwargs = {name: _expected_dimension(spec)
+                       for (name, spec) in kwarg_units.items()}
+    expected_return = _expected_dimension(returns)
+
+    def decorator(func):
+        """ Wraps func with the dimension checks """
+        if PRODUCTION_MODE:
+            return func
+
+        verified = set()
+
+        def fail(what, expected, actual):
+            """ Raise a descriptive ArithmeticError """
+            raise ArithmeticError('{0}() {1} should be in units of {2}, '
+                                  'not {3}'.format(func.__name__, what,
+                                                   expected.symbol or '1',
+                                                   actual.symbol or '1'))
+
+        call_signature = inspect.signature(func)
+        positional = [param.name
+                      for param in call_signature.parameters.values()
+                      if param.kind in (param.POSITIONAL_ONLY,
+                                        param.POSITIONAL_OR_KEYWORD)]
+        # Positional specs past the named parameters belong to *args
+        expected = dict(zip(positional, expected_args))
+        expected_extra = expected_args[len(positional):]
+        expected.update(expected_kwargs)
+
+        def check(what, spec, arg):
+            """ Check one argument against its expected dimension """
+            if spec is not None and _dimension_of(arg) is not spec:
+                fail(what, spec, _dimension_of(arg))
+
+        def check_args(args, kwargs):
+            """ Check the arguments of a call in full, by parameter """
+            bound = call_signature.bind(*args, **kwargs)
+            for (name, arg) in bound.arguments.items():
+                kind = call_signature.parameters[name].kind
+                if kind is inspect.Parameter.VAR_POSITIONAL:
+                    for (i, (spec, item)) in enumerate(zip(expected_extra,
+                                                           arg)):
+                        check('argument {0}'.format(len(positional) + i),
+                              spec, item)
+                elif kind is inspect.Parameter.VAR_KEYWORD:
+                    for (key, item) in arg.items():
+                        check('argument {0!r}'.format(key),
+                              expected_kwargs.get(key), item)
+                else:
+                    check('argument {0!r}'.format(name),
+                          expected.get(name), arg)
+
+        @functools.wraps(func)
+        def new_func(*args, **kwargs):
+            """ dimension checked wrapper """
+            if counter is not None:
+                start = time.perf_counter()
+            signature = tuple(_dimension_of(arg) for arg in args)
+            if kwargs:
+                signature += tuple(sorted(
+                    (name, _dimension_of(arg))
+                    for (name, arg) in kwargs.items()))
+            known = signature in verified
+            if counter is not None:
+                counter.calls += 1
+                if not known:
+                    counter.misses += 1
+            if not known:
+                check_args(args, kwargs)
+            if counter is not None:
+                counter.overhead += time.perf_counter() - start
+
+            result = func(*args, **kwargs)
+            if not known:
+                if expected_return is not None and \
+                        _dimension_of(result) is not expected_return:
+                    fail('return value', expected_return,
+                         _dimension_of(result))
+                verified.add(signature)
+            return result
+        return new_func
+    return decorator
+
+
+METRIC_PREFIXES = {'yotta': 10 ** 24, 'zetta': 10 ** 21, 'exa': 10 ** 18,
+                   'peta': 10 ** 15, 'tera': 10 ** 12, 'giga': 10 ** 9,
+                   'mega': 10 ** 6, 'kilo': 10 ** 3, 'hecto': 10 ** 2,
+                   'deca': 10, 'deci': 1e-1, 'centi': 1e-2, 'milli': 1e-3,
+                   'micro': 1e-6, 'nano': 1e-9, 'pico': 1e-12,
+                   'femto': 1e-15, 'atto': 1e-18, 'zepto': 1e-21,
+                   'yocto': 1e-24}
+""" Multipliers for the spelled-out metric prefixes """
+
+METRIC_PREFIX_SYMBOLS = {'Y': 10 ** 24, 'Z': 10 ** 21, 'E': 10 ** 18,
+                         'P': 10 ** 15, 'T': 10 ** 12, 'G': 10 ** 9,
+                         'M': 10 ** 6, 'k': 10 ** 3, 'h': 10 ** 2,
+                         'da': 10, 'd': 1e-1, 'c': 1e-2, 'm': 1e-3,
+                         'u': 1e-6, '\u00b5': 1e-6, '\u03bc': 1e-6,
+                         'n': 1e-9, 'p': 1e-12, 'f': 1e-15, 'a': 1e-18,
+                         'z': 1e-21, 'y': 1e-24}
+""" Multipliers for the metric prefix symbols (u, µ and μ all mean micro) """
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<unit>[A-Za-z\u00b5\u03bc]+)
+      | (?P<power>(?:\^|\*\*)\s*(?:[+-]?\d+|\([+-]?\d+(?:/\d+)?\)))
+      | (?P<op>[*/])
+    )""", re.VERBOSE)
+
+
+def parse_dimensions(string, default_unit=None):
     """
     Convert a String representing a value with units into the
-    corresponding python object. Currently only handles units of length
+    corresponding python object, e.g.
+
+    >>> print(parse_dimensions('3e8 m/s'))
+    300000000.0 * m * s^-1
+
+    The string is a number followed by an optional unit expression.
+    Units may be written as case-sensitive symbols ('nm', 'fs', 'um')
+    or spelled out, in any case and singular or plural ('nanometer',
+    '5 Kilometers'). They are combined with '*', '/' or a space, and
+    raised to integer powers with '^' or '**' ('10 nm^2', '1 kg*m/s^2',
+    '2 m s^-1'). Fractional powers go in parentheses ('4 Hz^(1/2)').
+
+    Results are cached per string, so parsing the same entry again is
+    a dict lookup.
+
+    :param string:       The text to parse
+    :type  string:       string
+    :param default_unit: Unit to use when the string is a bare number.
+                         If None, a bare number is returned unchanged.
+    :type  default_unit: Unit
+
+    :raises ValueError: If the string is malformed or names an unknown
+                        unit. The message gives the offending position.
+    """
+    return _parse_dimensions_cached(string, default_unit)
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_dimensions_cached(string, default_unit):
+    """
+    The cached implementation of :func:`parse_dimensions`
     """
-    string = string.split()
-    value = float(string[0])
-    units_str = string[1]
+    tokens = _tokenize(string)
+    if not tokens or tokens[0][0] != 'number':
+        raise ValueError("Expected a number at the start of {0!r}"
+                         .format(string))
+    value = float(tokens[0][1])
+    if len(tokens) == 1:
+        if default_unit is None:
+            return value
+        return value * default_unit
+
+    result = 1
+    operator = '*'
+    factor = None
+    leading = True
+    for (kind, text, pos) in tokens[1:] + [('end', '', len(string))]:
+        if kind == 'unit':
+            if factor is not None:
+                result = _combine(result, operator, factor)
+                operator = '*'
+            factor = _lookup_unit(text, string, pos)
+            leading = False
+        elif kind == 'power':
+            if factor is None:
+                raise ValueError("Exponent without a unit at position {0} "
+                                 "in {1!r}".format(pos, string))
+            exponent = text.lstrip('^*').strip().strip('()')
+            factor = factor ** as_exponent(Fraction(exponent))
+        elif kind == 'op' or kind == 'end':
+            # Only a leading operator ('1 /s') may come without a unit
+            if factor is None and not (kind == 'op' and leading):
+                raise ValueError("Expected a unit at position {0} in {1!r}"
+                                 .format(pos, string))
+            if factor is not None:
+                result = _combine(result, operator, factor)
+                factor = None
+            leading = False
+            operator = text
+        else:
+            raise ValueError("Unexpected number at position {0} in {1!r}"
+                             .format(pos, string))
+    return value * result
+
+
+def _tokenize(string):
+    """
+    Split string into (kind, text, position) tuples, where kind is one
+    of 'number', 'unit', 'power' or 'op'.
 
-    if 'meter' in units_str:
-        prefix = units_str.split('meter')[0]
-        mult = convert_metric_prefix(prefix)
-        return value * meter * mult
-    elif 'inch' in units_str:
-        return value * inch
+    :raises ValueError: If part of the string is not a valid token
+    """
+    tokens = []
+    pos = 0
+    string = string.rstrip()
+    while pos < len(string):
+        match = _TOKEN_RE.match(string, pos)
+        if match is None:
+            raise ValueError("Can't parse {0!r} at position {1}"
+                             .format(string, pos))
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind), match.start(kind)))
+        pos = match.end()
+    return tokens
+
+
+def _combine(left, operator, right):
+    """ Applies a '*' or '/' between two parsed factors """
+    if operator == '/':
+        return left / right
+    return left * right
+
+
+def _lookup_unit(text, string, pos):
+    """
+    Look up a (possibly prefixed) unit symbol or name. Symbols are case
+    sensitive ('Mm' is not 'mm'); spelled-out names are not, and may be
+    plural ('Kilometers').
+
+    :raises ValueError: If text is not a known unit
+    """
+    try:
+        return _UNIT_TABLE[text]
+    except KeyError:
+        pass
+    try:
+        return _NAME_TABLE[text.lower()]
+    except KeyError:
+        raise ValueError("Unknown unit {0!r} at position {1} in {2!r}"
+                         .format(text, pos, string))
 
 
 def convert_metric_prefix(string):
     """
     Takes a string that represents a metric prefix and converts it
-    into the equivalent multiplier
-    """
-    def test_upper(string):
-        """
-        Test the metric prefixes above 1
-        """
-        factor = 1
-        if string == 'yotta':
-            factor = int(1e24)
-        elif string == 'zetta':
-            factor = int(1e21)
-        elif string == 'exa':
-            factor = int(1e18)
-        elif string == 'peta':
-            factor = int(1e15)
-        elif string == 'tera':
-            factor = int(1e12)
-        elif string == 'giga':
-            factor = int(1e9)
-        elif string == 'mega':
-            factor = int(1e6)
-        elif string == 'kilo':
-            factor = int(1e3)
-        elif string == 'hecto':
-            factor = int(1e2)
-        elif string == 'deca':
-            factor = int(1e1)
-        return factor
-
-    def test_lower(string):
-        """
-        Test the metric prefixes below 1
-        """
-        factor = 1
-        if string == 'deci':
-            factor = 1e-1
-        elif string == 'centi':
-            factor = 1e-2
-        elif string == 'milli':
-            factor = 1e-3
-        elif string == 'micro':
-            factor = 1e-6
-        elif string == 'nano':
-            factor = 1e-9
-        elif string == 'pico':
-            factor = 1e-12
-        elif string == 'femto':
-            factor = 1e-15
-        elif string == 'atto':
-            factor = 1e-18
-        elif string == 'zepto':
-            factor = 1e-21
-        elif string == 'yocto':
-            factor = 1e-24
-        return factor
-
-    string = string.lower()
-    factor = 1
-    factor = test_upper(string)
-    if factor > 1:
-        return factor
-    factor = test_lower(string)
-    if factor < 1:
-        return factor
-    return factor
+    into the equivalent multiplier. Unknown prefixes give 1.
+    """
+    return METRIC_PREFIXES.get(string.lower(), 1)
 
 
 # pylint: disable=invalid-name
@@ -538,6 +1473,10 @@ kilogram = Unit('kilogram', 'kg', {(1, UnitType.MASS)})
 second = Unit('second', 's', {(1, UnitType.TIME)})
 """ SI Unit of time """
 
+if PRODUCTION_MODE:
+    # Every unit below is derived from these, so they all become floats
+    meter = coul = kilogram = second = 1.0
+
 newton = 1 * kilogram * meter / second ** 2
 """ SI Unit of force """
 
@@ -558,3 +1497,41 @@ inch = 1 / 12 * foot
 
 pound = 4.448222 * newton
 """ Imperial unit of force """
+
+_METRIC_UNITS = {'m': ('meter', meter), 's': ('second', second),
+                 'g': ('gram', kilogram / 1000), 'C': ('coulomb', coul),
+                 'A': ('ampere', ampere), 'N': ('newton', newton),
+                 'F': ('farad', farad), 'H': ('henry', henry),
+                 'Hz': ('hertz', 1 / second),
+                 'J': ('joule', newton * meter),
+                 'W': ('watt', newton * meter / second),
+                 'V': ('volt', newton * meter / coul)}
+""" Units that take metric prefixes, by symbol: (name, unit) """
+
+_UNIT_TABLE = {}
+""" Every unit symbol parse_dimensions understands, prefixed or not """
+
+_NAME_TABLE = {}
+"""
+Every spelled-out unit name parse_dimensions understands, prefixed or
+not, singular and plural, in lower case
+"""
+
+for (_symbol, (_name, _unit)) in _METRIC_UNITS.items():
+    for (_prefix, _mult) in METRIC_PREFIX_SYMBOLS.items():
+        _UNIT_TABLE[_prefix + _symbol] = _mult * _unit
+    for (_prefix, _mult) in METRIC_PREFIXES.items():
+        _NAME_TABLE[_prefix + _name] = _mult * _unit
+for (_prefix, _mult) in METRIC_PREFIXES.items():
+    _NAME_TABLE[_prefix + 'metre'] = _mult * meter
+for (_symbol, (_name, _unit)) in _METRIC_UNITS.items():
+    _UNIT_TABLE[_symbol] = _unit
+    _NAME_TABLE[_name] = _unit
+_NAME_TABLE['metre'] = meter
+for (_name, _unit) in list(_NAME_TABLE.items()):
+    if not _name.endswith(('s', 'z')):
+        _NAME_TABLE[_name + 's'] = _unit
+_UNIT_TABLE.update({'kg': kilogram, 'in': inch, 'ft': foot, 'lb': pound})
+_NAME_TABLE.update({'inch': inch, 'inches': inch, 'foot': foot,
+                    'feet': foot, 'pound': pound, 'pounds': pound})
+del _symbol, _name, _unit, _prefix, _mult
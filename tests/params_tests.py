@@ -0,0 +1,359 @@
+"""
+Unit tests for the fdtd parameter modules
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+import phys_util
+import phys_util.units as u
+import phys_util.constants as c
+import fdtd.define_general_parameters as dgp
+import fdtd.raw_params as rp
+from fdtd.materials import MaterialMap
+from fdtd.prepare import prepare_setup
+from fdtd.setup_cache import SetupCache, setup_key
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_answers(**overrides):
+    """
+    The default answers from the initial parameter dialog
+    """
+    answers = {'max_gp': 30,
+               'eps': 1,
+               'mu': 1,
+               'x_dim': 5e-6 * u.meter,
+               'y_dim': 4e-6 * u.meter,
+               'timestep': 20,
+               'layers': 4,
+               'axis': 0}
+    answers.update(overrides)
+    return answers
+
+
+class TestParams(unittest.TestCase):
+    """
+    Unit tests for the Params grid
+    """
+
+    def test_grid(self):
+        """
+        The grid is kept as 1D axes and only expanded on request
+        """
+        params = dgp.Params(make_answers())
+        x_arr = params.get_x_arr()
+        y_arr = params.get_y_arr()
+        self.assertEqual(params.shape, (len(y_arr), len(x_arr)))
+        self.assertEqual(params.ep_v.shape, params.shape)
+
+        x_grid, y_grid = params.get_grid()
+        self.assertEqual(x_grid.shape, (1, len(x_arr)))
+        self.assertEqual(y_grid.shape, (len(y_arr), 1))
+        self.assertTrue(np.shares_memory(x_grid, x_arr))
+
+        full_x, full_y = params.get_grid(sparse=False)
+        self.assertEqual(full_x.shape, params.shape)
+        self.assertTrue(np.array_equal(full_x, x_grid + 0 * y_grid))
+        self.assertTrue(np.array_equal(full_y, y_grid + 0 * x_grid))
+
+        tiles = list(params.iter_grid_tiles(7))
+        self.assertEqual(tiles[-1][0].stop, params.shape[0])
+        for (rows, x_tile, y_tile) in tiles:
+            self.assertTrue(np.array_equal(x_tile, full_x[rows]))
+            self.assertTrue(np.array_equal(y_tile, full_y[rows]))
+
+    def test_build_axis(self):
+        """
+        Both kinds of axis are read-only and report their spacing
+        """
+        axis, spacing = dgp.build_axis(-1, 1, num=5)
+        self.assertTrue(np.array_equal(axis, [-1, -.5, 0, .5, 1]))
+        self.assertEqual(spacing, .5)
+        self.assertFalse(axis.flags.writeable)
+
+        # int(0.6 / 0.1) == 5 would drop the end point
+        axis, spacing = dgp.build_axis(-.3, .3, step=.1)
+        self.assertEqual(len(axis), 7)
+        self.assertAlmostEqual(axis[-1], .3)
+        self.assertEqual(spacing, .1)
+
+        axis, _ = dgp.build_axis(0, 1, step=.3)
+        self.assertEqual(len(axis), 4)
+
+        with self.assertRaises(ValueError):
+            dgp.build_axis(0, 1)
+        with self.assertRaises(ValueError):
+            dgp.build_axis(1, 0, step=.1)
+
+    def test_spacing(self):
+        """
+        Both branches of set_from_user_input set del_x and del_y
+        """
+        for (x_dim, y_dim) in [(5, 4), (4, 5)]:
+            params = dgp.Params(make_answers(x_dim=x_dim * 1e-6 * u.meter,
+                                             y_dim=y_dim * 1e-6 * u.meter))
+            self.assertGreater(params.del_x, 0)
+            self.assertAlmostEqual(params.del_x, params.del_y)
+            self.assertIn(30, params.shape)
+
+
+class TestMaterialMap(unittest.TestCase):
+    """
+    Unit tests for the material index map
+    """
+
+    def test_gather(self):
+        """
+        Per-cell arrays are looked up from the material tables
+        """
+        params = dgp.Params(make_answers(eps=1.5))
+        materials = params.materials
+        self.assertEqual(materials.index.dtype, np.uint8)
+
+        glass = materials.add_material(eps=2.25, mu=1.1)
+        materials.paint(np.s_[2:5, 3:6], glass)
+        eps_r = params.ep_v / c.epsilon0
+        self.assertEqual(eps_r[3, 4], 2.25)
+        self.assertEqual(eps_r[0, 0], 1.5)
+        self.assertAlmostEqual(params.mu_v[2, 3] / c.mu0, 1.1)
+
+        # Editing a material changes every cell that uses it
+        materials.set_material(glass, eps=4)
+        eps_r = params.ep_v / c.epsilon0
+        self.assertEqual(eps_r[4, 5], 4)
+        self.assertEqual(np.count_nonzero(eps_r == 4), 9)
+
+        # The gathered arrays are cached and can't be edited in place
+        self.assertIs(params.ep_v, params.ep_v)
+        with self.assertRaises(ValueError):
+            params.ep_v[0:3, 0:3] = 4 * c.epsilon0 * np.ones((3, 3))
+        with self.assertRaises(ValueError):
+            params.alphadat[0, 0] = 2
+        self.assertEqual(params.ep_v[0, 0] / c.epsilon0, 1.5)
+
+        # A new map, even one at the same version, is gathered afresh
+        params.materials = MaterialMap(params.shape, eps=4)
+        self.assertEqual(params.ep_v[0, 0] / c.epsilon0, 4)
+        lowered = rp.lower_params(params)
+        self.assertTrue(np.array_equal(prepare_setup(params).ce[
+            params.pmlwidth:-params.pmlwidth,
+            params.pmlwidth:-params.pmlwidth], lowered.dt / lowered.eps))
+
+    def test_many_materials(self):
+        """
+        The index grid widens once there are more than 256 materials
+        """
+        materials = dgp.MaterialMap((4, 4))
+        for i in range(300):
+            last = materials.add_material(eps=i + 2)
+        self.assertEqual(materials.index.dtype, np.uint16)
+        materials.paint(materials.index == 0, last)
+        self.assertTrue(np.all(materials.gather(materials.eps_table) == 301))
+        with self.assertRaises(ValueError):
+            materials.paint(np.s_[0, 0], 400)
+
+
+class TestRawParams(unittest.TestCase):
+    """
+    Unit tests for lowering Params to plain arrays
+    """
+
+    def test_lower(self):
+        """
+        Units are checked and stripped to SI floats
+        """
+        params = dgp.Params(make_answers(eps=2.25))
+        raw = rp.lower_params(params)
+
+        self.assertEqual(raw.eps.dtype, np.float64)
+        self.assertFalse(raw.eps.flags.writeable)
+        eps0 = c.epsilon0 / (u.farad / u.meter)
+        self.assertTrue(np.allclose(raw.eps, 2.25 * eps0))
+        self.assertAlmostEqual(raw.dx, params.del_x * 1e-6)
+        self.assertEqual(raw.steps, 20)
+        self.assertEqual(raw.eps.shape, (len(raw.y_arr), len(raw.x_arr)))
+
+        # The time step respects the Courant limit
+        c_0 = c.c / (u.meter / u.second)
+        limit = 1 / (c_0 * np.sqrt(1 / raw.dx ** 2 + 1 / raw.dy ** 2))
+        self.assertLess(raw.dt, limit)
+
+        with self.assertRaises(AttributeError):
+            raw.dx = 1
+
+    @unittest.skipIf(u.PRODUCTION_MODE, 'units are not checked')
+    def test_wrong_units(self):
+        """
+        A field with the wrong dimension fails before any compute
+        """
+        params = dgp.Params(make_answers())
+        self.assertEqual(params.get_time_step(courant=0.5) * 2,
+                         params.get_time_step(1.0))
+        with self.assertRaises(ArithmeticError):
+            params.get_time_step(courant=0.5 * u.second)
+
+        params = dgp.Params(make_answers())
+        params.mu_v = params.ep_v
+        with self.assertRaises(ArithmeticError):
+            rp.lower_params(params)
+
+        params = dgp.Params(make_answers())
+        params.ep_v = np.ones(params.ep_v.shape)
+        with self.assertRaises(ArithmeticError):
+            rp.lower_params(params)
+
+    def test_production_mode_matches(self):
+        """
+        Checked and production units lower to identical arrays
+        """
+        script = '\n'.join([
+            'import sys',
+            'import fdtd.define_general_parameters as dgp',
+            'import fdtd.raw_params as rp',
+            'import phys_util.units as u',
+            'assert u.PRODUCTION_MODE == (sys.argv[1] == "1")',
+            'params = dgp.Params({"max_gp": 12, "eps": 2.25, "mu": 1.5,',
+            '    "x_dim": u.parse_dimensions("3 micrometer"),',
+            '    "y_dim": u.parse_dimensions("2 micrometer"),',
+            '    "timestep": 5, "layers": 2, "axis": 0})',
+            'raw = rp.lower_params(params)',
+            'sys.stdout.write(repr([raw.dx, raw.dy, raw.dt]))',
+            'sys.stdout.write(raw.eps.tobytes().hex())',
+            'sys.stdout.write(raw.mu.tobytes().hex())'])
+
+        outputs = []
+        for mode in ['0', '1']:
+            env = dict(os.environ)
+            env[phys_util.PRODUCTION_ENV_VAR] = mode
+            env['PYTHONPATH'] = ROOT_DIR
+            outputs.append(subprocess.check_output(
+                [sys.executable, '-c', script, mode], env=env))
+        self.assertEqual(outputs[0], outputs[1])
+
+
+class TestSetupCache(unittest.TestCase):
+    """
+    Tests for fdtd.prepare and fdtd.setup_cache
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_prepare(self):
+        """
+        The prepared grid is extended by the PML on every side
+        """
+        params = dgp.Params(make_answers())
+        setup = prepare_setup(params)
+        width = params.pmlwidth
+        shape = (params.shape[0] + 2 * width, params.shape[1] + 2 * width)
+        self.assertEqual(setup.ce.shape, shape)
+        self.assertEqual(len(setup.x_axis), shape[1])
+        self.assertEqual(len(setup.y_axis), shape[0])
+        self.assertTrue(np.allclose(np.diff(setup.x_axis), setup.dx))
+        self.assertAlmostEqual(setup.x_axis[width],
+                               params.get_x_arr()[0] * 1e-6)
+        eps0 = c.epsilon0 / (u.farad / u.meter)
+        self.assertTrue(np.allclose(setup.ce, setup.dt / eps0))
+
+    def test_prepare_by_material(self):
+        """
+        Coefficients gathered per material match ones worked out per
+        cell from assigned arrays
+        """
+        params = dgp.Params(make_answers(eps=1.5))
+        glass = params.materials.add_material(eps=2.25, mu=1.1, alpha=3)
+        params.materials.paint(np.s_[:3, 2:6], glass)
+        gathered = prepare_setup(params)
+
+        params.ep_v = params.ep_v * 1.0
+        params.alphadat = params.alphadat * 1.0
+        per_cell = prepare_setup(params)
+        for name in ['ce', 'ch', 'alpha']:
+            self.assertTrue(np.array_equal(getattr(gathered, name),
+                                           getattr(per_cell, name)))
+            self.assertFalse(getattr(gathered, name).flags.writeable)
+        self.assertEqual(gathered.alpha[0, params.pmlwidth + 2], 3)
+
+    def test_key(self):
+        """
+        The key ignores the step count but not the geometry
+        """
+        params = dgp.Params(make_answers())
+        key = setup_key(params)
+        self.assertEqual(key, setup_key(dgp.Params(make_answers())))
+        self.assertEqual(key,
+                         setup_key(dgp.Params(make_answers(timestep=50))))
+        self.assertNotEqual(key, setup_key(dgp.Params(make_answers(eps=2))))
+
+        params.materials.paint(np.s_[:2, :2],
+                               params.materials.add_material(eps=4))
+        self.assertNotEqual(key, setup_key(params))
+
+    def test_reuse(self):
+        """
+        A second lookup is memory mapped and matches a fresh build
+        """
+        cache = SetupCache(self.directory)
+        cache.get(dgp.Params(make_answers()))
+        setup = cache.get(dgp.Params(make_answers(timestep=7)))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertIsInstance(setup.ce, np.memmap)
+        self.assertEqual(setup.steps, 7)
+
+        fresh = prepare_setup(dgp.Params(make_answers()))
+        for name in ['x_axis', 'y_axis', 'ce', 'ch', 'alpha']:
+            self.assertTrue(np.array_equal(getattr(setup, name),
+                                           getattr(fresh, name)))
+
+    def test_damaged_entries(self):
+        """
+        Entries missing files are misses, and are replaced when the
+        set-up is stored again
+        """
+        cache = SetupCache(self.directory)
+        params = dgp.Params(make_answers())
+        key = setup_key(params)
+        os.makedirs(os.path.join(self.directory, key))
+        self.assertIsNone(cache.load(key))
+        setup = cache.get(params)
+        self.assertIsInstance(setup.ce, np.memmap)
+
+        os.remove(os.path.join(self.directory, key, 'ce.npy'))
+        self.assertIsNone(cache.load(key))
+        setup = cache.get(params)
+        self.assertIsInstance(setup.ce, np.memmap)
+        self.assertEqual(setup.steps, params.z_s)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def test_evict(self):
+        """
+        Least recently used entries go first once the cache is full
+        """
+        cache = SetupCache(self.directory)
+        first = dgp.Params(make_answers(eps=1))
+        second = dgp.Params(make_answers(eps=2))
+        cache.get(first)
+        entry_size = cache.size()
+        cache.max_bytes = 2 * entry_size
+        cache.get(second)
+        os.utime(os.path.join(self.directory, setup_key(first), 'meta.json'),
+                 (0, 0))
+        cache.get(dgp.Params(make_answers(eps=3)))
+        keys = [key for (_, _, key) in cache.entries()]
+        self.assertEqual(len(keys), 2)
+        self.assertNotIn(setup_key(first), keys)
+        self.assertIn(setup_key(second), keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
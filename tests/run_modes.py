@@ -0,0 +1,46 @@
+"""
+Runs the whole test suite twice: once with checked units and once with
+phys_util.units in production mode, so both give the same results.
+
+    python3 tests/run_modes.py
+"""
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import phys_util  # pylint: disable=wrong-import-position
+
+
+def run_suite(production):
+    """
+    Run every tests/*_tests.py module in a fresh interpreter
+
+    :param production: Whether to turn on production mode
+    :type  production: bool
+    :return: The unittest exit status
+    """
+    env = dict(os.environ)
+    env[phys_util.PRODUCTION_ENV_VAR] = '1' if production else '0'
+    command = [sys.executable, '-m', 'unittest', 'discover',
+               '-s', 'tests', '-p', '*_tests.py']
+    return subprocess.call(command, cwd=ROOT_DIR, env=env)
+
+
+def main():
+    """
+    Run the suite in both modes and report any failure
+    """
+    failed = []
+    for production in [False, True]:
+        print('Units in {0} mode'.format('production' if production
+                                         else 'checked'))
+        if run_suite(production) != 0:
+            failed.append(production)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
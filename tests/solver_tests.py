@@ -0,0 +1,716 @@
+"""
+Unit tests for the fdtd solver modules
+"""
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import phys_util.units as u
+import fdtd.define_general_parameters as dgp
+from fdtd.checkpoint import (Checkpointer, MemmapAllocator,
+                              list_checkpoints, restore_latest)
+from fdtd.cpml import CPML
+from fdtd.dft import DFTMonitor
+from fdtd.parallel import ProcessBackend, SharedAllocator
+from fdtd.precision import compare_precisions, get_policy
+from fdtd.probes import ProbeSet
+from fdtd.snapshots import SnapshotWriter, load_index, read_frames
+from fdtd.solver import YeeSolver2D, row_bands
+from fdtd.sources import SourceSet, continuous, gaussian, ricker
+from fdtd.tfsf import TFSF
+from fdtd.threaded import ThreadBackend, tune_band_rows
+
+from params_tests import make_answers
+
+
+def center_pulse(solver):
+    """
+    Set the out-of-plane field at the middle of the grid to one
+    """
+    field = solver.fields['ez' if solver.mode == 'TM' else 'hz']
+    rows, cols = solver.shape
+    field[rows // 2, cols // 2] = 1.0
+    return rows // 2, cols // 2
+
+
+class TestYeeSolver2D(unittest.TestCase):
+    """
+    Tests for fdtd.solver
+    """
+    def test_shape(self):
+        """
+        The solver runs on the PML-extended grid
+        """
+        params = dgp.Params(make_answers())
+        solver = YeeSolver2D(params)
+        width = params.pmlwidth
+        self.assertEqual(solver.shape, (params.shape[0] + 2 * width,
+                                        params.shape[1] + 2 * width))
+        self.assertEqual(sorted(solver.fields), ['ez', 'hx', 'hy'])
+        with self.assertRaises(ValueError):
+            YeeSolver2D(params, mode='TEM')
+
+    def test_causality(self):
+        """
+        A pulse spreads at most one cell per step
+        """
+        for mode in ['TM', 'TE']:
+            solver = YeeSolver2D(dgp.Params(make_answers()), mode=mode)
+            row, col = center_pulse(solver)
+            stats = solver.run(5)
+            self.assertEqual(solver.n, 5)
+            self.assertEqual(stats.steps, 5)
+            self.assertGreater(stats.cells_per_second, 0)
+            for field in solver.fields.values():
+                rows, cols = np.nonzero(field)
+                self.assertTrue(len(rows) > 0)
+                self.assertLessEqual(np.abs(rows - row).max(), 6)
+                self.assertLessEqual(np.abs(cols - col).max(), 6)
+
+    def test_bands(self):
+        """
+        Updating in bands of rows gives exactly the full update
+        """
+        for mode in ['TM', 'TE']:
+            whole = YeeSolver2D(dgp.Params(make_answers()), mode=mode)
+            banded = YeeSolver2D(dgp.Params(make_answers()), mode=mode)
+            center_pulse(whole)
+            center_pulse(banded)
+            rows = whole.shape[0]
+            for _ in range(8):
+                whole.step()
+                for beg in range(0, rows, 7):
+                    banded.update_h(beg, min(beg + 7, rows))
+                for beg in range(0, rows, 7):
+                    banded.update_e(beg, min(beg + 7, rows))
+            for name in whole.fields:
+                self.assertTrue(np.array_equal(whole.fields[name],
+                                               banded.fields[name]))
+
+    def test_in_place(self):
+        """
+        A step allocates no arrays; NumPy's fixed-size iteration buffers
+        for strided views are all that shows up
+        """
+        solver = YeeSolver2D(dgp.Params(make_answers(max_gp=400)))
+        center_pulse(solver)
+        solver.step()
+        tracemalloc.start()
+        solver.run(3)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertLess(peak, solver.fields['ez'].nbytes // 4)
+
+
+def pulse_trace(mode, size, absorb, steps=200):
+    """
+    Drive a differentiated Gaussian at the middle of a square grid of
+    the given size in micrometers, and record the field 10 cells away.
+    The grid spacing is the same for every size.
+    """
+    params = dgp.Params(make_answers(max_gp=12 * size,
+                                     x_dim=size * 1e-6 * u.meter,
+                                     y_dim=size * 1e-6 * u.meter,
+                                     layers=10))
+    solver = YeeSolver2D(params, mode=mode)
+    if absorb:
+        CPML(solver)
+    field = solver.fields['ez' if mode == 'TM' else 'hz']
+    row, col = solver.shape[0] // 2, solver.shape[1] // 2
+    trace = np.empty(steps)
+    for step in range(steps):
+        solver.step()
+        delay = (step - 40) / 12.0
+        field[row, col] -= delay * np.exp(-delay ** 2)
+        trace[step] = field[row, col + 10]
+    return trace
+
+
+class TestCPML(unittest.TestCase):
+    """
+    Tests for fdtd.cpml
+    """
+    def test_absorbs(self):
+        """
+        A small grid with layers matches a grid too big for the
+        reflections to get back within the run
+        """
+        for mode in ['TM', 'TE']:
+            reference = pulse_trace(mode, 20, False)
+            scale = np.abs(reference).max()
+            absorbed = pulse_trace(mode, 4, True)
+            reflected = pulse_trace(mode, 4, False)
+            self.assertLess(np.abs(absorbed - reference).max() / scale, 1e-3)
+            self.assertGreater(np.abs(reflected - reference).max() / scale,
+                               0.1)
+
+    def test_strips(self):
+        """
+        The auxiliary fields cover only the edges
+        """
+        solver = YeeSolver2D(dgp.Params(make_answers(max_gp=400,
+                                                     layers=10)))
+        layers = CPML(solver)
+        rows, cols = solver.shape
+        self.assertEqual(len(solver.hooks['post_h']), 1)
+        self.assertLessEqual(layers.nbytes, 8 * 2 * 10 * 2 * (rows + cols))
+        for strip in layers.strips['post_e']:
+            self.assertIn(10 - 1, strip.psi.shape)
+
+
+class TestProcessBackend(unittest.TestCase):
+    """
+    Tests for fdtd.parallel
+    """
+    def test_matches_serial(self):
+        """
+        Worker processes give bit-identical fields
+        """
+        for mode in ['TM', 'TE']:
+            params = dgp.Params(make_answers())
+            serial = YeeSolver2D(params, mode=mode)
+            CPML(serial)
+            center_pulse(serial)
+            serial.run(30)
+
+            allocator = SharedAllocator()
+            self.addCleanup(allocator.close)
+            solver = YeeSolver2D(params, mode=mode, allocator=allocator)
+            CPML(solver)
+            center_pulse(solver)
+            with ProcessBackend(solver, allocator, tiles=3) as backend:
+                self.assertEqual(len(backend.bands), 3)
+                solver.run(30)
+            for name in serial.fields:
+                self.assertTrue(np.array_equal(serial.fields[name],
+                                               solver.fields[name]))
+
+    def test_needs_shared_memory(self):
+        """
+        Fields outside shared memory are refused
+        """
+        solver = YeeSolver2D(dgp.Params(make_answers()))
+        with self.assertRaises(ValueError):
+            ProcessBackend(solver, SharedAllocator(), tiles=2)
+
+
+class TestThreadBackend(unittest.TestCase):
+    """
+    Tests for fdtd.threaded
+    """
+    def test_bands(self):
+        """
+        Bands cover every row once and fit the cache
+        """
+        self.assertEqual(row_bands(10, 3), [(0, 3), (3, 6), (6, 10)])
+        self.assertEqual(row_bands(2, 5), [(0, 1), (1, 2)])
+        solver = YeeSolver2D(dgp.Params(make_answers()))
+        rows = tune_band_rows(solver, cache=2 ** 16)
+        self.assertEqual(rows, 2 ** 16 // (7 * 8 * solver.shape[1]))
+
+    def test_matches_serial(self):
+        """
+        Threaded bands give bit-identical fields and a sane efficiency
+        """
+        params = dgp.Params(make_answers())
+        serial = YeeSolver2D(params)
+        CPML(serial)
+        center_pulse(serial)
+        serial.run(30)
+
+        solver = YeeSolver2D(params)
+        CPML(solver)
+        center_pulse(solver)
+        with ThreadBackend(solver, threads=3, band_rows=4) as backend:
+            self.assertGreaterEqual(len(backend.bands), 3)
+            stats = solver.run(30)
+        self.assertIsInstance(solver.backend, type(serial.backend))
+        self.assertGreater(stats.efficiency, 0)
+        for name in serial.fields:
+            self.assertTrue(np.array_equal(serial.fields[name],
+                                           solver.fields[name]))
+
+
+class TestPrecision(unittest.TestCase):
+    """
+    Tests for fdtd.precision
+    """
+    def test_policy(self):
+        """
+        Fields and coefficients take the policy's types
+        """
+        solver = YeeSolver2D(dgp.Params(make_answers()), precision='mixed')
+        self.assertEqual(solver.fields['ez'].dtype, np.float32)
+        self.assertEqual(solver.coefficients['ce_x'].dtype, np.float32)
+        self.assertEqual(solver.precision.accumulator, np.complex128)
+        self.assertIs(get_policy(solver.precision), solver.precision)
+        with self.assertRaises(ValueError):
+            get_policy('quad')
+
+    def test_compare(self):
+        """
+        Single precision fields stay close to double
+        """
+        def configure(solver):
+            """ Absorb, and start from a pulse """
+            CPML(solver)
+            center_pulse(solver)
+
+        (drift,) = compare_precisions(dgp.Params(make_answers()), 50,
+                                      configure=configure)
+        self.assertEqual(sorted(drift), ['ez', 'hx', 'hy'])
+        for value in drift.values():
+            self.assertGreater(value, 0)
+            self.assertLess(value, 1e-4)
+
+
+class TestCheckpoint(unittest.TestCase):
+    """
+    Tests for fdtd.checkpoint
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @staticmethod
+    def make_solver(**solver_args):
+        """ A solver with layers and a pulse """
+        solver = YeeSolver2D(dgp.Params(make_answers()), **solver_args)
+        CPML(solver)
+        center_pulse(solver)
+        return solver
+
+    def test_restart(self):
+        """
+        A restarted run ends exactly where an unbroken one does
+        """
+        reference = self.make_solver()
+        reference.run(40)
+
+        solver = self.make_solver()
+        checkpoints = Checkpointer(solver, self.directory, interval=0,
+                                   keep=2)
+        solver.run(20)
+        checkpoints.close()
+        self.assertIsNone(checkpoints.error)
+        self.assertGreater(checkpoints.written, 0)
+        saved = list_checkpoints(self.directory)
+        self.assertLessEqual(len(saved), 2)
+
+        restarted = self.make_solver()
+        step = restore_latest(restarted, self.directory)
+        self.assertEqual(step, saved[0][0])
+        restarted.run(40 - step)
+        for name in reference.state:
+            self.assertTrue(np.array_equal(reference.state[name],
+                                           restarted.state[name]))
+
+    def test_skips_incomplete(self):
+        """
+        A damaged newest checkpoint falls back to the one before
+        """
+        solver = self.make_solver()
+        checkpoints = Checkpointer(solver, self.directory, interval=1e9)
+        solver.run(3)
+        checkpoints.save()
+        solver.run(3)
+        checkpoints.save()
+        checkpoints.close()
+        (newest, path), (older, _) = list_checkpoints(self.directory)
+        self.assertEqual((newest, older), (6, 3))
+        with open(path, 'wb') as out:
+            out.write(b'not a checkpoint')
+        self.assertEqual(restore_latest(self.make_solver(), self.directory),
+                         3)
+
+    def test_write_error(self):
+        """
+        A checkpoint that can't be written is reported, and saving and
+        closing still return
+        """
+        solver = self.make_solver()
+        checkpoints = Checkpointer(solver, self.directory, interval=1e9)
+        solver.register_state('unsaveable',
+                              np.array([lambda: None], dtype=object))
+        checkpoints.save()
+        checkpoints.close()
+        self.assertIsNotNone(checkpoints.error)
+        self.assertNotIsInstance(checkpoints.error, OSError)
+        self.assertEqual(checkpoints.written, 0)
+
+    def test_memmap(self):
+        """
+        Memory mapped fields live in files and reopen with their values
+        """
+        allocator = MemmapAllocator(self.directory)
+        solver = self.make_solver(allocator=allocator)
+        solver.run(5)
+        allocator.flush()
+        self.assertTrue(os.path.exists(os.path.join(self.directory,
+                                                    'ez.npy')))
+        reopened = MemmapAllocator(self.directory, reuse=True)
+        field = reopened('ez', solver.shape, solver.precision.field)
+        self.assertTrue(np.array_equal(field, solver.fields['ez']))
+
+
+class SlowSnapshotWriter(SnapshotWriter):
+    """
+    A snapshot writer on a very slow disk
+    """
+    def _write_chunk(self):
+        time.sleep(0.05)
+        super()._write_chunk()
+
+
+class TestSnapshots(unittest.TestCase):
+    """
+    Tests for fdtd.snapshots
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_frames(self):
+        """
+        Decimated frames are written in chunks, in order
+        """
+        for compress in [False, True]:
+            directory = os.path.join(self.directory, str(compress))
+            solver = YeeSolver2D(dgp.Params(make_answers()))
+            center_pulse(solver)
+            writer = SnapshotWriter(solver, directory, fields=['ez', 'hy'],
+                                    every=3, stride=2, chunk=4,
+                                    compress=compress)
+            expected = []
+            solver.add_hook('post_step', lambda solver: expected.append(
+                solver.fields['hy'][::2, ::2].copy()))
+            solver.run(20)
+            writer.close()
+
+            self.assertEqual(writer.written, 6)
+            self.assertEqual(len(load_index(directory)), 2)
+            steps, frames = read_frames(directory, 'hy')
+            self.assertEqual(list(steps), [3, 6, 9, 12, 15, 18])
+            self.assertEqual(frames.shape[1:], writer.frame_shape)
+            for (step, frame) in zip(steps, frames):
+                self.assertTrue(np.array_equal(frame, expected[step - 1]))
+
+    def test_drop(self):
+        """
+        Frames the writer cannot keep up with are dropped and counted
+        """
+        solver = YeeSolver2D(dgp.Params(make_answers()))
+        writer = SlowSnapshotWriter(solver, self.directory, ring=1,
+                                    chunk=1, policy='drop')
+        solver.run(20)
+        writer.close()
+        self.assertGreater(writer.dropped, 0)
+        self.assertEqual(writer.written + writer.dropped, 20)
+        with self.assertRaises(ValueError):
+            SnapshotWriter(solver, self.directory, policy='wait')
+
+    def test_write_error(self):
+        """
+        Frames that can't be gathered or written are reported, and a
+        blocking run still finishes
+        """
+        solver = YeeSolver2D(dgp.Params(make_answers()))
+        writer = SnapshotWriter(solver, self.directory, ring=2, chunk=2)
+        with mock.patch('numpy.save', side_effect=ValueError('no room')):
+            solver.run(6)
+            writer.close()
+        self.assertIsInstance(writer.error, ValueError)
+        self.assertEqual(writer.written, 0)
+
+        solver = YeeSolver2D(dgp.Params(make_answers()))
+        writer = SnapshotWriter(solver, self.directory, ring=2, chunk=2)
+        # Frames no longer fit the chunk, so gathering them fails
+        # pylint: disable=protected-access
+        writer._chunk = writer._chunk[:, :, :1]
+        solver.run(6)
+        writer.close()
+        self.assertIsInstance(writer.error, ValueError)
+
+
+class TestProbes(unittest.TestCase):
+    """
+    Tests for fdtd.probes
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cells(self):
+        """
+        Params coordinates land on the matching solver cells
+        """
+        params = dgp.Params(make_answers())
+        solver = YeeSolver2D(params)
+        (x_arr, y_arr) = (params.get_x_arr(), params.get_y_arr())
+        width = params.pmlwidth
+        self.assertEqual(solver.cell(x_arr[3], y_arr[5]),
+                         (5 + width, 3 + width))
+        self.assertEqual(solver.cell(x_arr[3] + 0.4 * params.del_x,
+                                     y_arr[5]), (5 + width, 3 + width))
+        with self.assertRaises(ValueError):
+            solver.cell(x_arr[-1] + 2 * params.del_x, y_arr[0])
+
+    def test_record(self):
+        """
+        Probes record exactly the field values at their cells
+        """
+        params = dgp.Params(make_answers())
+        (x_arr, y_arr) = (params.get_x_arr(), params.get_y_arr())
+        solver = YeeSolver2D(params)
+        center_pulse(solver)
+        path = os.path.join(self.directory, 'probes.npy')
+        probes = ProbeSet(solver, steps=10, path=path, flush_every=4)
+        probes.add_point('point', x_arr[10], y_arr[12])
+        probes.add_line('line', (x_arr[2], y_arr[4]), (x_arr[8], y_arr[4]),
+                        field='hy')
+        probes.add_box('box', (x_arr[5], y_arr[6]), (x_arr[3], y_arr[9]))
+        probes.attach()
+        with self.assertRaises(RuntimeError):
+            probes.add_point('late', x_arr[0], y_arr[0])
+
+        expected = {'point': [], 'line': [], 'box': []}
+
+        def record(solver):
+            """ What the probes should see """
+            (row, col) = solver.cell(x_arr[10], y_arr[12])
+            expected['point'].append(solver.fields['ez'][row, col])
+            (row, col) = solver.cell(x_arr[2], y_arr[4])
+            expected['line'].append(
+                solver.fields['hy'][row, col:col + 7].copy())
+            (row, col) = solver.cell(x_arr[3], y_arr[6])
+            expected['box'].append(
+                solver.fields['ez'][row:row + 4, col:col + 3].copy())
+
+        solver.add_hook('post_step', record)
+        solver.run(12)
+        self.assertEqual(probes.count, 10)
+        self.assertEqual(probes.trace('line').shape, (10, 7))
+        self.assertEqual(probes.trace('box').shape, (10, 4, 3))
+        for (name, values) in expected.items():
+            self.assertTrue(np.array_equal(probes.trace(name),
+                                           np.array(values[:10])))
+        self.assertTrue(np.allclose(np.diff(probes.times()),
+                                    solver.setup.dt))
+
+        probes.flush()
+        saved = np.load(path)
+        self.assertTrue(np.array_equal(saved, probes.data))
+
+
+class TestDFT(unittest.TestCase):
+    """
+    Tests for fdtd.dft
+    """
+    def test_matches_direct(self):
+        """
+        The running sums equal a transform of the recorded history
+        """
+        params = dgp.Params(make_answers())
+        (x_arr, y_arr) = (params.get_x_arr(), params.get_y_arr())
+        solver = YeeSolver2D(params)
+        CPML(solver)
+        center_pulse(solver)
+        dt = solver.setup.dt
+        frequencies = np.array([0.05, 0.1, 0.2]) / dt
+        monitors = [DFTMonitor(solver, frequencies, field=field,
+                               corner=(x_arr[2], y_arr[3]),
+                               opposite=(x_arr[6], y_arr[5]),
+                               every=2, reseed=7)
+                    for field in ['ez', 'hx']]
+        (row, col) = solver.cell(x_arr[2], y_arr[3])
+        history = {'ez': [], 'hx': []}
+
+        def record(solver):
+            """ Keep the whole history of the region """
+            for (name, samples) in history.items():
+                samples.append(
+                    solver.fields[name][row:row + 3, col:col + 5].copy())
+
+        solver.add_hook('post_step', record)
+        solver.run(60)
+
+        steps = np.arange(1, 61)
+        for (monitor, offset) in zip(monitors, [0.0, 0.5]):
+            samples = np.array(history[monitor.field])[1::2]
+            times = (steps[1::2] - offset) * dt
+            phase = np.exp(-2j * np.pi * np.outer(frequencies, times))
+            direct = np.einsum('ft,tij->fij', phase, samples) * 2 * dt
+            spectrum = monitor.spectrum()
+            self.assertEqual(spectrum.shape, (3, 3, 5))
+            self.assertTrue(np.allclose(spectrum, direct, rtol=1e-10,
+                                        atol=0))
+        self.assertIn('dft/1', solver.state)
+
+
+class TestSources(unittest.TestCase):
+    """
+    Tests for fdtd.sources
+    """
+    def test_waveforms(self):
+        """
+        The waveforms have their peaks and switch-on where expected
+        """
+        times = np.linspace(0, 10, 1001)
+        pulse = gaussian(1.0)(times)
+        self.assertAlmostEqual(times[np.argmax(pulse)], 4.0)
+        wavelet = ricker(0.5)(times)
+        self.assertAlmostEqual(times[np.argmax(wavelet)], 3.0)
+        self.assertAlmostEqual(wavelet.sum() * 0.01, 0.0, places=6)
+        wave = continuous(1.0, ramp=2.0)(times)
+        self.assertEqual(wave[0], 0.0)
+        self.assertAlmostEqual(np.abs(wave[500:]).max(), 1.0, places=3)
+
+    def test_injection(self):
+        """
+        The tabulated sources add the same as evaluating each source
+        every step
+        """
+        params = dgp.Params(make_answers())
+        (x_arr, y_arr) = (params.get_x_arr(), params.get_y_arr())
+        expected = YeeSolver2D(params)
+        solver = YeeSolver2D(params)
+        dt = solver.setup.dt
+        pulse = gaussian(5 * dt)
+        wave = continuous(0.05 / dt)
+
+        sources = SourceSet(solver, steps=25)
+        sources.add_point(x_arr[10], y_arr[10], pulse, amplitude=2.0)
+        sources.add_point(x_arr[10], y_arr[10], wave)
+        sources.add_line((x_arr[3], y_arr[4]), (x_arr[3], y_arr[9]), wave,
+                         field='hy')
+        sources.add_region((x_arr[15], y_arr[2]), (x_arr[18], y_arr[5]),
+                           pulse, profile=lambda x, y: x - y)
+        sources.attach()
+        with self.assertRaises(RuntimeError):
+            sources.add_point(x_arr[0], y_arr[0], pulse)
+
+        (row, col) = expected.cell(x_arr[10], y_arr[10])
+        (line_row, line_col) = expected.cell(x_arr[3], y_arr[4])
+        (box_row, box_col) = expected.cell(x_arr[15], y_arr[2])
+        profile = (x_arr[np.newaxis, 15:19] - y_arr[2:6, np.newaxis])
+
+        def drive_h(solver):
+            """ The line source, one call at a time """
+            if solver.n < 25:
+                time = np.array([(solver.n + 0.5) * dt])
+                solver.fields['hy'][line_row:line_row + 6, line_col] += \
+                    wave(time)[0]
+
+        def drive_e(solver):
+            """ The other sources, one call at a time """
+            if solver.n < 25:
+                time = np.array([(solver.n + 1) * dt])
+                solver.fields['ez'][row, col] += (2 * pulse(time)[0] +
+                                                  wave(time)[0])
+                solver.fields['ez'][box_row:box_row + 4,
+                                    box_col:box_col + 4] += \
+                    profile * pulse(time)[0]
+
+        expected.add_hook('post_h', drive_h)
+        expected.add_hook('post_e', drive_e)
+        expected.run(30)
+        solver.run(30)
+        for name in solver.fields:
+            scale = np.abs(expected.fields[name]).max()
+            self.assertGreater(scale, 0)
+            self.assertTrue(np.allclose(solver.fields[name],
+                                        expected.fields[name],
+                                        rtol=0, atol=1e-12 * scale))
+
+
+def tfsf_leak(angle, scatterer=False, steps=300):
+    """
+    Illuminate an empty grid with absorbing layers, or one with a
+    metal cell in the middle, and return the largest field inside and
+    outside the total field region
+    """
+    params = dgp.Params(make_answers(max_gp=60, layers=10))
+    solver = YeeSolver2D(params)
+    CPML(solver)
+    (x_arr, y_arr) = (params.get_x_arr(), params.get_y_arr())
+    dt = solver.setup.dt
+    tfsf = TFSF(solver, (x_arr[15], y_arr[12]), (x_arr[-15], y_arr[-12]),
+                gaussian(15 * dt), angle=angle, steps=steps)
+    if scatterer:
+        (row, col) = center_pulse(solver)
+        for name in ['ce_x', 'ce_y']:
+            solver.coefficients[name][row, col] = 0.0
+    (row0, row1) = tfsf.rows
+    (col0, col1) = tfsf.cols
+    total = np.zeros(solver.shape, bool)
+    total[row0:row1 + 1, col0:col1 + 1] = True
+    width = solver.setup.pmlwidth
+    outside = np.zeros(solver.shape, bool)
+    outside[width:-width, width:-width] = True
+    outside[row0 - 1:row1 + 2, col0 - 1:col1 + 2] = False
+    (inner, outer) = (0.0, 0.0)
+    for _ in range(steps):
+        solver.step()
+        ez = np.abs(solver.fields['ez'])
+        inner = max(inner, ez[total].max())
+        outer = max(outer, ez[outside].max())
+    return (inner, outer)
+
+
+class TestTFSF(unittest.TestCase):
+    """
+    Tests for fdtd.tfsf
+    """
+    def test_empty(self):
+        """
+        With nothing to scatter, the wave stays inside the region:
+        exactly along the axes, up to the line's dispersion otherwise
+        """
+        for (angle, tolerance) in [(0.0, 1e-12), (np.pi / 2, 1e-12),
+                                   (2.5, 5e-3)]:
+            (inner, outer) = tfsf_leak(angle)
+            self.assertGreater(inner, 0.9)
+            self.assertLess(outer / inner, tolerance)
+
+    def test_scatterer(self):
+        """
+        A scatterer in the region sends a wave out of it
+        """
+        (inner, outer) = tfsf_leak(0.5, scatterer=True)
+        self.assertGreater(outer / inner, 2e-2)
+
+    def test_checks(self):
+        """
+        Only TM solvers, and only regions clear of the absorbing layers
+        """
+        params = dgp.Params(make_answers())
+        (x_arr, y_arr) = (params.get_x_arr(), params.get_y_arr())
+        pulse = gaussian(1e-15)
+        with self.assertRaises(ValueError):
+            TFSF(YeeSolver2D(params, mode='TE'), (x_arr[5], y_arr[5]),
+                 (x_arr[10], y_arr[10]), pulse)
+        with self.assertRaises(ValueError):
+            TFSF(YeeSolver2D(params), (x_arr[0], y_arr[5]),
+                 (x_arr[10], y_arr[10]), pulse)
+        solver = YeeSolver2D(params)
+        tfsf = TFSF(solver, (x_arr[5], y_arr[5]), (x_arr[10], y_arr[10]),
+                    pulse)
+        # Four edges of E and four of H, whatever the area
+        self.assertEqual(tfsf.perimeter, 8 * 6)
+        self.assertIn('tfsf/line_e', solver.state)
+
+
+if __name__ == '__main__':
+    unittest.main()
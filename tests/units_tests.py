@@ -3,14 +3,18 @@ Unit tests for units.py module
 """
 # pylint: disable=pointless-statement
 
-import fdtd.units
+import phys_util
+import phys_util.units
 
+import copy
+import pickle
 import unittest
+from fractions import Fraction
 
 import numpy as np
 
-U = fdtd.units
-Unit = fdtd.units.Unit
+U = phys_util.units
+Unit = phys_util.units.Unit
 
 
 class TestUnitOperators(unittest.TestCase):
@@ -109,6 +113,18 @@ class TestUnitOperators(unittest.TestCase):
         with self.assertRaises(ArithmeticError):
             self.meter ** 2.2
 
+        self.assertEqual(self.meter ** -1, self.imeter)
+        self.assertEqual(self.meter ** 0, 1)
+        self.assertEqual((4 * self.meter2) ** 0.5, 2 * self.meter)
+        self.assertEqual(self.meter2 ** Fraction(3, 2), self.meter ** 3)
+        self.assertEqual((self.meter2 ** Fraction(1, 3)) ** 3, self.meter2)
+        with self.assertRaises(ArithmeticError):
+            self.meter ** (1 / 3)
+
+        areas = self.meter2 * np.array([4., 9.])
+        self.assertEqual((areas ** 0.5)[1], 3 * self.meter)
+        self.assertEqual((areas ** -1)[0], 0.25 * self.meter2 ** -1)
+
     def test_str(self):
         """
         Test str() on units
@@ -193,6 +209,338 @@ class TestUnitOperators(unittest.TestCase):
         self.assertEqual(matr_mult[1][0], 3 * self.meter)
         self.assertEqual(matr_mult[1][1], 4 * self.meter)
 
+    def test_quantity_array(self):
+        """
+        Unit * ndarray gives a single-buffer QuantityArray
+        """
+        arr = np.arange(1, 7, dtype=np.float64).reshape(2, 3)
+        lengths = self.meter * arr
+        self.assertIsInstance(lengths, U.QuantityArray)
+        self.assertEqual(lengths.shape, (2, 3))
+        self.assertEqual(lengths.dtype, np.float64)
+        self.assertIsInstance(arr * self.meter, U.QuantityArray)
+
+        # Slices share the buffer and keep the unit
+        row = lengths[1]
+        self.assertIsInstance(row, U.QuantityArray)
+        self.assertEqual(row[2], 6 * self.meter)
+
+        # Cancelling units gives back a plain ndarray
+        ratio = lengths / self.meter
+        self.assertIsInstance(ratio, np.ndarray)
+        self.assertTrue(np.array_equal(ratio, arr))
+
+        area = lengths * lengths
+        self.assertEqual(area[1, 1], 25 * self.meter2)
+        self.assertTrue(np.array_equal((area / lengths) / self.meter, arr))
+
+        # Broadcasting against a unit-carrying row
+        offset = lengths + self.meter * np.array([1., 1., 1.])
+        self.assertTrue(np.array_equal(offset / self.meter, arr + 1))
+
+        with self.assertRaises(ArithmeticError):
+            lengths + self.second * arr
+        with self.assertRaises(ArithmeticError):
+            lengths + arr
+
+        # Comparisons are elementwise, like ndarray's
+        self.assertTrue(np.all(lengths == self.meter * arr))
+        self.assertTrue(np.array_equal(lengths != 2 * self.meter, arr != 2))
+        with self.assertRaises(ArithmeticError):
+            lengths == self.second * arr
+        with self.assertRaises(TypeError):
+            hash(lengths)
+
+    def test_dimension_interning(self):
+        """
+        Dimensions are interned exponent vectors
+        """
+        self.assertIs(self.meter.dimension, U.Dimension((0, 1, 0, 0)))
+        self.assertIs((self.meter * self.meter).dimension,
+                      self.meter2.dimension)
+        self.assertIs((self.meter2 / self.meter).dimension,
+                      self.meter.dimension)
+        self.assertIs(U.Dimension((0, 2, 0, 0)), self.meter2.dimension)
+        self.assertIs(self.meter.dimension ** 2, self.meter2.dimension)
+        self.assertIs(self.meter.dimension / self.meter.dimension,
+                      U.DIMENSIONLESS)
+        self.assertEqual(self.meter2.category, {(2, U.UnitType.LENGTH)})
+
+    def test_immutable(self):
+        """
+        Units are slotted and can't be modified in place
+        """
+        with self.assertRaises(AttributeError):
+            self.meter.value = 2
+        with self.assertRaises(AttributeError):
+            self.meter.extra = 2
+        self.assertEqual(hash(2 * self.meter), hash(self.meter * 2))
+        self.assertEqual((self.kgram * self.meter).name, 'kilogram * meter')
+
+        # Pickling and copying rebuild the unit instead of setting slots
+        length = 3 * self.meter
+        for clone in [pickle.loads(pickle.dumps(length)), copy.copy(length),
+                      copy.deepcopy({'x_dim': length})['x_dim']]:
+            self.assertEqual(clone, length)
+            self.assertEqual(clone.name, length.name)
+
+    def test_numpy_scalars(self):
+        """
+        numpy scalars multiply like Python numbers
+        """
+        # pylint: disable=no-member
+        self.assertEqual(np.float32(2) * self.meter, 2 * self.meter)
+        self.assertEqual(self.meter * np.int64(3), 3 * self.meter)
+        self.assertEqual(self.meter / np.float64(2), 0.5 * self.meter)
+
+    def test_ufuncs(self):
+        """
+        numpy ufuncs propagate dimensions
+        """
+        arr = np.array([[1., 4.], [9., 16.]])
+        area = self.meter2 * arr
+        lengths = np.sqrt(area)
+        self.assertIsInstance(lengths, U.QuantityArray)
+        self.assertIs(lengths.dimension, self.meter.dimension)
+        self.assertTrue(np.array_equal(lengths / self.meter, np.sqrt(arr)))
+        self.assertEqual(np.sqrt(4 * self.meter2), 2 * self.meter)
+        self.assertEqual(np.abs(-self.meter), self.meter)
+
+        self.assertIs(np.add(area, area).dimension, area.dimension)
+        with self.assertRaises(ArithmeticError):
+            np.add(area, lengths)
+        with self.assertRaises(ArithmeticError):
+            np.exp(lengths)
+
+        self.assertTrue(np.all(lengths < 5 * self.meter))
+        with self.assertRaises(ArithmeticError):
+            lengths < 5 * self.second
+
+        self.assertIs(np.power(lengths, 3).dimension,
+                      (self.meter ** 3).dimension)
+
+        out = self.meter * np.zeros((2, 2))
+        np.multiply(lengths, 2, out=out)
+        self.assertEqual(out[1, 1], 8 * self.meter)
+        with self.assertRaises(ArithmeticError):
+            np.multiply(lengths, lengths, out=out)
+
+    def test_array_functions(self):
+        """
+        numpy functions on QuantityArrays keep their units
+        """
+        lengths = self.meter * np.array([1., 2., 3., 6.])
+        self.assertEqual(np.sum(lengths), 12 * self.meter)
+        self.assertEqual(np.mean(lengths), 3 * self.meter)
+        self.assertEqual(np.max(lengths), 6 * self.meter)
+        self.assertEqual(lengths.value.sum(), 12)
+        self.assertIs(np.var(lengths).dimension, self.meter2.dimension)
+
+        ones = np.ones_like(lengths)
+        self.assertIsInstance(ones, U.QuantityArray)
+        self.assertEqual(ones[0], self.meter)
+
+        joined = np.concatenate([lengths, lengths])
+        self.assertEqual(joined.shape, (8,))
+        with self.assertRaises(ArithmeticError):
+            np.concatenate([lengths, self.second * np.ones(2)])
+        with self.assertRaises(ArithmeticError):
+            np.concatenate([lengths, np.ones(2)])
+
+        self.assertEqual(np.shape(lengths), (4,))
+        self.assertTrue(np.allclose(lengths, lengths * 1.0))
+
+    def test_bare_operands(self):
+        """
+        Plain arrays compared or mixed with quantities are dimensionless
+        """
+        lengths = self.meter * np.array([1., 2., 3., 6.])
+        plain = np.array([1., 2., 3., 6.])
+        for func in [np.allclose, np.isclose, np.array_equal]:
+            with self.assertRaises(ArithmeticError):
+                func(lengths, plain)
+        with self.assertRaises(ArithmeticError):
+            np.clip(lengths, 1, 3 * self.meter)
+        with self.assertRaises(ArithmeticError):
+            np.where(plain > 2, lengths, plain)
+        clipped = np.clip(lengths, 0, 3 * self.meter)
+        self.assertEqual(clipped[3], 3 * self.meter)
+        self.assertIs(np.where(plain > 2, lengths, 0).dimension,
+                      self.meter.dimension)
+
+    def test_gradient(self):
+        """
+        np.gradient divides by the units of the spacing
+        """
+        heights = self.meter * np.array([[1., 2., 4.], [3., 5., 9.]])
+        (d_rows, d_cols) = np.gradient(heights)
+        self.assertIs(d_rows.dimension, self.meter.dimension)
+        self.assertEqual(d_cols[0, 0], self.meter)
+        slope = np.gradient(heights[0], 2 * self.meter)
+        self.assertIsInstance(slope, np.ndarray)
+        self.assertTrue(np.array_equal(slope, [0.5, 0.75, 1.]))
+        speed = np.gradient(heights[0], self.second * np.array([0., 1., 2.]))
+        self.assertIs(speed.dimension, (self.meter / self.second).dimension)
+
+
+class TestProductionMode(unittest.TestCase):
+    """
+    Unit tests for reading the production mode setting
+    """
+
+    def test_parse(self):
+        """
+        Only explicit settings turn production mode on
+        """
+        parse = phys_util.parse_production_mode
+        for value in ['1', 'true', 'Yes', ' ON ']:
+            self.assertTrue(parse(value))
+        for value in [None, '', '0', 'false', 'No', 'off']:
+            self.assertFalse(parse(value))
+        for value in ['2', 'enabled', 'flase']:
+            with self.assertWarns(UserWarning):
+                self.assertFalse(parse(value))
+
+
+@unittest.skipIf(U.PRODUCTION_MODE, 'units are not checked')
+class TestCheckDimensions(unittest.TestCase):
+    """
+    Unit tests for the check_dimensions decorator
+    """
+
+    def test_check(self):
+        """
+        Arguments and return values are checked once per signature
+        """
+        counter = U.DimensionCheckCounter()
+
+        @U.check_dimensions(U.meter, U.second, returns=U.meter / U.second,
+                            counter=counter)
+        def speed(distance, duration):
+            """ A speed """
+            return distance / duration
+
+        self.assertEqual(speed.__name__, 'speed')
+        self.assertEqual(speed(4 * U.meter, 2 * U.second),
+                         2 * U.meter / U.second)
+        speed(1 * U.meter, 1 * U.second)
+        self.assertEqual((counter.calls, counter.misses), (2, 1))
+        self.assertGreaterEqual(counter.mean_overhead(), 0)
+
+        with self.assertRaises(ArithmeticError):
+            speed(4 * U.second, 2 * U.second)
+        with self.assertRaises(ArithmeticError):
+            speed(4 * U.meter, duration=2 * U.meter)
+        self.assertEqual(counter.misses, 3)
+
+    def test_keywords(self):
+        """
+        Arguments are checked by parameter, however they are passed
+        """
+        @U.check_dimensions(U.meter, U.second)
+        def elapsed(distance, duration):
+            """ Returns the duration, so only the arguments are checked """
+            return duration
+
+        self.assertEqual(elapsed(duration=2 * U.second, distance=U.meter),
+                         2 * U.second)
+        for _ in range(2):
+            with self.assertRaises(ArithmeticError):
+                elapsed(2 * U.meter, duration=3 * U.meter)
+            with self.assertRaises(ArithmeticError):
+                elapsed(distance=5 * U.kilogram, duration=3 * U.second)
+
+        @U.check_dimensions(U.meter)
+        def total(*lengths):
+            """ Extra positional specs apply to *args """
+            return sum(lengths[1:], lengths[0])
+
+        self.assertEqual(total(U.meter, 2 * U.meter), 3 * U.meter)
+        with self.assertRaises(ArithmeticError):
+            total(U.second)
+
+    def test_return(self):
+        """
+        A wrong return dimension is caught, and never cached as valid
+        """
+        @U.check_dimensions(U.meter, returns=U.second)
+        def wrong(distance):
+            """ Not a time """
+            return distance
+
+        for _ in range(2):
+            with self.assertRaises(ArithmeticError):
+                wrong(U.meter)
+
+        @U.check_dimensions(U.meter, scale=1)
+        def scaled(distance, scale=1):
+            """ A dimensionless keyword """
+            return scale * distance
+
+        self.assertEqual(scaled(U.meter, scale=2), 2 * U.meter)
+        with self.assertRaises(ArithmeticError):
+            scaled(U.meter, scale=U.meter)
+
+
+class TestParseDimensions(unittest.TestCase):
+    """
+    Unit tests for parsing values with units from strings
+    """
+
+    def assert_close(self, first, second):
+        """ Compare two quantities to a relative tolerance """
+        ratio = first / second
+        self.assertFalse(isinstance(ratio, Unit))
+        self.assertAlmostEqual(ratio, 1)
+
+    def test_expressions(self):
+        """
+        Numbers with prefixed and compound units
+        """
+        parse = U.parse_dimensions
+        self.assert_close(parse('1.55 um'), 1.55e-6 * U.meter)
+        self.assert_close(parse('1.55 \u00b5m'), 1.55e-6 * U.meter)
+        self.assert_close(parse('5 micrometer'), 5e-6 * U.meter)
+        self.assert_close(parse('3e8 m/s'), 3e8 * U.meter / U.second)
+        self.assert_close(parse('2 fs'), 2e-15 * U.second)
+        self.assert_close(parse('10 nm^2'), 1e-17 * U.meter * U.meter)
+        self.assert_close(parse('1 kg*m/s^2'), U.newton)
+        self.assert_close(parse('2 m s^-1'), 2 * U.meter / U.second)
+        self.assert_close(parse('2 inch'), 2 * U.inch)
+        self.assert_close(parse('1 /s'), 1 / U.second)
+        self.assertEqual(parse('5'), 5)
+        self.assert_close(parse('5', default_unit=U.meter), 5 * U.meter)
+
+    def test_names(self):
+        """
+        Spelled-out names take any case and plurals; symbols don't
+        """
+        parse = U.parse_dimensions
+        self.assert_close(parse('5 meters'), 5 * U.meter)
+        self.assert_close(parse('2 inches'), 2 * U.inch)
+        self.assert_close(parse('5 Kilometer'), 5000 * U.meter)
+        self.assert_close(parse('3 Feet'), 3 * U.foot)
+        self.assert_close(parse('2 Nanoseconds'), 2e-9 * U.second)
+        self.assert_close(parse('1 Mm') / parse('1 mm'), 1e9)
+        with self.assertRaises(ValueError):
+            parse('1 MM')
+
+    def test_errors(self):
+        """
+        Malformed strings and unknown units raise ValueError
+        """
+        for text in ['', 'm', '5 mters', '5 m^', '5 m//s', '5 m 3', '5 *']:
+            with self.assertRaises(ValueError):
+                U.parse_dimensions(text)
+
+    def test_metric_prefix(self):
+        """
+        Spelled out metric prefixes
+        """
+        self.assertEqual(U.convert_metric_prefix('Kilo'), 1000)
+        self.assertEqual(U.convert_metric_prefix('nano'), 1e-9)
+        self.assertEqual(U.convert_metric_prefix('bogus'), 1)
+
 
 if __name__ == '__main__':
     unittest.main()
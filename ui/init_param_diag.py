@@ -155,16 +155,20 @@ class Diag(qtwidg.QWidget):
             if isinstance(item, bool) and item is False:
                 return
 
-        x_dim = u.parse_dimensions(self.input_boxes['x_dim'].text())
-        y_dim = u.parse_dimensions(self.input_boxes['y_dim'].text())
-
-        if x_dim is None:
-            qtwidg.QMessageBox.information(self, 'Invalid Field',
-                                           'Invalid units in x dimension')
+        # Bare numbers are in micrometers, as the labels say
+        def parse_length(text):
+            """ Parse a length, defaulting to micrometers """
+            return u.parse_dimensions(text, default_unit=dgp.MICROMETER)
+
+        x_dim = self._validate_input(self.input_boxes['x_dim'].text(),
+                                     parse_length,
+                                     'Invalid units in x dimension')
+        if isinstance(x_dim, bool) and x_dim is False:
             return
-        if y_dim is None:
-            qtwidg.QMessageBox.information(self, 'Invalid Field',
-                                           'Invalid units in y dimension')
+        y_dim = self._validate_input(self.input_boxes['y_dim'].text(),
+                                     parse_length,
+                                     'Invalid units in y dimension')
+        if isinstance(y_dim, bool) and y_dim is False:
             return
         self.responses = {'max_gp': max_gp,
                           'eps': ep_v,
@@ -188,9 +192,8 @@ class Diag(qtwidg.QWidget):
             epsilon = params.ep_v
             mu = params.mu_v
 
-            unitless_eps = np.array(epsilon / c.epsilon0, dtype=np.float64)
-            unitless_mu = np.array(mu / c.mu0, dtype=np.float64)
-            array = np.abs(np.sqrt(unitless_eps * unitless_mu))
+            # n = c * sqrt(epsilon * mu); the units cancel to a plain array
+            array = np.abs(np.sqrt(epsilon * mu) * c.c)
             extent = [x_arr[0], x_arr[-1], y_arr[0], y_arr[-1]]
 
             self.plot_win = main_win.ApplicationWindow(array=array,